@@ -0,0 +1,62 @@
+# Run benchmark suites, optionally saving results as JSON and comparing them with an earlier run
+#
+#   python -m benchmarks --json results.json
+#   python -m benchmarks --quick --compare results.json --threshold 0.2 flush handles
+
+import argparse
+import datetime
+import importlib
+import json
+import platform
+import sys
+
+from benchmarks.common import compare, print_results
+
+# Suite -> arguments of its run() making it fast enough for CI
+SUITES = {
+    'handles': {'number': 10000},
+    'monitored_task': {'number': 10000},
+    'threads': {'number': 2000, 'thread_counts': (1, 4, 16)},
+    'bulk': {'number': 5},
+    'compression': {'number': 3},
+    'flush': {'series_counts': (100, 1000), 'latency': 0.005},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run cloudwatch-metrics-client benchmarks')
+    parser.add_argument('suites', nargs='*', choices=[[]] + list(SUITES), help='suites to run, all by default')
+    parser.add_argument('--quick', action='store_true', help='fewer iterations')
+    parser.add_argument('--json', help='file to write results to')
+    parser.add_argument('--compare', help='results file of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative change considered a regression')
+    args = parser.parse_args()
+
+    results = {}
+    for suite in args.suites or SUITES:
+        print('# {}'.format(suite))
+        module = importlib.import_module('benchmarks.bench_{}'.format(suite))
+        results[suite] = module.run(**SUITES[suite]) if args.quick else module.run()
+        print_results(results[suite])
+
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump({
+                'timestamp': datetime.datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'quick': args.quick,
+                'results': results
+            }, output, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(json.load(baseline)['results'], results, args.threshold)
+        for suite, name, key, old, new in regressions:
+            print('REGRESSION {}: {} {} {:,.1f} -> {:,.1f}'.format(suite, name, key, old, new))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+# Recording 10000 values of one series: per-sample calls vs bulk methods, reported per sample
+#
+#   python -m benchmarks.bench_bulk
+
+import random
+
+from benchmarks.common import measure, print_results
+from cloudwatch_metrics_client.cloudwatch import CloudWatchSyncMetricReporter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DIMENSIONS = {'Service': 'api', 'Operation': 'GetItem', 'Region': 'eu-west-1'}
+SAMPLES = 10000
+
+
+def per_sample(result) -> dict:
+    ns_per_op = result['ns_per_op'] / SAMPLES
+    return {'ns_per_op': ns_per_op, 'ops_per_sec': 1e9 / ns_per_op}
+
+
+def run(number=20) -> dict:
+    results = {}
+    rng = random.Random(0)
+    # Latencies with millisecond precision, so values repeat as they do in practice
+    values = [round(rng.lognormvariate(3, 0.5), 1) for _ in range(SAMPLES)]
+    samples = [('latency', DIMENSIONS, value) for value in values]
+
+    def put_each():
+        for value in values:
+            reporter.put_metric(MetricName='latency', Dimensions=DIMENSIONS, Value=value)
+
+    def put_statistic_each():
+        for value in values:
+            reporter.put_statistic('latency', DIMENSIONS, value)
+
+    reporter = CloudWatchSyncMetricReporter(report_interval=None)
+    results['put_metric per value'] = per_sample(measure(put_each, number))
+    results['put_metric_values list'] = per_sample(measure(
+        lambda: reporter.put_metric_values('latency', values, DIMENSIONS), number))
+    results['put_many'] = per_sample(measure(lambda: reporter.put_many(metrics=samples), number))
+    results['put_statistic per value'] = per_sample(measure(put_statistic_each, number))
+    results['put_statistic_values list'] = per_sample(measure(
+        lambda: reporter.put_statistic_values('latency', DIMENSIONS, values), number))
+    if numpy is not None:
+        array = numpy.array(values)
+        results['put_metric_values numpy'] = per_sample(measure(
+            lambda: reporter.put_metric_values('latency', array, DIMENSIONS), number))
+        results['put_statistic_values numpy'] = per_sample(measure(
+            lambda: reporter.put_statistic_values('latency', DIMENSIONS, array), number))
+    return results
+
+
+if __name__ == '__main__':
+    print_results(run())
@@ -0,0 +1,67 @@
+# Request body size and compression time of realistic PutMetricData batches
+#
+#   python -m benchmarks.bench_compression
+
+import datetime
+import gzip
+import random
+from urllib.parse import urlencode
+
+from benchmarks.common import measure, print_results
+from cloudwatch_metrics_client.aiocloudwatch import CloudWatchAsyncMetricReporter
+from cloudwatch_metrics_client.compression import compress_body
+from cloudwatch_metrics_client.quantization import SignificantDigitsQuantizer
+
+
+def batches(num_series, quantizer=None) -> list:
+    # Latencies of a service with a few endpoints and status codes, as a reporter would send them
+    reporter = CloudWatchAsyncMetricReporter(report_interval=None, quantizer=quantizer, namespace='Benchmark')
+    rng = random.Random(0)
+    for n in range(num_series):
+        dimensions = {'Service': 'checkout', 'Endpoint': '/api/v1/endpoint-{}'.format(n % 50),
+                      'StatusCode': str(rng.choice([200, 201, 404, 500])), 'Host': 'host-{}'.format(n // 50)}
+        series = reporter._get_metric_series('Latency', dimensions, 'Milliseconds')
+        for _ in range(200):
+            series.add_value(round(rng.lognormvariate(3, 0.5), 3))
+    return reporter._batches(reporter._calculate_metrics(reporter.metrics))
+
+
+def query_body(batch) -> dict:
+    # Request dict body as botocore serializes PutMetricData with query protocol
+    body = {'Action': 'PutMetricData', 'Version': '2010-08-01', 'Namespace': 'Benchmark'}
+
+    def flatten(prefix, value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                flatten('{}.{}'.format(prefix, key), item)
+        elif isinstance(value, list):
+            for n, item in enumerate(value, 1):
+                flatten('{}.member.{}'.format(prefix, n), item)
+        elif isinstance(value, datetime.datetime):
+            body[prefix] = value.strftime('%Y-%m-%dT%H:%M:%SZ')
+        else:
+            body[prefix] = str(value)
+
+    flatten('MetricData', batch)
+    return body
+
+
+def run(number=20) -> dict:
+    results = {}
+    for label, quantizer in (('raw values', None), ('2 significant digits', SignificantDigitsQuantizer(2))):
+        body = query_body(batches(200, quantizer)[0])
+        size = len(urlencode(list(body.items())).encode('utf-8'))
+        for level in (1, 6):
+            compressed = len(gzip.compress(urlencode(list(body.items())).encode('utf-8'), compresslevel=level))
+            name = '{}, gzip level {}'.format(label, level)
+            results[name] = measure(lambda: compress_body({'body': dict(body)}, min_size=0, level=level), number)
+            results[name].update(bytes=size, compressed_bytes=compressed, saved=1 - compressed / size)
+    return results
+
+
+if __name__ == '__main__':
+    results = run()
+    print_results(results)
+    for name, result in results.items():
+        print('{:<48} {:>10,} B -> {:>10,} B ({:.0%} saved)'.format(
+            name, result['bytes'], result['compressed_bytes'], result['saved']))
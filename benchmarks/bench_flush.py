@@ -0,0 +1,106 @@
+# Flush latency against number of series, memory per buffered series and latency of producers while a flush
+# is running, all against a fake CloudWatch endpoint
+#
+#   python -m benchmarks.bench_flush
+
+import asyncio
+import logging
+import threading
+import time
+import tracemalloc
+
+from benchmarks.common import print_results
+from benchmarks.fake import AsyncFakeCloudWatchClient, FakeCloudWatchClient
+from cloudwatch_metrics_client.aiocloudwatch import CloudWatchAsyncMetricReporter
+from cloudwatch_metrics_client.cloudwatch import CloudWatchSyncMetricReporter
+
+VALUES_PER_SERIES = 10
+
+
+def populate(reporter, num_series) -> None:
+    for n in range(num_series):
+        series = reporter._get_metric_series('latency', {'Endpoint': 'endpoint-{}'.format(n)}, 'Milliseconds')
+        for value in range(VALUES_PER_SERIES):
+            series.add_value(value)
+
+
+def flush_latency(num_series, latency, reporter_kwargs=None, **client_kwargs) -> dict:
+    client = FakeCloudWatchClient(latency=latency, **client_kwargs)
+    reporter = CloudWatchSyncMetricReporter(
+        report_interval=None, sink=client, namespace='Benchmark', **(reporter_kwargs or {}))
+    populate(reporter, num_series)
+    start = time.perf_counter()
+    reporter.flush()
+    return {'ms': (time.perf_counter() - start) * 1000, 'requests': client.requests, 'failures': client.failures}
+
+
+def async_flush_latency(num_series, latency) -> dict:
+    client = AsyncFakeCloudWatchClient(latency=latency)
+    reporter = CloudWatchAsyncMetricReporter(report_interval=None, sink=client, namespace='Benchmark')
+    populate(reporter, num_series)
+
+    async def flush():
+        start = time.perf_counter()
+        await reporter.flush()
+        return time.perf_counter() - start
+
+    loop = asyncio.new_event_loop()
+    try:
+        elapsed = loop.run_until_complete(flush())
+    finally:
+        loop.close()
+    return {'ms': elapsed * 1000, 'requests': client.requests, 'failures': client.failures}
+
+
+def memory_per_series(num_series) -> dict:
+    tracemalloc.start()
+    try:
+        reporter = CloudWatchSyncMetricReporter(report_interval=None)
+        baseline = tracemalloc.get_traced_memory()[0]
+        populate(reporter, num_series)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'bytes_per_series': (current - baseline) / num_series, 'peak_bytes': peak}
+
+
+def producer_latency(num_series, latency) -> dict:
+    # put_metric latency percentiles while another thread flushes num_series series to a slow endpoint
+    reporter = CloudWatchSyncMetricReporter(
+        report_interval=None, sink=FakeCloudWatchClient(latency=latency), namespace='Benchmark')
+    populate(reporter, num_series)
+    flush = threading.Thread(target=reporter.flush)
+    latencies = []
+    flush.start()
+    while flush.is_alive():
+        start = time.perf_counter()
+        reporter.put_metric(MetricName='latency', Dimensions={'Endpoint': 'producer'}, Value=1)
+        latencies.append(time.perf_counter() - start)
+    flush.join()
+    latencies.sort()
+    return {
+        'p50_us': latencies[len(latencies) // 2] * 1e6,
+        'p99_us': latencies[int(len(latencies) * 0.99)] * 1e6,
+        'max_us': latencies[-1] * 1e6,
+        'samples': len(latencies)
+    }
+
+
+def run(series_counts=(100, 1000, 10000), latency=0.02) -> dict:
+    # Injected errors would be logged for every failed request
+    logging.getLogger('cloudwatch_metrics_client').setLevel(logging.CRITICAL)
+    results = {}
+    for num_series in series_counts:
+        results['sync flush, {} series'.format(num_series)] = flush_latency(num_series, latency)
+        results['async flush, {} series'.format(num_series)] = async_flush_latency(num_series, latency)
+    num_series = max(series_counts)
+    # Smaller requests, so enough of them fail
+    results['sync flush, {} series, 20% errors'.format(num_series)] = flush_latency(
+        num_series, latency, {'max_metrics_per_report': 20}, error_rate=0.1, throttle_rate=0.1)
+    results['memory, {} series'.format(num_series)] = memory_per_series(num_series)
+    results['producer during flush, {} series'.format(num_series)] = producer_latency(num_series, latency * 10)
+    return results
+
+
+if __name__ == '__main__':
+    print_results(run())
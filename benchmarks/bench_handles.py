@@ -0,0 +1,50 @@
+# Pre-bound metric handles vs kwargs based put_metric/put_statistic
+#
+#   python -m benchmarks.bench_handles
+
+from benchmarks.common import measure, measure_async, print_results
+from cloudwatch_metrics_client.aiocloudwatch import CloudWatchAsyncMetricReporter
+from cloudwatch_metrics_client.cloudwatch import CloudWatchSyncMetricReporter
+
+DIMENSIONS = {'Service': 'api', 'Operation': 'GetItem', 'Region': 'eu-west-1'}
+
+
+def run(number=100000) -> dict:
+    results = {}
+
+    reporter = CloudWatchSyncMetricReporter(report_interval=None)
+    handle = reporter.metric('latency', DIMENSIONS, unit='Milliseconds')
+    stat_handle = reporter.statistic('latency', DIMENSIONS, unit='Milliseconds')
+    results['sync put_metric'] = measure(
+        lambda: reporter.put_metric(MetricName='latency', Dimensions=DIMENSIONS, Unit='Milliseconds', Value=5),
+        number)
+    results['sync metric handle add'] = measure(lambda: handle.add(5), number)
+    results['sync put_statistic'] = measure(
+        lambda: reporter.put_statistic('latency', DIMENSIONS, 5, 'Milliseconds'), number)
+    results['sync statistic handle add'] = measure(lambda: stat_handle.add(5), number)
+    counter = reporter.counter('requests', DIMENSIONS)
+    gauge = reporter.gauge('queue_depth', DIMENSIONS)
+    results['sync increment'] = measure(lambda: reporter.increment('requests', DIMENSIONS), number)
+    results['sync counter handle increment'] = measure(counter.increment, number)
+    results['sync set_gauge'] = measure(lambda: reporter.set_gauge('queue_depth', DIMENSIONS, 5), number)
+    results['sync gauge handle add'] = measure(lambda: gauge.add(5), number)
+
+    reporter = CloudWatchAsyncMetricReporter(report_interval=None)
+    handle = reporter.metric('latency', DIMENSIONS, unit='Milliseconds')
+    stat_handle = reporter.statistic('latency', DIMENSIONS, unit='Milliseconds')
+    results['async put_metric'] = measure_async(
+        lambda: reporter.put_metric(MetricName='latency', Dimensions=DIMENSIONS, Unit='Milliseconds', Value=5),
+        number)
+    results['async metric handle add'] = measure(lambda: handle.add(5), number)
+    results['async put_statistic'] = measure_async(
+        lambda: reporter.put_statistic('latency', DIMENSIONS, 5, 'Milliseconds'), number)
+    results['async statistic handle add'] = measure(lambda: stat_handle.add(5), number)
+    counter = reporter.counter('requests', DIMENSIONS)
+    results['async increment'] = measure_async(lambda: reporter.increment('requests', DIMENSIONS), number)
+    results['async counter handle increment'] = measure(counter.increment, number)
+
+    return results
+
+
+if __name__ == '__main__':
+    print_results(run())
@@ -0,0 +1,40 @@
+# Per-call overhead of monitored_task: decorated vs plain function and coroutine
+#
+#   python -m benchmarks.bench_monitored_task
+
+from benchmarks.common import measure, measure_async, print_results
+from cloudwatch_metrics_client.aiocloudwatch import CloudWatchAsyncMetrics, CloudWatchAsyncMetricReporter
+from cloudwatch_metrics_client.cloudwatch import CloudWatchSyncMetrics, CloudWatchSyncMetricReporter
+
+
+def task():
+    pass
+
+
+async def coro():
+    pass
+
+
+def run(number=100000) -> dict:
+    results = {}
+
+    CloudWatchSyncMetrics.with_reporter(CloudWatchSyncMetricReporter(report_interval=None))
+    results['plain function'] = measure(task, number)
+    results['sync monitored_task'] = measure(CloudWatchSyncMetrics.monitored_task(task), number)
+
+    CloudWatchAsyncMetrics.with_reporter(CloudWatchAsyncMetricReporter(report_interval=None))
+    results['plain coroutine'] = measure_async(coro, number)
+    results['async monitored_task'] = measure_async(CloudWatchAsyncMetrics.monitored_task(coro), number)
+
+    results['sync monitored_task overhead'] = overhead(results['sync monitored_task'], results['plain function'])
+    results['async monitored_task overhead'] = overhead(results['async monitored_task'], results['plain coroutine'])
+    return results
+
+
+def overhead(result, baseline) -> dict:
+    ns_per_op = result['ns_per_op'] - baseline['ns_per_op']
+    return {'ns_per_op': ns_per_op, 'ops_per_sec': 1e9 / ns_per_op}
+
+
+if __name__ == '__main__':
+    print_results(run())
@@ -0,0 +1,47 @@
+# Multi-threaded recording throughput of sync reporter: shared lock vs thread-local buffers
+#
+#   python -m benchmarks.bench_threads
+
+import threading
+import time
+
+from benchmarks.common import print_results
+from cloudwatch_metrics_client.cloudwatch import CloudWatchSyncMetricReporter
+
+DIMENSIONS = {'Service': 'api', 'Operation': 'GetItem'}
+
+
+def measure_threads(reporter, threads, number) -> dict:
+    barrier = threading.Barrier(threads + 1)
+
+    def record():
+        barrier.wait()
+        for n in range(number):
+            reporter.put_metric(MetricName='latency', Dimensions=DIMENSIONS, Value=n % 100)
+        barrier.wait()
+
+    workers = [threading.Thread(target=record) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    barrier.wait()
+    elapsed = time.perf_counter() - start
+    for worker in workers:
+        worker.join()
+    total = threads * number
+    return {'ns_per_op': elapsed / total * 1e9, 'ops_per_sec': total / elapsed}
+
+
+def run(number=20000, thread_counts=(1, 2, 4, 8, 16, 32, 64)) -> dict:
+    results = {}
+    for threads in thread_counts:
+        results['shared lock, {} threads'.format(threads)] = measure_threads(
+            CloudWatchSyncMetricReporter(report_interval=None), threads, number)
+        results['thread-local buffers, {} threads'.format(threads)] = measure_threads(
+            CloudWatchSyncMetricReporter(report_interval=None, thread_local_buffers=True), threads, number)
+    return results
+
+
+if __name__ == '__main__':
+    print_results(run())
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+
+def measure(func, number=100000, repeat=5) -> dict:
+    # Best of `repeat` runs of `number` calls, as timeit does
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {'ns_per_op': best / number * 1e9, 'ops_per_sec': number / best}
+
+
+def measure_async(coro_func, number=100000, repeat=5) -> dict:
+    async def run():
+        for _ in range(number):
+            await coro_func()
+
+    loop = asyncio.new_event_loop()
+    try:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            loop.run_until_complete(run())
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        loop.close()
+    return {'ns_per_op': best / number * 1e9, 'ops_per_sec': number / best}
+
+
+# Result keys where higher is better; for all others lower is
+HIGHER_IS_BETTER = {'ops_per_sec', 'saved'}
+
+
+def print_results(results) -> None:
+    for name, result in results.items():
+        if 'ns_per_op' in result:
+            print('{:<48} {:>10.1f} ns/op {:>14,.0f} ops/s'.format(name, result['ns_per_op'], result['ops_per_sec']))
+        else:
+            print('{:<48} {}'.format(name, '  '.join('{}={:,.1f}'.format(key, value) for key, value in result.items())))
+
+
+def compare(baseline, current, threshold=0.1) -> list:
+    """
+    Regressions of current results against baseline, both {suite: {name: {key: value}}}, by more than
+    `threshold` (relative); as (suite, name, key, baseline value, current value) tuples
+    """
+    regressions = []
+    for suite, results in current.items():
+        for name, result in results.items():
+            for key, value in result.items():
+                old = baseline.get(suite, {}).get(name, {}).get(key)
+                if not old or key in ('requests', 'failures', 'samples'):
+                    continue
+                change = (value - old) / abs(old)
+                if (-change if key in HIGHER_IS_BETTER else change) > threshold:
+                    regressions.append((suite, name, key, old, value))
+    return regressions
@@ -0,0 +1,53 @@
+import asyncio
+import random
+import threading
+import time
+
+OK = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+THROTTLED = {'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+
+
+class FakeCloudWatchClient:
+
+    """
+    In-process stand-in for CloudWatch client: every put_metric_data call takes `latency` seconds and fails
+    with `error_rate` probability (raising ConnectionError) or `throttle_rate` probability (throttling response).
+    Requests and datums received are counted.
+    """
+
+    def __init__(self, latency=0, error_rate=0, throttle_rate=0, seed=0):
+
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.datums = 0
+        self.failures = 0
+
+    def put_metric_data(self, Namespace, MetricData) -> dict:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(MetricData)
+
+    def _respond(self, metric_data) -> dict:
+        with self.lock:
+            self.requests += 1
+            self.datums += len(metric_data)
+            outcome = self.random.random()
+            if outcome < self.error_rate + self.throttle_rate:
+                self.failures += 1
+        if outcome < self.error_rate:
+            raise ConnectionError('Injected connection error')
+        if outcome < self.error_rate + self.throttle_rate:
+            return THROTTLED
+        return OK
+
+
+class AsyncFakeCloudWatchClient(FakeCloudWatchClient):
+
+    async def put_metric_data(self, Namespace, MetricData) -> dict:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(MetricData)
@@ -17,6 +17,9 @@ setup(
     install_requires=[
         'multidict>=4.5.2'
     ],
+    extras_require={
+        'numpy': ['numpy']
+    },
     packages=find_packages('src'),
     package_dir={'': 'src'},
     author='Nikita Makeev',
@@ -0,0 +1,168 @@
+"""
+Per-host aggregation for pre-fork servers (gunicorn, uwsgi and the like).
+
+Every worker process runs its own reporter with `AggregatorSink` and a short report interval, so samples are
+pre-aggregated in the worker and pushed as a single datagram per batch over a unix socket. One aggregator process
+per host merges value counts and statistics from all workers and reports them to CloudWatch once per its own
+report interval. Counters and gauges are marked as such in datagrams, so they stay a single summed value, resp. the
+latest value of all workers with their minimum and maximum:
+
+    # aggregator process
+    python -m cloudwatch_metrics_client.aggregator --socket /run/metrics.sock --report-interval 60
+
+    # every worker
+    reporter = CloudWatchSyncMetricReporter(report_interval=1, sink=AggregatorSink('/run/metrics.sock'))
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import socket
+import threading
+
+from cloudwatch_metrics_client.aiocloudwatch import CounterSeries, GaugeSeries
+from cloudwatch_metrics_client.cloudwatch import CloudWatchSyncMetrics, CloudWatchSyncMetricReporter
+from cloudwatch_metrics_client.sinks import MetricSink
+
+log = logging.getLogger(__name__.split('.')[0])
+
+# Datagrams are atomic, but limited in size; batches are estimated well below that
+MAX_MESSAGE_SIZE = 256 * 1024
+
+
+class AggregatorSink(MetricSink):
+
+    max_bytes_per_report = 64 * 1024
+    series_kinds = True
+
+    def __init__(self, path):
+
+        self.path = path
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    def put_metric_data(self, Namespace, MetricData) -> dict:
+        message = json.dumps({
+            'Namespace': Namespace,
+            'MetricData': [dict(datum, Timestamp=datum['Timestamp'].timestamp()) for datum in MetricData]
+        }, separators=(',', ':')).encode('utf-8')
+        self.socket.sendto(message, self.path)
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    def close(self) -> None:
+        self.socket.close()
+
+
+class CloudWatchMetricAggregator:
+
+    def __init__(self, path, report_interval=60, **reporter_kwargs):
+
+        self.path = path
+        self.reporter_kwargs = dict(reporter_kwargs, report_interval=report_interval)
+        # Reporter per namespace workers report to
+        self.reporters = {}
+        self.socket = None
+        self.thread = None
+        self.stopped = False
+
+    def bind(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.bind(self.path)
+        return self
+
+    def start(self):
+        if self.socket is None:
+            self.bind()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        if self.socket is None:
+            self.bind()
+        log.debug('Aggregating metrics from {}'.format(self.path))
+        while not self.stopped:
+            try:
+                message = self.socket.recv(MAX_MESSAGE_SIZE)
+            except OSError:
+                if self.stopped:
+                    return
+                raise
+            try:
+                self.merge(json.loads(message.decode('utf-8')))
+            except Exception as e:
+                log.error('Failed merging metrics; error={}'.format(e))
+
+    def stop(self):
+        self.stopped = True
+        if self.socket is not None:
+            self.socket.close()
+        for reporter in self.reporters.values():
+            reporter.stop()
+
+    def flush(self):
+        for reporter in list(self.reporters.values()):
+            reporter.flush()
+
+    def merge(self, message):
+        reporter = self.get_reporter(message['Namespace'])
+        with reporter.lock:
+            for datum in message['MetricData']:
+                self.merge_datum(reporter, datum)
+
+    def get_reporter(self, namespace) -> CloudWatchSyncMetricReporter:
+        reporter = self.reporters.get(namespace)
+        if reporter is None:
+            reporter = CloudWatchSyncMetricReporter(namespace=namespace, **self.reporter_kwargs)
+            self.reporters[namespace] = reporter
+            reporter.run()
+        return reporter
+
+    @staticmethod
+    def merge_datum(reporter, datum) -> None:
+        name = datum['MetricName']
+        dimensions = {dimension['Name']: dimension['Value'] for dimension in datum.get('Dimensions') or []} or None
+        unit = datum.get('Unit')
+        # Windowed reporter keeps samples in the windows workers recorded them in
+        window = {'timestamp': datetime.datetime.fromtimestamp(datum['Timestamp'])} if reporter.time_window else {}
+        kind = datum.get('Kind')
+        if kind == CounterSeries.KIND:
+            reporter._get_counter_series(name, dimensions, unit).add_value(datum['Value'], **window)
+        elif kind == GaugeSeries.KIND:
+            statistics = datum['StatisticValues']
+            reporter._get_gauge_series(name, dimensions, unit).add_statistics(
+                statistics['SampleCount'], statistics['Sum'], statistics['Minimum'], statistics['Maximum'], **window)
+        elif 'StatisticValues' in datum:
+            statistics = datum['StatisticValues']
+            reporter._get_statistic_series(name, dimensions, unit).add_statistics(
+                statistics['SampleCount'], statistics['Sum'], statistics['Minimum'], statistics['Maximum'], **window)
+        elif 'Values' in datum:
+            reporter._get_metric_series(name, dimensions, unit).add_counts(datum['Values'], datum['Counts'], **window)
+        else:
+            reporter._get_metric_series(name, dimensions, unit).add_value(datum['Value'], **window)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aggregate metrics of local processes and report them to CloudWatch')
+    parser.add_argument('--socket', required=True, help='unix socket path workers send metrics to')
+    parser.add_argument('--report-interval', type=float, default=60, help='seconds between reports to CloudWatch')
+    parser.add_argument('--debug', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig()
+    if args.debug:
+        CloudWatchSyncMetrics.with_debug_level(1)
+    aggregator = CloudWatchMetricAggregator(args.socket, report_interval=args.report_interval)
+    try:
+        aggregator.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        aggregator.stop()
+        aggregator.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,29 +1,66 @@
 import asyncio
+import contextvars
 import datetime
 import functools
+import inspect
 import logging
-import math
-from collections import OrderedDict
+import random
+import time
+from collections import Counter, OrderedDict
 from typing import Union
 from contextlib import contextmanager
 
+from cloudwatch_metrics_client.batching import MetricBatcher, MAX_DATUMS_PER_REQUEST, MAX_BYTES_PER_REQUEST
+from cloudwatch_metrics_client.coalescing import AsyncSendCoalescer, DEFAULT_LINGER
+from cloudwatch_metrics_client.compression import RequestCompressor, MIN_COMPRESSED_SIZE
+from cloudwatch_metrics_client.errors import is_throttling, is_transient_failure, response_status
+from cloudwatch_metrics_client.limits import LimitedSeries, OVERFLOW_DIMENSIONS
+from cloudwatch_metrics_client.retry import TokenBucket
+from cloudwatch_metrics_client.sampling import GeometricSampler
+from cloudwatch_metrics_client.stats import ReporterStats
+
 # Support for 3.6, for now add dependency manually
 try:
     from contextlib import asynccontextmanager
 except ImportError:
     from async_generator import asynccontextmanager
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from time import perf_counter_ns
+except ImportError:
+    def perf_counter_ns():
+        return int(time.perf_counter() * 1e9)
+
 
 log = logging.getLogger(__name__.split('.')[0])
 log.setLevel(logging.INFO)
 
+# Nanoseconds in CloudWatch time units that monitored_task could report elapsed time in
+TIME_UNITS = {
+    'Microseconds': 1000,
+    'Milliseconds': 1000000,
+    'Seconds': 1000000000
+}
+
 class CloudWatchAsyncMetrics:
 
-    dimensions = None
+    # Dimensions of the innermost monitored task; being a context variable, it is separate for every asyncio task
+    # and thread, so concurrent monitored tasks don't overwrite each other's dimensions
+    monitored_dimensions = contextvars.ContextVar('monitored_dimensions', default=None)
     client = None
     namespace = None
     reporter = None
     debug_level = 0
+    timing_unit = 'Microseconds'
+    compressor_class = RequestCompressor
+    compressor = None
+    coalescer_class = AsyncSendCoalescer
+    coalescer = None
 
     @classmethod
     def with_namespace(cls, namespace):
@@ -33,6 +70,7 @@ class CloudWatchAsyncMetrics:
     @classmethod
     def with_client(cls, client):
         cls.client = client
+        cls._register_compressor()
         return cls
 
     @classmethod
@@ -40,13 +78,52 @@ class CloudWatchAsyncMetrics:
         if cls.client is None:
             import aioboto3
             cls.client = aioboto3.client('cloudwatch')
+            cls._register_compressor()
+        return cls
+
+    @classmethod
+    def with_compression(cls, min_size=MIN_COMPRESSED_SIZE, level=6):
+        # Gzip PutMetricData request bodies of at least min_size bytes, of reporters and send_metric alike
+        cls.compressor = cls.compressor_class(min_size=min_size, level=level)
+        cls._register_compressor()
         return cls
 
+    @classmethod
+    def with_send_coalescing(cls, linger=DEFAULT_LINGER, max_datums=MAX_DATUMS_PER_REQUEST):
+        # send_metric returns a future; datums of concurrent calls are sent together after at most linger seconds
+        cls.coalescer = cls.coalescer_class(
+            cls._send_metric_data, linger=linger, batcher=MetricBatcher(max_datums=max_datums))
+        return cls
+
+    @classmethod
+    def _send_metric_data(cls, namespace, metric_data):
+        cls.setup_client()
+        return cls.client.put_metric_data(
+            Namespace=namespace,
+            MetricData=metric_data
+        )
+
+    @classmethod
+    def _register_compressor(cls):
+        if cls.compressor is not None and hasattr(getattr(cls.client, 'meta', None), 'events'):
+            cls.compressor.register(cls.client)
+
     @classmethod
     def with_reporter(cls, reporter):
         cls.reporter = reporter
         return cls
 
+    @classmethod
+    def with_timing_unit(cls, unit):
+        cls._check_timing_unit(unit)
+        cls.timing_unit = unit
+        return cls
+
+    @staticmethod
+    def _check_timing_unit(unit):
+        if unit not in TIME_UNITS:
+            raise ValueError('Unsupported timing unit {}; use one of {}'.format(unit, ', '.join(TIME_UNITS)))
+
     @classmethod
     def with_debug_level(cls, level):
         cls.debug_level = level
@@ -62,9 +139,44 @@ class CloudWatchAsyncMetrics:
             return False
 
     @classmethod
-    async def put_statistic(cls, name, dimensions, value, unit=None):
+    async def put_statistic(cls, name, dimensions, value, unit=None, weight=None):
+        try:
+            return await cls.reporter.put_statistic(name, dimensions, value, unit, weight)
+        except AttributeError:
+            return False
+
+    @classmethod
+    async def put_metric_values(cls, name, values, dimensions=None, unit=None):
+        try:
+            return await cls.reporter.put_metric_values(name, values, dimensions, unit)
+        except AttributeError:
+            return False
+
+    @classmethod
+    async def put_statistic_values(cls, name, dimensions, values, unit=None):
+        try:
+            return await cls.reporter.put_statistic_values(name, dimensions, values, unit)
+        except AttributeError:
+            return False
+
+    @classmethod
+    async def put_many(cls, metrics=(), statistics=(), unit=None):
         try:
-            return await cls.reporter.put_statistic(name, dimensions, value, unit)
+            return await cls.reporter.put_many(metrics, statistics, unit)
+        except AttributeError:
+            return False
+
+    @classmethod
+    async def increment(cls, name, dimensions=None, value=1, unit='Count'):
+        try:
+            return await cls.reporter.increment(name, dimensions, value, unit)
+        except AttributeError:
+            return False
+
+    @classmethod
+    async def set_gauge(cls, name, dimensions, value, unit=None):
+        try:
+            return await cls.reporter.set_gauge(name, dimensions, value, unit)
         except AttributeError:
             return False
 
@@ -74,6 +186,8 @@ class CloudWatchAsyncMetrics:
         try:
             if metric_data.get('Timestamp') is None:
                 metric_data['Timestamp'] = datetime.datetime.now()
+            if cls.coalescer is not None:
+                return cls.coalescer.submit(cls.namespace, {**metric_data})
             cls.setup_client()
             return await cls.client.put_metric_data(
                 Namespace=cls.namespace,
@@ -82,40 +196,64 @@ class CloudWatchAsyncMetrics:
         except AttributeError:
             return False
 
+    @classmethod
+    def _sample_weight(cls, name) -> float:
+        # Weight of a monitored task sampled by the reporter, 0 if it is skipped
+        reporter = cls.reporter
+        if reporter is None or not reporter.sampling:
+            return 1
+        return reporter.sample_weight(name)
+
     @classmethod
     def with_monitored_dimension(cls, dimension, value):
-        if cls.dimensions is None:
-            cls.dimensions = {}
-        cls.dimensions[dimension] = value
+        # Copy on write: tasks started within monitored task share its context, but must not change its dimensions
+        dimensions = cls.monitored_dimensions.get()
+        cls.monitored_dimensions.set({**(dimensions or {}), dimension: value})
         return cls
 
     @classmethod
-    def monitored_task(cls, func, name='transaction'):
+    def monitored_task(cls, func, name='transaction', unit=None):
+        if unit is not None:
+            cls._check_timing_unit(unit)
 
         @contextmanager
         def monitor():
-            previous_dimensions = cls.dimensions
-            cls.dimensions = None
-            start = datetime.datetime.now()
-            yield
-            elapsed = datetime.datetime.now() - start
-            asyncio.run_coroutine_threadsafe(
-                cls.put_statistic(
-                    name=name, dimensions=cls.dimensions, value=elapsed.microseconds, unit='Microseconds'),
-                asyncio.get_event_loop()
-            )
-            cls.dimensions = previous_dimensions
+            token = cls.monitored_dimensions.set(None)
+            weight = cls._sample_weight(name)
+            try:
+                if not weight:
+                    yield
+                    return
+                start = perf_counter_ns()
+                yield
+                elapsed = perf_counter_ns() - start
+                timing_unit = unit or cls.timing_unit
+                asyncio.run_coroutine_threadsafe(
+                    cls.put_statistic(
+                        name=name, dimensions=cls.monitored_dimensions.get(), value=elapsed / TIME_UNITS[timing_unit],
+                        unit=timing_unit, weight=weight),
+                    asyncio.get_event_loop()
+                )
+            finally:
+                cls.monitored_dimensions.reset(token)
 
         @asynccontextmanager
         async def async_monitor():
-            previous_dimensions = cls.dimensions
-            cls.dimensions = None
-            start = datetime.datetime.now()
-            yield
-            elapsed = datetime.datetime.now() - start
-            await cls.put_statistic(
-                name=name, dimensions=cls.dimensions, value=elapsed.microseconds, unit='Microseconds')
-            cls.dimensions = previous_dimensions
+            token = cls.monitored_dimensions.set(None)
+            weight = cls._sample_weight(name)
+            try:
+                if not weight:
+                    yield
+                    return
+                start = perf_counter_ns()
+                yield
+                elapsed = perf_counter_ns() - start
+                timing_unit = unit or cls.timing_unit
+                await cls.put_statistic(
+                    name=name, dimensions=cls.monitored_dimensions.get(), value=elapsed / TIME_UNITS[timing_unit],
+                    unit=timing_unit, weight=weight)
+            finally:
+                cls.monitored_dimensions.reset(token)
 
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
@@ -132,112 +270,579 @@ class CloudWatchAsyncMetrics:
         return wrapper
 
 
+class MetricHandle:
+
+    """
+    Recording handle bound to a single series of a reporter. Metric ID is built once and the series is
+    looked up again only after the reporter has swapped its buffers, so `add` does no string building or hashing.
+    """
+
+    def __init__(self, reporter, get_series, name, dimensions=None, unit=None):
+
+        self.reporter = reporter
+        self.get_series = get_series
+        self.name = name
+        self.dimensions = dimensions
+        self.unit = unit
+        self.metric_id = Metric.generate_id(name, dimensions)
+        self.series = None
+        self.generation = None
+
+    def add(self, value) -> None:
+        if self.reporter.sampling:
+            weight = self.reporter.sample_weight(self.name)
+            if not weight:
+                return
+        else:
+            weight = 1
+        if self.generation != self.reporter.generation:
+            self._bind()
+        if weight == 1:
+            self.series.add_value(value)
+        else:
+            self.series.add_sample(value, weight)
+
+    def increment(self, value=1) -> None:
+        self.add(value)
+
+    def _bind(self) -> None:
+        self.series = self.get_series(self.name, self.dimensions, self.unit, self.metric_id)
+        self.generation = self.reporter.generation
+
+
 class CloudWatchAsyncMetricReporter:
 
-    MAX_METRICS_PER_REPORT = 20
+    MAX_METRICS_PER_REPORT = MAX_DATUMS_PER_REQUEST
+    MAX_BYTES_PER_REPORT = MAX_BYTES_PER_REQUEST
+
+    metrics_class = CloudWatchAsyncMetrics
+    handle_class = MetricHandle
 
-    def __init__(self, report_interval=30):
+    def __init__(self, report_interval=30, max_concurrent_requests=4, max_metrics_per_report=None,
+                 max_bytes_per_report=None, quantizer=None, sink=None, namespace=None, spool=None,
+                 spool_replay_rate=1, retry_policy=None, max_requests_per_second=None, randomize_phase=False,
+                 time_window=None, limits=None, stats_namespace=None, on_flush_start=None, on_batch_sent=None,
+                 on_error=None, sampling_rate=None, flush_policy=None):
 
         self.metrics = {}
         self.statistics = {}
+        self.quantizer = quantizer
+        self.quantizers = {}
         self.report_interval = report_interval
+        self.max_concurrent_requests = max_concurrent_requests
+        # Optional replacement for CloudWatch client, see cloudwatch_metrics_client.sinks
+        self.sink = sink
+        self.max_values_per_datum = getattr(sink, 'max_values_per_datum', MetricSeries.MAX_VALUES_PER_DATUM)
+        self.series_kinds = getattr(sink, 'series_kinds', False)
+        self.batcher = MetricBatcher(
+            max_datums=max_metrics_per_report or getattr(sink, 'max_metrics_per_report', None)
+            or self.MAX_METRICS_PER_REPORT,
+            max_bytes=max_bytes_per_report or getattr(sink, 'max_bytes_per_report', None) or self.MAX_BYTES_PER_REPORT
+        )
+        # Namespace of this reporter's metrics; defaults to the one set with CloudWatch*Metrics.with_namespace
+        self.namespace = namespace
+        # Optional MetricSpool keeping batches failed for transient reasons, replayed at most
+        # spool_replay_rate batches per second
+        self.spool = spool
+        self.spool_replay_rate = spool_replay_rate
+        self.replay_task = None
+        # Optional RetryPolicy for failed requests and limit of requests per second
+        self.retry_policy = retry_policy
+        self.rate_limiter = TokenBucket(max_requests_per_second) if max_requests_per_second else None
+        # Start reporting at random point of the first interval, so hosts started together don't report together
+        self.randomize_phase = randomize_phase
+        # Optional length in seconds of time windows samples are aggregated in, see WindowedSeries
+        self.time_window = time_window
+        # Optional CardinalityLimits bounding number and size of buffered series
+        self.limits = limits
+        # Counters of the reporter itself, optionally reported to stats_namespace after every flush
+        self.counters = ReporterStats()
+        self.stats_namespace = stats_namespace
+        # Optional callbacks: on_flush_start(reporter), on_batch_sent(namespace, batch),
+        # on_error(namespace, batch, failure)
+        self.on_flush_start = on_flush_start
+        self.on_batch_sent = on_batch_sent
+        self.on_error = on_error
+        # Optional sampling of recorded values, for all metrics and per metric name
+        self.sampler = GeometricSampler(sampling_rate) if sampling_rate is not None else None
+        self.samplers = {}
+        self.sampling = self.sampler is not None
+        # Optional FlushPolicy flushing early under bursts and checking less often when idle
+        self.flush_policy = flush_policy
+        self.flush_threshold = flush_policy.series_threshold(self.batcher) if flush_policy is not None else None
+        # Series created since buffers were last swapped, in all buffers; checked against limits and flush policy
+        self.num_series = 0
+        self.idle = False
+        self.wake_reason = None
         self.sleep_task = None
         self.report_task = None
 
-        self.lock = asyncio.Lock()
+        self.lock = self._create_lock()
+        # Incremented on every buffer swap, so metric handles know their series has been sent
+        self.generation = 0
 
         self.stopped = False
 
+    def _create_lock(self):
+        return asyncio.Lock()
+
     async def run(self):
         if self.report_interval:
             self.report_task = asyncio.create_task(self.report())
             log.debug('Reporting metrics to CloudWatch every {} sec'.format(self.report_interval))
+        if self.spool is not None:
+            self.replay_task = asyncio.create_task(self.replay())
 
     def stop(self):
         if self.sleep_task is not None:
             self.sleep_task.cancel()
+        if self.replay_task is not None:
+            self.replay_task.cancel()
         self.stopped = True
 
+    def set_quantizer(self, name, quantizer):
+        # Applies to series of metric `name` created from now on; None disables quantization for it
+        self.quantizers[name] = quantizer
+        return self
+
+    def set_sampling_rate(self, name, rate):
+        # Rate of metric `name` overrides the reporter-wide one; None disables sampling of it
+        self.samplers[name] = GeometricSampler(rate) if rate is not None else None
+        self.sampling = True
+        return self
+
+    def sample_weight(self, name) -> float:
+        """
+        Number of events a recorded value of metric `name` stands for; 0 if the value is to be skipped
+        """
+        sampler = self.samplers.get(name, self.sampler)
+        if sampler is None:
+            return 1
+        return sampler.weight if sampler.sample() else 0
+
     async def put_metric(self, **metric_data):
+        weight = self.sample_weight(metric_data['MetricName']) if self.sampling else 1
+        if not weight:
+            return True
+        async with self.lock:
+            self._put_metric(metric_data, weight)
+
+        return True
+
+    async def put_statistic(self, name, dimensions, value, unit=None, weight=None):
+        # Weight is given by callers that have sampled the value already
+        if weight is None:
+            weight = self.sample_weight(name) if self.sampling else 1
+            if not weight:
+                return True
+        async with self.lock:
+            self._put_statistic(name, dimensions, value, unit, weight)
+
+        return True
+
+    async def put_metric_values(self, name, values, dimensions=None, unit=None):
+        # Many values of one metric series, as a sequence or NumPy array
+        async with self.lock:
+            self._get_metric_series(name, dimensions, unit).add_values(values)
+
+        return True
+
+    async def put_statistic_values(self, name, dimensions, values, unit=None):
         async with self.lock:
-            name = metric_data['MetricName']
-            dimensions = metric_data.get('Dimensions')
-            metric_id = Metric.generate_id(name, dimensions)
-            metric = self.metrics.get(metric_id)
-            if metric is None:
-                self.metrics[metric_id] = MetricSeries(name=name, dimensions=dimensions, unit=metric_data.get('Unit'))
-                metric = self.metrics[metric_id]
-            metric.add_value(metric_data['Value'])
+            self._get_statistic_series(name, dimensions, unit).add_values(values)
 
         return True
 
-    async def put_statistic(self, name, dimensions, value, unit=None):
+    async def put_many(self, metrics=(), statistics=(), unit=None):
+        # Iterables of (name, dimensions, value) samples recorded under a single lock acquisition
         async with self.lock:
-            metric_id = Metric.generate_id(name, dimensions)
-            stat = self.statistics.get(metric_id)
-            if stat is None:
-                self.statistics[metric_id] = StatisticSeries(name=name, dimensions=dimensions, unit=unit)
-                stat = self.statistics[metric_id]
-            stat.add_value(value)
+            self._put_many(metrics, statistics, unit)
 
         return True
 
+    async def increment(self, name, dimensions=None, value=1, unit='Count'):
+        async with self.lock:
+            self._get_counter_series(name, dimensions, unit).add_value(value)
+
+        return True
+
+    async def set_gauge(self, name, dimensions, value, unit=None):
+        async with self.lock:
+            self._get_gauge_series(name, dimensions, unit).add_value(value)
+
+        return True
+
+    def metric(self, name, dimensions=None, unit=None):
+        return self.handle_class(self, self._get_metric_series, name, dimensions, unit)
+
+    def statistic(self, name, dimensions=None, unit=None):
+        return self.handle_class(self, self._get_statistic_series, name, dimensions, unit)
+
+    def counter(self, name, dimensions=None, unit='Count'):
+        return self.handle_class(self, self._get_counter_series, name, dimensions, unit)
+
+    def gauge(self, name, dimensions=None, unit=None):
+        return self.handle_class(self, self._get_gauge_series, name, dimensions, unit)
+
+    def _put_metric(self, metric_data, weight=1) -> None:
+        name = metric_data['MetricName']
+        dimensions = metric_data.get('Dimensions')
+        self._add_metric_value(self._get_metric_series(name, dimensions, metric_data.get('Unit')), metric_data, weight)
+
+    def _add_metric_value(self, series, metric_data, weight=1) -> None:
+        # Explicit timestamp only matters when samples are bucketed into time windows
+        timestamp = metric_data.get('Timestamp') if self.time_window is not None else None
+        args = (timestamp,) if timestamp is not None else ()
+        if weight == 1:
+            series.add_value(metric_data['Value'], *args)
+        else:
+            series.add_sample(metric_data['Value'], weight, *args)
+
+    def _put_statistic(self, name, dimensions, value, unit, weight=1) -> None:
+        series = self._get_statistic_series(name, dimensions, unit)
+        if weight == 1:
+            series.add_value(value)
+        else:
+            series.add_sample(value, weight)
+
+    def _put_many(self, metrics, statistics, unit, metric_buffer=None, statistic_buffer=None) -> None:
+        for name, dimensions, value in metrics:
+            self._get_metric_series(name, dimensions, unit, metrics=metric_buffer).add_value(value)
+        for name, dimensions, value in statistics:
+            self._get_statistic_series(name, dimensions, unit, statistics=statistic_buffer).add_value(value)
+
+    def _get_metric_series(self, name, dimensions, unit, metric_id=None, metrics=None) -> 'MetricSeries':
+        metrics = self.metrics if metrics is None else metrics
+        metric_id = metric_id or Metric.generate_id(name, dimensions)
+        metric = metrics.get(metric_id)
+        if metric is None:
+            metric = self._add_series(metrics, metric_id, MetricSeries, name=name, dimensions=dimensions, unit=unit,
+                                      quantizer=self.quantizers.get(name, self.quantizer), limits=self.limits)
+        return metric
+
+    def _get_statistic_series(self, name, dimensions, unit, metric_id=None, statistics=None) -> 'StatisticSeries':
+        statistics = self.statistics if statistics is None else statistics
+        metric_id = metric_id or Metric.generate_id(name, dimensions)
+        stat = statistics.get(metric_id)
+        if stat is None:
+            stat = self._add_series(statistics, metric_id, StatisticSeries, name=name, dimensions=dimensions, unit=unit)
+        return stat
+
+    def _get_counter_series(self, name, dimensions, unit, metric_id=None, statistics=None) -> 'CounterSeries':
+        return self._get_aggregate_series(CounterSeries, name, dimensions, unit, metric_id, statistics)
+
+    def _get_gauge_series(self, name, dimensions, unit, metric_id=None, statistics=None) -> 'GaugeSeries':
+        return self._get_aggregate_series(GaugeSeries, name, dimensions, unit, metric_id, statistics)
+
+    def _get_aggregate_series(self, series_class, name, dimensions, unit, metric_id, statistics):
+        # Counters and gauges share buffers with statistic series, keyed by their kind too
+        statistics = self.statistics if statistics is None else statistics
+        key = self._series_key(series_class, metric_id or Metric.generate_id(name, dimensions))
+        series = statistics.get(key)
+        if series is None:
+            series = self._add_series(statistics, key, series_class, name=name, dimensions=dimensions, unit=unit)
+        return series
+
+    def _add_series(self, series_map, metric_id, series_class, **kwargs):
+        limit = self._reserve_series(kwargs['dimensions'])
+        if limit is None:
+            series = series_map[metric_id] = self._create_series(series_class, **kwargs)
+            if self.flush_policy is not None:
+                self._series_added()
+            return series
+        target = None
+        if self.limits.fold:
+            overflow_id = self._series_key(series_class, Metric.generate_id(kwargs['name'], OVERFLOW_DIMENSIONS))
+            target = series_map.get(overflow_id)
+            if target is None:
+                # Overflow series are let over the limit, there is at most one per metric name
+                target = series_map[overflow_id] = self._create_series(
+                    series_class, **dict(kwargs, dimensions=OVERFLOW_DIMENSIONS))
+        return LimitedSeries(self.limits, limit, target)
+
+    @staticmethod
+    def _series_key(series_class, metric_id):
+        # Counters and gauges are kept along with statistic series, so their kind is part of the key
+        kind = getattr(series_class, 'KIND', None)
+        return metric_id if kind is None else (kind, metric_id)
+
+    def _reserve_series(self, dimensions) -> str:
+        # Counts a new series in; name of cardinality limit it would exceed instead, or None
+        limit = self.limits.exceeded(dimensions, self.num_series) if self.limits is not None else None
+        if limit is None:
+            self.num_series += 1
+        return limit
+
+    def _create_series(self, series_class, **kwargs):
+        if self.time_window is None:
+            return series_class(**kwargs)
+        return WindowedSeries(functools.partial(series_class, **kwargs), self.time_window)
+
+    def _series_added(self) -> None:
+        # Wakes report loop up when buffers should be flushed early or when recording resumes after idle intervals
+        if self.wake_reason is not None:
+            return
+        if self.idle:
+            self._wake('active')
+        elif self.flush_threshold is not None and self.num_series >= self.flush_threshold:
+            self._wake('flush')
+
+    def _wake(self, reason) -> None:
+        self.wake_reason = reason
+        if self.sleep_task is not None and not self.sleep_task.done():
+            self.sleep_task.cancel()
+
     async def report(self):
 
+        delay = self._report_delay(True)
         while True:
             try:
                 if self.stopped:
                     log.debug('reporter stopped')
                     return
-                self.sleep_task = asyncio.create_task(asyncio.sleep(self.report_interval))
-                try:
-                    await self.sleep_task
-                except asyncio.CancelledError:
-                    log.debug('sleep cancelled; reporter stopped')
-                    return
-                if len(self.metrics) + len(self.statistics) == 0:
-                    log.debug('nothing to report')
-                    continue
-                await self._report()
+                # Woken up already, e.g. by a burst recorded before the loop started
+                if self.wake_reason is None:
+                    self.sleep_task = asyncio.create_task(asyncio.sleep(delay))
+                    try:
+                        await self.sleep_task
+                    except asyncio.CancelledError:
+                        if self.stopped or self.wake_reason is None:
+                            log.debug('sleep cancelled; reporter stopped')
+                            return
+                flush, delay = self._next_report()
+                if flush:
+                    await self._report()
             except Exception as e:
                 log.error(e)
 
-    def _calculate_statistics(self) -> []:
-        statistics = [stat.to_repr() for name, stat in self.statistics.items()]
+    def _report_delay(self, first) -> float:
+        if first and self.randomize_phase:
+            return random.uniform(0, self.report_interval)
+        return self.report_interval
+
+    def _next_report(self) -> tuple:
+        """
+        Whether to flush now that report loop woke up, and how long to wait after that
+        """
+        reason, self.wake_reason = self.wake_reason, None
+        if reason == 'flush':
+            self.counters.increment('early_flushes')
+            return True, self.report_interval
+        if reason == 'active':
+            # Recording resumed after idle intervals; flush one regular interval from now
+            self.idle = False
+            return False, self.report_interval
+        if self.flush_policy is not None:
+            # Set before checking buffers, so a series added meanwhile either gets seen or wakes the loop up
+            self.idle = True
+        if self._buffered_series() == 0:
+            log.debug('nothing to report')
+            if self.flush_policy is None:
+                return False, self.report_interval
+            delay = self.flush_policy.idle_delay(self.report_interval)
+            self.idle = delay > self.report_interval
+            return False, delay
+        self.idle = False
+        return True, self.report_interval
+
+    def _buffered_series(self) -> int:
+        return len(self.metrics) + len(self.statistics)
+
+    def _swap_buffers(self) -> tuple:
+        # Must be called with the lock held; the caller then serializes and sends the returned
+        # series without holding the lock, so producers are never blocked by network calls
+        metrics, statistics = self.metrics, self.statistics
+        self.metrics = {}
         self.statistics = {}
-        return list(filter(None.__ne__, statistics))
+        self.generation += 1
+        self.num_series = 0
+        return metrics, statistics
 
-    def _calculate_metrics(self) -> []:
-        metrics = [data.to_repr() for name, data in self.metrics.items()]
-        self.metrics = {}
-        return list(filter(None.__ne__, metrics))
+    def _flushed(self, num_series, metric_data) -> None:
+        # Size of series just serialized tells how many of them make a full request next time
+        if self.flush_policy is not None:
+            self.flush_policy.flushed(num_series, metric_data)
+            self.flush_threshold = self.flush_policy.series_threshold(self.batcher)
+
+    @staticmethod
+    def _merge_series(target, source) -> None:
+        for metric_id, series in source.items():
+            existing = target.get(metric_id)
+            if existing is None:
+                target[metric_id] = series
+            else:
+                existing.merge(series)
+
+    def _calculate_statistics(self, statistics) -> []:
+        if not self.series_kinds:
+            return [datum for stat in statistics.values() for datum in stat.to_reprs(self.max_values_per_datum)]
+        # Sink merging data of several reporters needs to tell counters and gauges from statistics
+        data = []
+        for key, stat in statistics.items():
+            kind = key[0] if isinstance(key, tuple) else None
+            for datum in stat.to_reprs(self.max_values_per_datum):
+                if kind is not None:
+                    datum['Kind'] = kind
+                data.append(datum)
+        return data
+
+    def _calculate_metrics(self, metrics) -> []:
+        return [datum for metric in metrics.values() for datum in metric.to_reprs(self.max_values_per_datum)]
+
+    def get_namespace(self) -> str:
+        return self.namespace or self.metrics_class.namespace
+
+    def _client(self):
+        if self.sink is not None:
+            return self.sink
+        self.metrics_class.setup_client()
+        return self.metrics_class.client
+
+    def _batches(self, metric_data) -> list:
+        return self.batcher.batches(metric_data, self.get_namespace())
 
     async def _report(self):
-        CloudWatchAsyncMetrics.setup_client()
+        self._call_hook(self.on_flush_start, self)
+        start = time.perf_counter()
+        client = self._client()
+        # Taken apart from start, as the first flush creates the client
+        lock_start = time.perf_counter()
         async with self.lock:
-            num_metrics = len(self.metrics) + len(self.statistics)
-            metric_data = self._calculate_metrics() + self._calculate_statistics()
-            for n in range(math.ceil(len(metric_data) / CloudWatchAsyncMetricReporter.MAX_METRICS_PER_REPORT)):
-                if CloudWatchAsyncMetrics.debug_level > 1:
-                    log.debug('Namespace: {})'.format(CloudWatchAsyncMetrics.namespace))
-                    log.debug('Metric data: {}'.format(
-                        metric_data[n * CloudWatchAsyncMetricReporter.MAX_METRICS_PER_REPORT:
-                                           (n + 1) * CloudWatchAsyncMetricReporter.MAX_METRICS_PER_REPORT]))
-                response = await CloudWatchAsyncMetrics.client.put_metric_data(
-                    Namespace=CloudWatchAsyncMetrics.namespace,
-                    MetricData=metric_data[n * CloudWatchAsyncMetricReporter.MAX_METRICS_PER_REPORT:
-                                           (n + 1) * CloudWatchAsyncMetricReporter.MAX_METRICS_PER_REPORT]
-                )
-                if response.get('ResponseMetadata', {}).get('HTTPStatusCode') != 200:
-                    log.warning('Failed reporting metrics to CloudWatch; response={}'.format(
-                        response
-                    ))
-            log.debug('Reported {} metrics to CloudWatch'.format(num_metrics))
+            lock_wait = time.perf_counter() - lock_start
+            metrics, statistics = self._swap_buffers()
+        num_metrics = len(metrics) + len(statistics)
+        metric_data = self._calculate_metrics(metrics) + self._calculate_statistics(statistics)
+        self._flushed(num_metrics, metric_data)
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        results = await asyncio.gather(
+            *[self._send_batch(client, batch, semaphore) for batch in self._batches(metric_data)])
+        self.counters.flushed(time.perf_counter() - start, lock_wait, num_metrics)
+        log.debug('Reported {} metrics to CloudWatch in {} batches, {} failed'.format(
+            num_metrics, len(results), results.count(False)))
+        if self.stats_namespace is not None:
+            await self._put_metric_data(client, self.stats_namespace, self._stats_metric_data())
+
+    async def _send_batch(self, client, batch, semaphore) -> bool:
+        namespace = self.get_namespace()
+        async with semaphore:
+            failure = await self._put_metric_data(client, namespace, batch)
+        if failure is not None and self.spool is not None:
+            # Spool does blocking file I/O
+            await asyncio.get_event_loop().run_in_executor(None, self._spool_batch, namespace, batch, failure)
+        return self._batch_done(namespace, batch, failure)
+
+    def _batch_done(self, namespace, batch, failure) -> bool:
+        if failure is not None:
+            self.counters.increment('batches_failed')
+            self._call_hook(self.on_error, namespace, batch, failure)
+            return False
+        self.counters.increment('batches_sent')
+        self.counters.increment('datums_sent', len(batch))
+        self._call_hook(self.on_batch_sent, namespace, batch)
+        return True
+
+    def stats(self) -> dict:
+        stats = self.counters.snapshot()
+        stats['series'] = self._buffered_series()
+        if self.limits is not None:
+            stats['overflows'] = dict(self.limits.overflows)
+        if self.spool is not None:
+            stats['spool_bytes'] = self.spool.size()
+            stats['spool_dropped_batches'] = self.spool.dropped_batches
+        return stats
+
+    def _stats_metric_data(self) -> list:
+        return self.counters.to_metric_data([{'Name': 'Namespace', 'Value': str(self.get_namespace())}])
+
+    @staticmethod
+    def _call_hook(hook, *args) -> None:
+        if hook is None:
+            return
+        try:
+            hook(*args)
+        except Exception as e:
+            log.error('Reporter hook {} failed; error={}'.format(hook, e))
+
+    async def _put_metric_data(self, client, namespace, batch):
+        # Returns None on success, otherwise raised exception or unsuccessful response of the last attempt
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                delay = self.rate_limiter.reserve()
+                if delay:
+                    await asyncio.sleep(delay)
+            failure = await self._attempt_put_metric_data(client, namespace, batch)
+            attempt += 1
+            self._update_rate_limiter(failure)
+            if failure is None or self.retry_policy is None or not self.retry_policy.should_retry(failure, attempt):
+                return failure
+            self.counters.increment('retries')
+            await asyncio.sleep(self.retry_policy.backoff(attempt))
+
+    def _update_rate_limiter(self, failure) -> None:
+        if self.rate_limiter is None:
+            return
+        if failure is None:
+            self.rate_limiter.succeeded()
+        elif is_throttling(failure):
+            self.rate_limiter.throttled()
+
+    async def _attempt_put_metric_data(self, client, namespace, batch):
+        if self.metrics_class.debug_level > 1:
+            log.debug('Namespace: {})'.format(namespace))
+            log.debug('Metric data: {}'.format(batch))
+        try:
+            response = client.put_metric_data(
+                Namespace=namespace,
+                MetricData=batch
+            )
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as e:
+            log.error('Failed reporting {} metrics to CloudWatch; error={}'.format(len(batch), e))
+            return e
+        if response_status(response) != 200:
+            log.warning('Failed reporting {} metrics to CloudWatch; response={}'.format(
+                len(batch), response
+            ))
+            return response
+        return None
+
+    def _spool_batch(self, namespace, batch, failure) -> None:
+        if self.spool is not None and is_transient_failure(failure):
+            self.spool.append(namespace, batch)
+            self.counters.increment('spooled_batches')
+
+    async def replay(self):
+        loop = asyncio.get_event_loop()
+        while not self.stopped:
+            try:
+                entry = await loop.run_in_executor(None, self.spool.peek)
+                if entry is None:
+                    await asyncio.sleep(self.report_interval or 1)
+                    continue
+                namespace, batch = entry
+                failure = await self._put_metric_data(self._client(), namespace, batch)
+                if failure is None or not is_transient_failure(failure):
+                    await loop.run_in_executor(None, self.spool.ack)
+                    await asyncio.sleep(1 / self.spool_replay_rate)
+                else:
+                    # Still failing; give CloudWatch time to recover
+                    await asyncio.sleep(self.report_interval or 1)
+            except asyncio.CancelledError:
+                log.debug('replay cancelled; reporter stopped')
+                return
+            except Exception as e:
+                log.error(e)
 
     async def flush(self):
         await self._report()
 
 
+def is_array(values) -> bool:
+    return numpy is not None and isinstance(values, numpy.ndarray)
+
+
 class MetricDimension:
 
     def __init__(self, dimensions):
@@ -292,16 +897,69 @@ class Metric:
 
 class MetricSeries:
 
-    def __init__(self, name, dimensions=None, unit=None):
+    # PutMetricData accepts at most this many distinct values in a single datum
+    MAX_VALUES_PER_DATUM = 150
+
+    def __init__(self, name, dimensions=None, unit=None, quantizer=None, limits=None):
 
         self.metric = Metric(name=name, dimensions=dimensions, value={}, unit=unit)
         self.metric_id = self.metric.metric_id
+        # Optional callable mapping a value to its bucket representative, bounding number of distinct values
+        self.quantizer = quantizer
+        # Optional CardinalityLimits; only its cap on distinct values applies to a single series
+        self.limits = limits
+        self.max_values = limits.max_values if limits is not None else None
 
     def add_value(self, value) -> None:
+        if self.quantizer is not None:
+            value = self.quantizer(value)
         values = self.metric.value
+        if self.max_values is not None and value not in values and len(values) >= self.max_values:
+            value = self.limits.overflow_value(values, value)
+            if value is None:
+                return
         count = values.get(value, 0) + 1
         values[value] = count
 
+    def merge(self, other) -> None:
+        # Values of other series are quantized already, but e.g. thread-local shards are capped each on their own
+        values = self.metric.value
+        for value, count in other.metric.value.items():
+            if self.max_values is not None and value not in values and len(values) >= self.max_values:
+                value = self._overflow_value(value, count)
+                if value is None:
+                    continue
+            values[value] = values.get(value, 0) + count
+
+    def add_counts(self, values, counts) -> None:
+        for value, count in zip(values, counts):
+            if self.quantizer is not None:
+                value = self.quantizer(value)
+            if self.max_values is not None and value not in self.metric.value and \
+                    len(self.metric.value) >= self.max_values:
+                value = self._overflow_value(value, count)
+                if value is None:
+                    continue
+            self.metric.value[value] = self.metric.value.get(value, 0) + count
+
+    def _overflow_value(self, value, count):
+        # overflow_value counts a single sample
+        self.limits.count('values', count - 1)
+        return self.limits.overflow_value(self.metric.value, value)
+
+    def add_sample(self, value, weight) -> None:
+        # Sampled value standing for `weight` values
+        self.add_counts((value,), (weight,))
+
+    def add_values(self, values) -> None:
+        # Counted by unique values, so quantizer and limits only see each distinct value once
+        if is_array(values):
+            values, counts = numpy.unique(values, return_counts=True)
+            self.add_counts(values.tolist(), counts.tolist())
+        else:
+            counter = Counter(values)
+            self.add_counts(counter.keys(), counter.values())
+
     def to_repr(self) -> Union[dict, None]:
         data = self.metric.to_repr()
         del data['Value']
@@ -313,27 +971,255 @@ class MetricSeries:
 
         return data
 
+    def to_reprs(self, max_values=None) -> list:
+        max_values = max_values or self.MAX_VALUES_PER_DATUM
+        data = self.to_repr()
+        values = data['Values']
+        counts = data['Counts']
+        if len(values) <= max_values:
+            return [data] if values else []
+        # Oversized series is split into several datums sharing name, dimensions and timestamp
+        return [
+            dict(data, Values=values[n:n + max_values], Counts=counts[n:n + max_values])
+            for n in range(0, len(values), max_values)
+        ]
+
 
 class StatisticSeries(MetricSeries):
 
     def __init__(self, name, dimensions=None, unit=None):
 
         super().__init__(name=name, dimensions=dimensions, unit=unit)
-        self.metric.value = []
+        # Only running aggregates are kept, so memory and flush cost don't depend on the number of samples
+        self.metric.value = None
+        self.sample_count = 0
+        self.sum = 0
+        self.minimum = None
+        self.maximum = None
 
     def to_repr(self) -> Union[dict, None]:
-        if len(self.metric.value) == 0:
+        if self.sample_count == 0:
             return None
         data = self.metric.to_repr()
         del data['Value']
         data['StatisticValues'] = {
-            'SampleCount': len(self.metric.value),
-            'Sum': sum(self.metric.value),
-            'Minimum': min(self.metric.value),
-            'Maximum': max(self.metric.value)
+            'SampleCount': self.sample_count,
+            'Sum': self.sum,
+            'Minimum': self.minimum,
+            'Maximum': self.maximum
         }
 
         return data
 
+    def to_reprs(self, max_values=None) -> list:
+        data = self.to_repr()
+        return [data] if data is not None else []
+
+    def add_value(self, value) -> None:
+        if self.sample_count == 0:
+            self.minimum = value
+            self.maximum = value
+        elif value < self.minimum:
+            self.minimum = value
+        elif value > self.maximum:
+            self.maximum = value
+        self.sample_count += 1
+        self.sum += value
+
+    def add_sample(self, value, weight) -> None:
+        self.add_statistics(weight, value * weight, value, value)
+
+    def add_values(self, values) -> None:
+        if len(values) == 0:
+            return
+        if is_array(values):
+            self.add_statistics(values.size, values.sum().item(), values.min().item(), values.max().item())
+        else:
+            self.add_statistics(len(values), sum(values), min(values), max(values))
+
+    def merge(self, other) -> None:
+        self.add_statistics(other.sample_count, other.sum, other.minimum, other.maximum)
+
+    def add_statistics(self, sample_count, sum, minimum, maximum) -> None:
+        if sample_count == 0:
+            return
+        if self.sample_count == 0 or minimum < self.minimum:
+            self.minimum = minimum
+        if self.sample_count == 0 or maximum > self.maximum:
+            self.maximum = maximum
+        self.sample_count += sample_count
+        self.sum += sum
+
+
+class CounterSeries(MetricSeries):
+
+    """
+    Sum of recorded values, reported as a single value
+    """
+
+    KIND = 'counter'
+
+    def __init__(self, name, dimensions=None, unit=None):
+
+        super().__init__(name=name, dimensions=dimensions, unit=unit)
+        self.total = 0
+
+    def add_value(self, value=1) -> None:
+        self.total += value
+
+    def add_sample(self, value, weight) -> None:
+        self.total += value * weight
+
+    def add_values(self, values) -> None:
+        self.total += values.sum().item() if is_array(values) else sum(values)
+
+    def add_counts(self, values, counts) -> None:
+        self.total += sum(value * count for value, count in zip(values, counts))
+
+    def add_statistics(self, sample_count, sum, minimum, maximum) -> None:
+        self.total += sum
+
+    def merge(self, other) -> None:
+        self.total += other.total
+
+    def to_repr(self) -> dict:
+        data = self.metric.to_repr()
+        data['Value'] = self.total
+        return data
+
+    def to_reprs(self, max_values=None) -> list:
+        return [self.to_repr()]
+
+
+class GaugeSeries(MetricSeries):
+
+    """
+    Last, minimum and maximum of recorded values, reported as statistic values of a single sample, so that
+    Average and Sum statistics are the last value
+    """
+
+    KIND = 'gauge'
+
+    def __init__(self, name, dimensions=None, unit=None):
+
+        super().__init__(name=name, dimensions=dimensions, unit=unit)
+        self.last = None
+        self.minimum = None
+        self.maximum = None
+        # When the last value was recorded, so merged gauges keep the latest one
+        self.updated = 0
+
     def add_value(self, value) -> None:
-        self.metric.value.append(value)
+        if self.last is None:
+            self.minimum = value
+            self.maximum = value
+        elif value < self.minimum:
+            self.minimum = value
+        elif value > self.maximum:
+            self.maximum = value
+        self.last = value
+        self.updated = time.monotonic()
+
+    def add_sample(self, value, weight) -> None:
+        # Sampling doesn't change last, minimum nor maximum
+        self.add_value(value)
+
+    def add_values(self, values) -> None:
+        if len(values) == 0:
+            return
+        if is_array(values):
+            self.merge_values(values[-1].item(), values.min().item(), values.max().item(), time.monotonic())
+        else:
+            self.merge_values(values[-1], min(values), max(values), time.monotonic())
+
+    def merge(self, other) -> None:
+        if other.last is not None:
+            self.merge_values(other.last, other.minimum, other.maximum, other.updated)
+
+    def add_statistics(self, sample_count, sum, minimum, maximum) -> None:
+        # Gauge reported by another reporter, whose Sum is its last value; merged in as the latest one
+        self.merge_values(sum / sample_count, minimum, maximum, time.monotonic())
+
+    def merge_values(self, last, minimum, maximum, updated) -> None:
+        if self.last is None or minimum < self.minimum:
+            self.minimum = minimum
+        if self.last is None or maximum > self.maximum:
+            self.maximum = maximum
+        if self.last is None or updated >= self.updated:
+            self.last = last
+            self.updated = updated
+
+    def to_repr(self) -> Union[dict, None]:
+        if self.last is None:
+            return None
+        data = self.metric.to_repr()
+        del data['Value']
+        data['StatisticValues'] = {
+            'SampleCount': 1,
+            'Sum': self.last,
+            'Minimum': self.minimum,
+            'Maximum': self.maximum
+        }
+        return data
+
+    def to_reprs(self, max_values=None) -> list:
+        data = self.to_repr()
+        return [data] if data is not None else []
+
+
+class WindowedSeries:
+
+    """
+    Series split into fixed time windows of `window` seconds. Every window is reported as a datum of its own,
+    timestamped with the window start, so a long report interval still gives fine-grained data points. Windows
+    shorter than a minute are reported as high-resolution metrics.
+    """
+
+    def __init__(self, create_series, window):
+
+        self.create_series = create_series
+        self.window = window
+        # Window start (seconds since epoch) -> series of samples in that window
+        self.windows = {}
+
+    def get_window(self, timestamp=None):
+        now = time.time() if timestamp is None else timestamp.timestamp()
+        start = now - now % self.window
+        series = self.windows.get(start)
+        if series is None:
+            series = self.windows[start] = self.create_series()
+        return series
+
+    def add_value(self, value, timestamp=None) -> None:
+        self.get_window(timestamp).add_value(value)
+
+    def add_sample(self, value, weight, timestamp=None) -> None:
+        self.get_window(timestamp).add_sample(value, weight)
+
+    def add_counts(self, values, counts, timestamp=None) -> None:
+        self.get_window(timestamp).add_counts(values, counts)
+
+    def add_values(self, values, timestamp=None) -> None:
+        self.get_window(timestamp).add_values(values)
+
+    def add_statistics(self, sample_count, sum, minimum, maximum, timestamp=None) -> None:
+        self.get_window(timestamp).add_statistics(sample_count, sum, minimum, maximum)
+
+    def merge(self, other) -> None:
+        for start, series in other.windows.items():
+            existing = self.windows.get(start)
+            if existing is None:
+                self.windows[start] = series
+            else:
+                existing.merge(series)
+
+    def to_reprs(self, max_values=None) -> list:
+        data = []
+        for start, series in sorted(self.windows.items()):
+            timestamp = datetime.datetime.fromtimestamp(start)
+            for datum in series.to_reprs(max_values):
+                datum['Timestamp'] = timestamp
+                if self.window < 60:
+                    datum['StorageResolution'] = 1
+                data.append(datum)
+        return data
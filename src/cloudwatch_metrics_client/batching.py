@@ -0,0 +1,69 @@
+import datetime
+from urllib.parse import quote
+
+# PutMetricData limits: https://docs.aws.amazon.com/AmazonCloudWatch/latest/APIReference/API_PutMetricData.html
+MAX_DATUMS_PER_REQUEST = 1000
+MAX_BYTES_PER_REQUEST = 1024 * 1024
+
+# ISO 8601 timestamp as serialized by botocore, with colons percent-encoded
+TIMESTAMP_SIZE = 32
+
+
+class MetricBatcher:
+
+    def __init__(self, max_datums=MAX_DATUMS_PER_REQUEST, max_bytes=MAX_BYTES_PER_REQUEST):
+
+        self.max_datums = max_datums
+        self.max_bytes = max_bytes
+
+    def batches(self, metric_data, namespace=None) -> list:
+        """
+        Pack datums in order into batches, each holding at most max_datums datums with estimated
+        request body of at most max_bytes. A datum bigger than max_bytes on its own gets a batch of its own.
+        """
+        header_size = self.estimate_header_size(namespace)
+        batches = []
+        batch = []
+        batch_size = header_size
+        for datum in metric_data:
+            datum_size = self.estimate_size(datum, len(batch) + 1)
+            if batch and (len(batch) >= self.max_datums or batch_size + datum_size > self.max_bytes):
+                batches.append(batch)
+                batch = []
+                batch_size = header_size
+                datum_size = self.estimate_size(datum, 1)
+            batch.append(datum)
+            batch_size += datum_size
+        if batch:
+            batches.append(batch)
+        return batches
+
+    @staticmethod
+    def estimate_header_size(namespace) -> int:
+        return len('Action=PutMetricData&Version=2010-08-01&Namespace=') + len(quote(str(namespace or ''), safe=''))
+
+    @classmethod
+    def estimate_size(cls, datum, index=1) -> int:
+        """
+        Estimate size of datum serialized as query protocol parameters, i.e.
+        'MetricData.member.<index>.Values.member.<n>=<value>&' for every leaf value
+        """
+        return cls._estimate(datum, len('MetricData.member.') + len(str(index)) + 1)
+
+    @classmethod
+    def _estimate(cls, value, prefix_size) -> int:
+        # prefix_size includes trailing dot, which is replaced by '=' for leaves, and leaves are joined by '&'
+        if isinstance(value, dict):
+            return sum(cls._estimate(item, prefix_size + len(key) + 1) for key, item in value.items())
+        if isinstance(value, (list, tuple)):
+            prefix_size += len('member.') + 1
+            return sum(cls._estimate(item, prefix_size + len(str(n))) for n, item in enumerate(value, 1))
+        return prefix_size + 1 + cls._estimate_scalar(value)
+
+    @staticmethod
+    def _estimate_scalar(value) -> int:
+        if isinstance(value, str):
+            return len(quote(value, safe=''))
+        if isinstance(value, datetime.datetime):
+            return TIMESTAMP_SIZE
+        return len(str(value)) + 2
@@ -1,25 +1,68 @@
 import datetime
 import functools
 import logging
-import math
+import os
+import queue
 import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 
 import boto3
+from botocore.config import Config
 
-from cloudwatch_metrics_client.aiocloudwatch import CloudWatchAsyncMetrics, Metric, MetricSeries, StatisticSeries
+from cloudwatch_metrics_client.aiocloudwatch import CloudWatchAsyncMetrics, CloudWatchAsyncMetricReporter, \
+    MetricHandle, TIME_UNITS, perf_counter_ns
+from cloudwatch_metrics_client.coalescing import SendCoalescer
+from cloudwatch_metrics_client.errors import is_transient_failure, response_status
 
 log = logging.getLogger(__name__.split('.')[0])
 
 
 class CloudWatchSyncMetrics(CloudWatchAsyncMetrics):
 
+    # Not inherited: compression is enabled for sync and async client separately
+    compressor = None
+    coalescer_class = SendCoalescer
+    coalescer = None
+    # Client created by setup_client, as opposed to one given with with_client
+    own_client = None
+
     @classmethod
-    def setup_client(cls):
+    def setup_client(cls, max_pool_connections=None):
         if cls.client is None:
-            cls.client = boto3.client('cloudwatch')
+            if max_pool_connections is not None:
+                # boto3 clients are thread-safe; sender threads share one client with a large enough pool
+                cls.client = boto3.client('cloudwatch', config=Config(max_pool_connections=max_pool_connections))
+            else:
+                cls.client = boto3.client('cloudwatch')
+            cls.own_client = cls.client
+            cls._register_compressor()
+        elif max_pool_connections is not None:
+            try:
+                pool_size = cls.client.meta.config.max_pool_connections
+            except AttributeError:
+                pool_size = None
+            if isinstance(pool_size, int) and pool_size < max_pool_connections:
+                log.warning('CloudWatch client has {} pooled connections for {} sender threads; create it with '
+                            'Config(max_pool_connections={}) before it is used'.format(
+                                pool_size, max_pool_connections, max_pool_connections))
         return cls
 
+    @classmethod
+    def _after_fork(cls):
+        # boto3 clients aren't fork-safe: their pooled connections would be shared with the parent process
+        if cls.client is not None:
+            if cls.client is cls.own_client:
+                cls.client = None
+            else:
+                log.warning('CloudWatch client given with with_client is used in forked process; '
+                            'give it a new one there')
+        cls.own_client = None
+        if cls.coalescer is not None:
+            cls.coalescer.after_fork()
+
     @classmethod
     def put_metric(cls, **metric_data):
         try:
@@ -28,9 +71,44 @@ class CloudWatchSyncMetrics(CloudWatchAsyncMetrics):
             return False
 
     @classmethod
-    def put_statistic(cls, name, dimensions, value, unit=None):
+    def put_statistic(cls, name, dimensions, value, unit=None, weight=None):
+        try:
+            return cls.reporter.put_statistic(name, dimensions, value, unit, weight)
+        except AttributeError:
+            return False
+
+    @classmethod
+    def put_metric_values(cls, name, values, dimensions=None, unit=None):
+        try:
+            return cls.reporter.put_metric_values(name, values, dimensions, unit)
+        except AttributeError:
+            return False
+
+    @classmethod
+    def put_statistic_values(cls, name, dimensions, values, unit=None):
+        try:
+            return cls.reporter.put_statistic_values(name, dimensions, values, unit)
+        except AttributeError:
+            return False
+
+    @classmethod
+    def put_many(cls, metrics=(), statistics=(), unit=None):
         try:
-            return cls.reporter.put_statistic(name, dimensions, value, unit)
+            return cls.reporter.put_many(metrics, statistics, unit)
+        except AttributeError:
+            return False
+
+    @classmethod
+    def increment(cls, name, dimensions=None, value=1, unit='Count'):
+        try:
+            return cls.reporter.increment(name, dimensions, value, unit)
+        except AttributeError:
+            return False
+
+    @classmethod
+    def set_gauge(cls, name, dimensions, value, unit=None):
+        try:
+            return cls.reporter.set_gauge(name, dimensions, value, unit)
         except AttributeError:
             return False
 
@@ -40,6 +118,8 @@ class CloudWatchSyncMetrics(CloudWatchAsyncMetrics):
         try:
             if metric_data.get('Timestamp') is None:
                 metric_data['Timestamp'] = datetime.datetime.now()
+            if cls.coalescer is not None:
+                return cls.coalescer.submit(cls.namespace, {**metric_data})
             cls.setup_client()
             return cls.client.put_metric_data(
                 Namespace=cls.namespace,
@@ -49,18 +129,27 @@ class CloudWatchSyncMetrics(CloudWatchAsyncMetrics):
             return False
 
     @classmethod
-    def monitored_task(cls, func, name='transaction'):
+    def monitored_task(cls, func, name='transaction', unit=None):
+        if unit is not None:
+            cls._check_timing_unit(unit)
 
         @contextmanager
         def monitor():
-            previous_dimensions = cls.dimensions
-            cls.dimensions = None
-            start = datetime.datetime.now()
-            yield
-            elapsed = datetime.datetime.now() - start
-            cls.put_statistic(
-                    name=name, dimensions=cls.dimensions, value=elapsed.microseconds, unit='Microseconds')
-            cls.dimensions = previous_dimensions
+            token = cls.monitored_dimensions.set(None)
+            weight = cls._sample_weight(name)
+            try:
+                if not weight:
+                    yield
+                    return
+                start = perf_counter_ns()
+                yield
+                elapsed = perf_counter_ns() - start
+                timing_unit = unit or cls.timing_unit
+                cls.put_statistic(
+                        name=name, dimensions=cls.monitored_dimensions.get(), value=elapsed / TIME_UNITS[timing_unit],
+                        unit=timing_unit, weight=weight)
+            finally:
+                cls.monitored_dimensions.reset(token)
 
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
@@ -69,103 +158,449 @@ class CloudWatchSyncMetrics(CloudWatchAsyncMetrics):
         return wrapper
 
 
-class CloudWatchSyncMetricReporter:
+class SyncMetricHandle(MetricHandle):
+
+    def add(self, value) -> None:
+        if self.reporter.sampling:
+            weight = self.reporter.sample_weight(self.name)
+            if not weight:
+                return
+        else:
+            weight = 1
+        with self.reporter.lock:
+            if self.generation != self.reporter.generation:
+                self._bind()
+            if weight == 1:
+                self.series.add_value(value)
+            else:
+                self.series.add_sample(value, weight)
+
+
+class MetricShard:
 
-    MAX_METRICS_PER_REPORT = 20
+    """
+    Buffers of a single thread. Its lock is only contended by the reporter swapping buffers at flush time.
+    """
 
-    def __init__(self, report_interval=30):
+    def __init__(self):
 
+        self.lock = threading.Lock()
         self.metrics = {}
         self.statistics = {}
-        self.report_interval = report_interval
+        self.thread = weakref.ref(threading.current_thread())
+
+    def swap(self) -> tuple:
+        with self.lock:
+            metrics, statistics = self.metrics, self.statistics
+            self.metrics = {}
+            self.statistics = {}
+        return metrics, statistics
+
+
+class CloudWatchSyncMetricReporter(CloudWatchAsyncMetricReporter):
+
+    metrics_class = CloudWatchSyncMetrics
+    handle_class = SyncMetricHandle
+
+    def __init__(self, report_interval=30, send_workers=None, max_pending_batches=100, thread_local_buffers=False,
+                 **kwargs):
+
+        super().__init__(report_interval=report_interval, **kwargs)
         self.timer = None
-        self.report_task = None
+        self.replay_timer = threading.Event()
 
-        self.lock = threading.Lock()
+        # Optionally every thread records into its own shard, which are merged at flush time,
+        # so put_metric / put_statistic don't contend for the reporter lock
+        self.thread_local_buffers = thread_local_buffers
+        self.local = threading.local()
+        self.shards = []
+        # Guards the count of buffered series, which shards add to without holding the reporter lock
+        self.series_lock = threading.Lock()
+
+        # Optional send stage: batches go through a bounded queue to a pool of sender threads,
+        # so a slow endpoint blocks the report thread instead of growing memory
+        self.send_workers = send_workers
+        self.send_queue = queue.Queue(maxsize=max_pending_batches) if send_workers else None
+        self.sender_lock = threading.Lock()
+        self.executor = None
 
-        self.stopped = False
+        _reporters.add(self)
+
+    def _create_lock(self):
+        return threading.Lock()
 
     def run(self):
+        if self.send_workers:
+            self._start_senders()
         if self.report_interval:
             self.report_task = threading.Thread(target=self.report)
             self.report_task.start()
             log.debug('Reporting metrics to CloudWatch every {} sec'.format(self.report_interval))
+        if self.spool is not None:
+            self.replay_timer = threading.Event()
+            self.replay_task = threading.Thread(target=self.replay, daemon=True)
+            self.replay_task.start()
 
     def stop(self):
+        self.stopped = True
         if self.timer is not None:
             self.timer.set()
-        self.stopped = True
+        self.replay_timer.set()
+        self._stop_senders()
+
+    def _fork_locks(self) -> list:
+        # Locks held over fork, so neither buffers nor files are copied into the child half-updated
+        locks = [self.lock]
+        if self.spool is not None:
+            locks.append(self.spool.lock)
+        if getattr(self.sink, 'lock', None) is not None:
+            locks.append(self.sink.lock)
+        return locks
+
+    def _after_fork(self):
+        # Threads don't survive fork and locks might have been copied in any state; buffered metrics belong
+        # to the parent process, which is going to report them, so the child starts empty
+        self.lock = self._create_lock()
+        self.sender_lock = threading.Lock()
+        self.counters.lock = threading.Lock()
+        self.series_lock = threading.Lock()
+        if self.rate_limiter is not None:
+            self.rate_limiter.lock = threading.Lock()
+        if getattr(self.sink, 'lock', None) is not None:
+            self.sink.lock = threading.Lock()
+        self.metrics = {}
+        self.statistics = {}
+        self.local = threading.local()
+        self.shards = []
+        self.generation += 1
+        self.num_series = 0
+        self.idle = False
+        self.wake_reason = None
+        if self.spool is not None:
+            # Only the process that created the spool replays and appends to it, otherwise every batch would be
+            # replayed once per process; batches failed in the child are dropped
+            self.spool.detach()
+            self.spool = None
+        if self.send_queue is not None:
+            self.send_queue = queue.Queue(maxsize=self.send_queue.maxsize)
+        running = self.executor is not None or (self.report_task is not None and not self.stopped)
+        self.executor = None
+        self.report_task = None
+        self.replay_task = None
+        self.timer = None
+        self.replay_timer = threading.Event()
+        if running:
+            self.run()
+
+    def _start_senders(self):
+        with self.sender_lock:
+            if self.executor is not None:
+                return
+            if self.sink is None:
+                self.metrics_class.setup_client(max_pool_connections=self.send_workers)
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.send_workers, thread_name_prefix='cloudwatch-metrics-sender')
+            for _ in range(self.send_workers):
+                self.executor.submit(self._send_worker)
+
+    def _stop_senders(self):
+        with self.sender_lock:
+            if self.executor is None:
+                return
+            # Sentinels are queued after pending batches, so everything already queued is still sent
+            for _ in range(self.send_workers):
+                self.send_queue.put(None)
+            self.executor.shutdown(wait=False)
+            self.executor = None
 
     def put_metric(self, **metric_data):
+        weight = self.sample_weight(metric_data['MetricName']) if self.sampling else 1
+        if not weight:
+            return True
+
+        if self.thread_local_buffers:
+            shard = self._get_shard()
+            with shard.lock:
+                series = self._get_metric_series(metric_data['MetricName'], metric_data.get('Dimensions'),
+                                                 metric_data.get('Unit'), metrics=shard.metrics)
+                self._add_metric_value(series, metric_data, weight)
+            return True
+
         with self.lock:
-            name = metric_data['MetricName']
-            dimensions = metric_data.get('Dimensions')
-            metric_id = Metric.generate_id(name, dimensions)
-            metric = self.metrics.get(metric_id)
-            if metric is None:
-                self.metrics[metric_id] = MetricSeries(name=name, dimensions=dimensions, unit=metric_data.get('Unit'))
-                metric = self.metrics[metric_id]
-            metric.add_value(metric_data['Value'])
+            self._put_metric(metric_data, weight)
 
         return True
 
-    def put_statistic(self, name, dimensions, value, unit=None):
+    def put_statistic(self, name, dimensions, value, unit=None, weight=None):
+        if weight is None:
+            weight = self.sample_weight(name) if self.sampling else 1
+            if not weight:
+                return True
+
+        if self.thread_local_buffers:
+            shard = self._get_shard()
+            with shard.lock:
+                series = self._get_statistic_series(name, dimensions, unit, statistics=shard.statistics)
+                if weight == 1:
+                    series.add_value(value)
+                else:
+                    series.add_sample(value, weight)
+            return True
+
+        with self.lock:
+            self._put_statistic(name, dimensions, value, unit, weight)
+
+        return True
+
+    def increment(self, name, dimensions=None, value=1, unit='Count'):
+        if self.thread_local_buffers:
+            shard = self._get_shard()
+            with shard.lock:
+                self._get_counter_series(name, dimensions, unit, statistics=shard.statistics).add_value(value)
+            return True
+
         with self.lock:
-            metric_id = Metric.generate_id(name, dimensions)
-            stat = self.statistics.get(metric_id)
-            if stat is None:
-                self.statistics[metric_id] = StatisticSeries(name=name, dimensions=dimensions, unit=unit)
-                stat = self.statistics[metric_id]
-            stat.add_value(value)
+            self._get_counter_series(name, dimensions, unit).add_value(value)
+
+        return True
+
+    def set_gauge(self, name, dimensions, value, unit=None):
+        if self.thread_local_buffers:
+            shard = self._get_shard()
+            with shard.lock:
+                self._get_gauge_series(name, dimensions, unit, statistics=shard.statistics).add_value(value)
+            return True
+
+        with self.lock:
+            self._get_gauge_series(name, dimensions, unit).add_value(value)
+
+        return True
+
+    def put_metric_values(self, name, values, dimensions=None, unit=None):
+        with self._buffers() as (metrics, statistics):
+            self._get_metric_series(name, dimensions, unit, metrics=metrics).add_values(values)
+        return True
 
+    def put_statistic_values(self, name, dimensions, values, unit=None):
+        with self._buffers() as (metrics, statistics):
+            self._get_statistic_series(name, dimensions, unit, statistics=statistics).add_values(values)
         return True
 
+    def put_many(self, metrics=(), statistics=(), unit=None):
+        with self._buffers() as (metric_buffer, statistic_buffer):
+            self._put_many(metrics, statistics, unit, metric_buffer, statistic_buffer)
+        return True
+
+    @contextmanager
+    def _buffers(self):
+        # Locked buffers the calling thread records into
+        if self.thread_local_buffers:
+            shard = self._get_shard()
+            with shard.lock:
+                yield shard.metrics, shard.statistics
+        else:
+            with self.lock:
+                yield self.metrics, self.statistics
+
+    def _reserve_series(self, dimensions) -> str:
+        if not self.thread_local_buffers:
+            # Reporter lock is held
+            return super()._reserve_series(dimensions)
+        with self.series_lock:
+            return super()._reserve_series(dimensions)
+
+    def _get_shard(self) -> MetricShard:
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = MetricShard()
+            with self.lock:
+                self.shards.append(shard)
+            self.local.shard = shard
+        return shard
+
+    def _buffered_series(self) -> int:
+        return super()._buffered_series() + sum(len(shard.metrics) + len(shard.statistics) for shard in self.shards)
+
+    def _collect_shards(self, shards, metrics, statistics) -> None:
+        for shard in shards:
+            shard_metrics, shard_statistics = shard.swap()
+            self._merge_series(metrics, shard_metrics)
+            self._merge_series(statistics, shard_statistics)
+            thread = shard.thread()
+            if thread is None or not thread.is_alive():
+                # Thread has finished after it got swapped, so nothing is going to be recorded in its shard
+                with self.lock:
+                    self.shards.remove(shard)
+                shard_metrics, shard_statistics = shard.swap()
+                self._merge_series(metrics, shard_metrics)
+                self._merge_series(statistics, shard_statistics)
+
+    def _wake(self, reason) -> None:
+        self.wake_reason = reason
+        if self.timer is not None:
+            self.timer.set()
+
     def report(self):
+        # Event is set by stop and by early wake-ups; cleared before looking at why, so none of them gets lost
+        self.timer = threading.Event()
+        delay = self._report_delay(True)
         while True:
             try:
-                self.timer = threading.Event()
-                self.stopped = self.timer.wait(self.report_interval)
+                if self.wake_reason is None:
+                    self.timer.wait(delay)
+                self.timer.clear()
                 if self.stopped:
                     log.debug('reporter stopped')
                     return
-                if len(self.metrics) + len(self.statistics) == 0:
-                    log.debug('nothing to report')
-                    continue
-                self._report()
+                flush, delay = self._next_report()
+                if flush:
+                    self._report()
             except Exception as e:
                 log.error(e)
 
-    def _calculate_statistics(self) -> []:
-        statistics = [stat.to_repr() for name, stat in self.statistics.items()]
-        self.statistics = {}
-        return list(filter(None.__ne__, statistics))
-
-    def _calculate_metrics(self) -> []:
-        metrics = [data.to_repr() for name, data in self.metrics.items()]
-        self.metrics = {}
-        return list(filter(None.__ne__, metrics))
-
     def _report(self):
-        CloudWatchSyncMetrics.setup_client()
+        self._call_hook(self.on_flush_start, self)
+        start = time.perf_counter()
+        client = self._client()
+        # Taken apart from start, as the first flush creates the client
+        lock_start = time.perf_counter()
         with self.lock:
-            num_metrics = len(self.metrics) + len(self.statistics)
-            metric_data = self._calculate_metrics() + self._calculate_statistics()
-            for n in range(math.ceil(len(metric_data) / CloudWatchSyncMetricReporter.MAX_METRICS_PER_REPORT)):
-                if CloudWatchSyncMetrics.debug_level > 1:
-                    log.debug('Namespace: {}'.format(CloudWatchSyncMetrics.namespace))
-                    log.debug('Metric data: {}'.format(
-                        metric_data[n * CloudWatchSyncMetricReporter.MAX_METRICS_PER_REPORT:
-                                           (n + 1) * CloudWatchSyncMetricReporter.MAX_METRICS_PER_REPORT]))
-                response = CloudWatchSyncMetrics.client.put_metric_data(
-                    Namespace=CloudWatchSyncMetrics.namespace,
-                    MetricData=metric_data[n * CloudWatchSyncMetricReporter.MAX_METRICS_PER_REPORT:
-                                           (n + 1) * CloudWatchSyncMetricReporter.MAX_METRICS_PER_REPORT]
-                )
-                if response.get('ResponseMetadata', {}).get('HTTPStatusCode') != 200:
-                    log.warning('Failed reporting metrics to CloudWatch; response={}'.format(
-                        response
-                    ))
-            log.debug('Reported {} metrics to CloudWatch'.format(num_metrics))
+            lock_wait = time.perf_counter() - lock_start
+            metrics, statistics = self._swap_buffers()
+            shards = list(self.shards)
+        self._collect_shards(shards, metrics, statistics)
+        num_metrics = len(metrics) + len(statistics)
+        metric_data = self._calculate_metrics(metrics) + self._calculate_statistics(statistics)
+        self._flushed(num_metrics, metric_data)
+        failed = 0
+        for batch in self._batches(metric_data):
+            with self.sender_lock:
+                if self.executor is not None:
+                    self.send_queue.put(batch)
+                    continue
+            if not self._send_batch(client, batch):
+                failed += 1
+        self.counters.flushed(time.perf_counter() - start, lock_wait, num_metrics)
+        log.debug('Reported {} metrics to CloudWatch, {} batches failed'.format(num_metrics, failed))
+        if self.stats_namespace is not None:
+            self._put_metric_data(client, self.stats_namespace, self._stats_metric_data())
+
+    def _send_batch(self, client, batch) -> bool:
+        namespace = self.get_namespace()
+        failure = self._put_metric_data(client, namespace, batch)
+        if failure is not None:
+            self._spool_batch(namespace, batch, failure)
+        return self._batch_done(namespace, batch, failure)
+
+    def _put_metric_data(self, client, namespace, batch):
+        # Returns None on success, otherwise raised exception or unsuccessful response of the last attempt
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                time.sleep(self.rate_limiter.reserve())
+            failure = self._attempt_put_metric_data(client, namespace, batch)
+            attempt += 1
+            self._update_rate_limiter(failure)
+            if failure is None or self.retry_policy is None or not self.retry_policy.should_retry(failure, attempt):
+                return failure
+            self.counters.increment('retries')
+            time.sleep(self.retry_policy.backoff(attempt))
+
+    def _attempt_put_metric_data(self, client, namespace, batch):
+        if self.metrics_class.debug_level > 1:
+            log.debug('Namespace: {}'.format(namespace))
+            log.debug('Metric data: {}'.format(batch))
+        try:
+            response = client.put_metric_data(
+                Namespace=namespace,
+                MetricData=batch
+            )
+        except Exception as e:
+            log.error('Failed reporting {} metrics to CloudWatch; error={}'.format(len(batch), e))
+            return e
+        if response_status(response) != 200:
+            log.warning('Failed reporting {} metrics to CloudWatch; response={}'.format(
+                len(batch), response
+            ))
+            return response
+        return None
+
+    def replay(self):
+        while not self.stopped:
+            try:
+                entry = self.spool.peek()
+                if entry is None:
+                    self.replay_timer.wait(self.report_interval or 1)
+                    continue
+                namespace, batch = entry
+                failure = self._put_metric_data(self._client(), namespace, batch)
+                if failure is None or not is_transient_failure(failure):
+                    self.spool.ack()
+                    self.replay_timer.wait(1 / self.spool_replay_rate)
+                else:
+                    # Still failing; give CloudWatch time to recover
+                    self.replay_timer.wait(self.report_interval or 1)
+            except Exception as e:
+                log.error(e)
+        log.debug('replay stopped')
+
+    def _send_worker(self):
+        while True:
+            batch = self.send_queue.get()
+            try:
+                if batch is None:
+                    return
+                self._send_batch(self._client(), batch)
+            finally:
+                self.send_queue.task_done()
 
     def flush(self):
         self._report()
+        # Wait for batches handed over to sender threads, so flush before shutdown doesn't lose data
+        if self.send_queue is not None:
+            self.send_queue.join()
+
+
+_reporters = weakref.WeakSet()
+_forking_reporters = []
+_forking_locks = []
+
+
+def _before_fork():
+    _forking_reporters.extend(_reporters)
+    # Reporters may share a sink or spool, whose lock must be acquired only once
+    acquired = set()
+    for reporter in _forking_reporters:
+        for lock in reporter._fork_locks():
+            if id(lock) not in acquired:
+                acquired.add(id(lock))
+                _forking_locks.append(lock)
+    for lock in _forking_locks:
+        lock.acquire()
+
+
+def _release_fork_locks():
+    for lock in reversed(_forking_locks):
+        lock.release()
+    _forking_locks.clear()
+
+
+def _after_fork_in_parent():
+    _release_fork_locks()
+    _forking_reporters.clear()
+
+
+def _after_fork_in_child():
+    _release_fork_locks()
+    metrics_classes = {CloudWatchSyncMetrics}
+    for reporter in _forking_reporters:
+        reporter._after_fork()
+        metrics_classes.add(reporter.metrics_class)
+    _forking_reporters.clear()
+    for metrics_class in metrics_classes:
+        metrics_class._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=_before_fork, after_in_parent=_after_fork_in_parent,
+                        after_in_child=_after_fork_in_child)
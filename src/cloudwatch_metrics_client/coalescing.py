@@ -0,0 +1,142 @@
+import asyncio
+import inspect
+import threading
+import time
+from concurrent.futures import Future
+
+from cloudwatch_metrics_client.batching import MetricBatcher
+
+# Seconds a datum may wait for others to share its request
+DEFAULT_LINGER = 0.05
+
+
+class SendCoalescer:
+
+    """
+    Micro-batching of send_metric calls: datums submitted by concurrent callers are merged into PutMetricData
+    requests, sent `linger` seconds after the first of them or as soon as a request is full. Every caller gets a
+    future resolving to the response of the request its datum went with.
+    """
+
+    def __init__(self, send, linger=DEFAULT_LINGER, batcher=None):
+
+        # Callable sending (namespace, metric data)
+        self.send = send
+        self.linger = linger
+        self.batcher = batcher or MetricBatcher()
+        # (namespace, datum, future) waiting to be sent
+        self.pending = []
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def submit(self, namespace, datum) -> Future:
+        future = Future()
+        with self.condition:
+            self.pending.append((namespace, datum, future))
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='cloudwatch-metrics-coalescer', daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return future
+
+    def after_fork(self) -> None:
+        # In a forked child: condition might have been copied held, the thread and callers waiting are the parent's
+        self.condition = threading.Condition()
+        self.pending = []
+        self.thread = None
+
+    def flush(self) -> None:
+        with self.condition:
+            pending, self.pending = self.pending, []
+        self._send(pending)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                deadline = time.monotonic() + self.linger
+                while len(self.pending) < self.batcher.max_datums:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                pending, self.pending = self.pending, []
+            self._send(pending)
+
+    def _send(self, pending) -> None:
+        for namespace, batch, futures in self._batches(pending):
+            try:
+                response = self.send(namespace, batch)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                for future in futures:
+                    future.set_result(response)
+
+    def _batches(self, pending) -> list:
+        # Datums grouped by namespace, in order of submission, and packed into requests along with their futures
+        by_namespace = {}
+        for namespace, datum, future in pending:
+            by_namespace.setdefault(namespace, []).append((datum, future))
+        batches = []
+        for namespace, items in by_namespace.items():
+            offset = 0
+            for batch in self.batcher.batches([datum for datum, _ in items], namespace):
+                batches.append((namespace, batch, [future for _, future in items[offset:offset + len(batch)]]))
+                offset += len(batch)
+        return batches
+
+
+class AsyncSendCoalescer(SendCoalescer):
+
+    """
+    Same for asyncio: futures are asyncio ones and requests are sent from tasks of the running loop
+    """
+
+    def __init__(self, send, linger=DEFAULT_LINGER, batcher=None):
+
+        super().__init__(send, linger, batcher)
+        self.linger_task = None
+        self.tasks = set()
+
+    def submit(self, namespace, datum) -> asyncio.Future:
+        future = asyncio.get_event_loop().create_future()
+        self.pending.append((namespace, datum, future))
+        if len(self.pending) >= self.batcher.max_datums:
+            self._start(self.flush())
+        elif self.linger_task is None:
+            self.linger_task = self._start(self._linger())
+        return future
+
+    async def flush(self) -> None:
+        pending, self.pending = self.pending, []
+        await asyncio.gather(*[self._send_batch(namespace, batch, futures)
+                               for namespace, batch, futures in self._batches(pending)])
+
+    def _start(self, coro) -> asyncio.Task:
+        # Tasks are referenced until done, so they don't get garbage collected half way
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def _linger(self):
+        await asyncio.sleep(self.linger)
+        self.linger_task = None
+        await self.flush()
+
+    async def _send_batch(self, namespace, batch, futures) -> None:
+        try:
+            response = self.send(namespace, batch)
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for future in futures:
+                if not future.done():
+                    future.set_result(response)
@@ -0,0 +1,48 @@
+import gzip
+from urllib.parse import urlencode
+
+# Smaller bodies are sent as they are; gzip wouldn't save enough to pay for itself
+MIN_COMPRESSED_SIZE = 4096
+
+EVENT_NAME = 'before-call.cloudwatch.PutMetricData'
+HANDLER_ID = 'cloudwatch-metrics-client-gzip'
+
+
+def compress_body(params, min_size=MIN_COMPRESSED_SIZE, level=6) -> bool:
+    """
+    Gzip-compress body of serialized PutMetricData request dict in place if it has at least `min_size` bytes
+    """
+    body = params.get('body')
+    if isinstance(body, dict):
+        # Query protocol parameters, not encoded yet
+        body = urlencode(list(body.items()), doseq=True)
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if not isinstance(body, bytes) or len(body) < min_size:
+        return False
+    params['body'] = gzip.compress(body, compresslevel=level)
+    headers = params.setdefault('headers', {})
+    headers['Content-Encoding'] = 'gzip'
+    headers.setdefault('Content-Type', 'application/x-www-form-urlencoded; charset=utf-8')
+    return True
+
+
+class RequestCompressor:
+
+    """
+    botocore event handler compressing PutMetricData request bodies; it runs before the request is signed. Used with
+    aiobotocore clients too: they emit before-call events synchronously and take any value returned by a handler,
+    a coroutine included, for the response of the call, so the handler can't be a coroutine.
+    """
+
+    def __init__(self, min_size=MIN_COMPRESSED_SIZE, level=6):
+
+        self.min_size = min_size
+        self.level = level
+
+    def register(self, client) -> None:
+        client.meta.events.register(EVENT_NAME, self, unique_id=HANDLER_ID)
+
+    def __call__(self, params, **kwargs) -> None:
+        # Must return None, any other value would be taken for the response of the call
+        compress_body(params, self.min_size, self.level)
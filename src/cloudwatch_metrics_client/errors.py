@@ -0,0 +1,41 @@
+# Error codes of CloudWatch API worth trying again later
+TRANSIENT_ERROR_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottledException',
+    'TooManyRequestsException',
+    'RequestLimitExceeded',
+    'LimitExceededException',
+    'ServiceUnavailable',
+    'InternalFailure',
+    'InternalServiceError',
+    'RequestTimeout',
+    'RequestTimeoutException',
+}
+
+
+def response_status(response) -> int:
+    return response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+
+
+def is_transient_failure(failure) -> bool:
+    """
+    Tell whether failed PutMetricData call, given either raised exception or unsuccessful response, could succeed
+    if repeated later: throttling, server side errors and connection problems are, invalid requests are not
+    """
+    response = failure if isinstance(failure, dict) else getattr(failure, 'response', None)
+    if not isinstance(response, dict):
+        # Not an API error, e.g. connection error or timeout
+        return isinstance(failure, Exception)
+    if response.get('Error', {}).get('Code') in TRANSIENT_ERROR_CODES:
+        return True
+    status = response_status(response)
+    return status is None or status >= 500 or status == 429
+
+
+def is_throttling(failure) -> bool:
+    response = failure if isinstance(failure, dict) else getattr(failure, 'response', None)
+    if not isinstance(response, dict):
+        return False
+    return 'Thrott' in (response.get('Error', {}).get('Code') or '') or response_status(response) == 429
@@ -0,0 +1,86 @@
+# Dimensions of series samples over a limit are folded into
+OVERFLOW_DIMENSIONS = {'Overflow': 'true'}
+
+
+class CardinalityLimits:
+
+    """
+    Caps on total number of buffered series (of all kinds, in all buffers of a reporter), dimensions of a series
+    and distinct values of a metric series. Samples over a cap are dropped, or with `fold` folded: into series of the
+    same name with OVERFLOW_DIMENSIONS, resp. into the closest value already in the series. Samples over every cap
+    are counted in `overflows`.
+    """
+
+    def __init__(self, max_series=None, max_dimensions=None, max_values=None, fold=False):
+
+        self.max_series = max_series
+        self.max_dimensions = max_dimensions
+        self.max_values = max_values
+        self.fold = fold
+        self.overflows = {'series': 0, 'dimensions': 0, 'values': 0}
+
+    def exceeded(self, dimensions, num_series) -> str:
+        """
+        Name of limit a new series would exceed, or None
+        """
+        if self.max_dimensions is not None and dimensions and len(dimensions) > self.max_dimensions:
+            return 'dimensions'
+        if self.max_series is not None and num_series >= self.max_series:
+            return 'series'
+        return None
+
+    def count(self, limit, samples=1) -> None:
+        self.overflows[limit] += samples
+
+    def overflow_value(self, values, value):
+        """
+        Value new `value` is folded into in a series already holding max_values `values`, or None to drop it
+        """
+        self.count('values')
+        if not self.fold:
+            return None
+        return min(values, key=lambda existing: abs(existing - value))
+
+
+class LimitedSeries:
+
+    """
+    Stands in for a series over a cardinality limit; counts its samples and passes them to the overflow series
+    if there is one
+    """
+
+    def __init__(self, limits, limit, target=None):
+
+        self.limits = limits
+        self.limit = limit
+        self.target = target
+
+    def add_value(self, value, timestamp=None) -> None:
+        self.limits.count(self.limit)
+        if self.target is not None:
+            self.target.add_value(value, **self._window(timestamp))
+
+    def add_sample(self, value, weight, timestamp=None) -> None:
+        self.limits.count(self.limit)
+        if self.target is not None:
+            self.target.add_sample(value, weight, **self._window(timestamp))
+
+    def add_values(self, values, timestamp=None) -> None:
+        self.limits.count(self.limit, len(values))
+        if self.target is not None:
+            self.target.add_values(values, **self._window(timestamp))
+
+    def add_counts(self, values, counts, timestamp=None) -> None:
+        self.limits.count(self.limit, sum(counts))
+        if self.target is not None:
+            self.target.add_counts(values, counts, **self._window(timestamp))
+
+    def add_statistics(self, sample_count, sum, minimum, maximum, timestamp=None) -> None:
+        self.limits.count(self.limit, sample_count)
+        if self.target is not None:
+            self.target.add_statistics(sample_count, sum, minimum, maximum, **self._window(timestamp))
+
+    @staticmethod
+    def _window(timestamp) -> dict:
+        # Only windowed series take a timestamp
+        return {'timestamp': timestamp} if timestamp is not None else {}
@@ -0,0 +1,43 @@
+import math
+
+
+class SignificantDigitsQuantizer:
+
+    """
+    Round values to a number of significant digits, e.g. 123.456 -> 120.0 with 2 digits.
+    Relative error is at most 0.5 * 10 ** (1 - digits); there are at most 9 * 10 ** (digits - 1) distinct values
+    per decade.
+    """
+
+    def __init__(self, digits=2):
+
+        self.digits = digits
+        self.relative_error = 0.5 * 10 ** (1 - digits)
+
+    def __call__(self, value):
+        if value == 0:
+            return value
+        return round(value, self.digits - 1 - math.floor(math.log10(abs(value))))
+
+
+class LogLinearQuantizer:
+
+    """
+    HDR histogram style buckets: every power of two is split into equal sub-buckets and a value is replaced
+    by the middle of its bucket. Relative error is at most relative_error; there are at most
+    ceil(1 / (2 * relative_error)) distinct values per power of two.
+    """
+
+    def __init__(self, relative_error=0.01):
+
+        self.sub_buckets = math.ceil(1 / (2 * relative_error))
+        self.relative_error = 1 / (2 * self.sub_buckets)
+        self.bucket_width = 0.5 / self.sub_buckets
+
+    def __call__(self, value):
+        if value == 0:
+            return value
+        # abs(mantissa) is in [0.5, 1)
+        mantissa, exponent = math.frexp(value)
+        bucket = min(math.floor((abs(mantissa) - 0.5) / self.bucket_width), self.sub_buckets - 1)
+        return math.copysign(math.ldexp(0.5 + (bucket + 0.5) * self.bucket_width, exponent), value)
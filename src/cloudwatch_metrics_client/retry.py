@@ -0,0 +1,66 @@
+import random
+import threading
+import time
+
+from cloudwatch_metrics_client.errors import is_transient_failure
+
+
+class RetryPolicy:
+
+    """
+    Retries of failed PutMetricData calls with exponential backoff and full jitter: after `n` failed attempts, delay
+    before the next one is drawn uniformly from [0, min(max_delay, base_delay * 2 ** (n - 1))], so clients failing
+    at the same time don't retry in lockstep. Only transient failures are retried.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.1, max_delay=5.0):
+
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, failure, attempt) -> bool:
+        # `attempt` is number of attempts made so far
+        return attempt < self.max_attempts and is_transient_failure(failure)
+
+    def backoff(self, attempt) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class TokenBucket:
+
+    """
+    Limit of requests per second with bursts of up to `burst` requests. Throttling responses halve current rate,
+    successful requests raise it back towards `rate` step by step.
+    """
+
+    def __init__(self, rate, burst=None, min_rate=None):
+
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self.min_rate = min_rate or rate / 16
+        self.current_rate = rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take a token; returns seconds to wait before making the request
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.current_rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.current_rate
+
+    def throttled(self) -> None:
+        with self.lock:
+            self.current_rate = max(self.min_rate, self.current_rate / 2)
+
+    def succeeded(self) -> None:
+        with self.lock:
+            self.current_rate = min(self.rate, self.current_rate + self.rate / 16)
@@ -0,0 +1,34 @@
+import math
+import random
+
+
+class GeometricSampler:
+
+    """
+    Keeps every event with probability `rate`. Instead of drawing a random number for every event, the number of
+    events to skip until the next kept one is drawn from geometric distribution once per kept event, so deciding is
+    just a countdown. Kept events stand for 1 / rate events, which is their `weight`.
+    """
+
+    def __init__(self, rate, seed=None):
+
+        if not 0 < rate <= 1:
+            raise ValueError('Sampling rate must be in (0, 1], got {}'.format(rate))
+        self.rate = rate
+        self.weight = 1 / rate
+        self.random = random.Random(seed)
+        self.log_skip_probability = math.log(1 - rate) if rate < 1 else None
+        self.skip = self._next_skip()
+
+    def sample(self) -> bool:
+        if self.skip > 0:
+            self.skip -= 1
+            return False
+        self.skip = self._next_skip()
+        return True
+
+    def _next_skip(self) -> int:
+        if self.log_skip_probability is None:
+            return 0
+        # Number of failures before first success: floor(ln(U) / ln(1 - p)), U uniform on (0, 1]
+        return int(math.log(1.0 - self.random.random()) / self.log_skip_probability)
@@ -0,0 +1,57 @@
+from cloudwatch_metrics_client.batching import MetricBatcher
+
+# Guess of serialized size of a series' data until the first flush tells better
+INITIAL_BYTES_PER_SERIES = 300
+# Number of datums sizes are estimated from after every flush
+SIZE_SAMPLE = 20
+
+
+class FlushPolicy:
+
+    """
+    Flush scheduling adapting to traffic. Reporter flushes before `report_interval` elapses once buffered series
+    reach `max_series`, their estimated request size reaches `max_bytes` or, with `full_batches`, there is enough of
+    them to fill a whole PutMetricData request. Size of a series is estimated from data sent by previous flush.
+    Every interval nothing has been recorded in is `idle_backoff` times longer than the previous one, up to
+    `max_idle_interval`; first series recorded after that wakes the reporter up to schedule a regular flush.
+    """
+
+    def __init__(self, max_series=None, max_bytes=None, full_batches=True, idle_backoff=2, max_idle_interval=300):
+
+        self.max_series = max_series
+        self.max_bytes = max_bytes
+        self.full_batches = full_batches
+        self.idle_backoff = idle_backoff
+        self.max_idle_interval = max_idle_interval
+        self.bytes_per_series = INITIAL_BYTES_PER_SERIES
+        self.idle_intervals = 0
+
+    def series_threshold(self, batcher) -> int:
+        """
+        Number of series created since last flush at which the next flush starts early, None if there's no limit
+        """
+        limits = []
+        if self.max_series:
+            limits.append(self.max_series)
+        if self.max_bytes:
+            limits.append(self.max_bytes // self.bytes_per_series)
+        if self.full_batches:
+            limits.append(batcher.max_datums)
+            limits.append(batcher.max_bytes // self.bytes_per_series)
+        return max(1, min(limits)) if limits else None
+
+    def flushed(self, num_series, metric_data) -> None:
+        if not num_series or not metric_data:
+            return
+        self.idle_intervals = 0
+        sample = metric_data[:SIZE_SAMPLE]
+        bytes_per_datum = sum(MetricBatcher.estimate_size(datum) for datum in sample) / len(sample)
+        self.bytes_per_series = max(1, int(bytes_per_datum * len(metric_data) / num_series))
+
+    def idle_delay(self, report_interval) -> float:
+        # Delay before checking buffers again after an interval nothing has been recorded in
+        max_delay = max(report_interval, self.max_idle_interval or report_interval)
+        delay = min(max_delay, report_interval * self.idle_backoff ** (self.idle_intervals + 1))
+        if delay < max_delay:
+            self.idle_intervals += 1
+        return delay
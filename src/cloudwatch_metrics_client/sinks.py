@@ -0,0 +1,115 @@
+import json
+import socket
+import sys
+import threading
+
+
+class MetricSink:
+
+    """
+    Destination reporters send aggregated metric data to instead of CloudWatch API client. Sinks mimic
+    `put_metric_data` of boto3 client, so reporters treat both the same way.
+    """
+
+    # Maximum number of distinct values sink accepts in a single datum
+    max_values_per_datum = 150
+    # Whether datums of counters and gauges should be marked with their kind ('Kind': 'counter' or 'gauge')
+    series_kinds = False
+
+    def put_metric_data(self, Namespace, MetricData) -> dict:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class EmbeddedMetricFormatSink(MetricSink):
+
+    """
+    Write metric data as CloudWatch Embedded Metric Format (EMF) log events, one JSON line per datum, for
+    CloudWatch agent or Lambda / ECS log drivers to ship them out of band. No API calls are made.
+
+    Datums are converted as follows:
+      - Value -> number
+      - Values and Counts -> {"Values": [...], "Counts": [...], "Max": .., "Min": .., "Count": .., "Sum": ..}
+      - StatisticValues -> {"Max": .., "Min": .., "Count": .., "Sum": ..}
+
+    See https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+    """
+
+    # EMF allows at most 100 values in a metric
+    max_values_per_datum = 100
+
+    def __init__(self, stream=None):
+
+        self.stream = stream if stream is not None else sys.stdout
+        self.lock = threading.Lock()
+
+    @classmethod
+    def to_file(cls, path, buffering=65536):
+        return cls(open(path, 'a', buffering=buffering))
+
+    @classmethod
+    def to_socket(cls, address=('127.0.0.1', 25888)):
+        # CloudWatch agent listens for EMF events on TCP port 25888 by default
+        return cls(socket.create_connection(address).makefile('w', buffering=65536))
+
+    def put_metric_data(self, Namespace, MetricData) -> dict:
+        # The whole batch is written at once, so a buffered stream turns it into few system calls
+        events = ''.join(
+            json.dumps(self.to_emf(Namespace, datum), separators=(',', ':')) + '\n' for datum in MetricData
+        )
+        with self.lock:
+            self.stream.write(events)
+            self.stream.flush()
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    def close(self) -> None:
+        with self.lock:
+            if self.stream not in (sys.stdout, sys.stderr):
+                self.stream.close()
+
+    @staticmethod
+    def to_emf(namespace, datum) -> dict:
+        name = datum['MetricName']
+        dimensions = datum.get('Dimensions') or []
+        metric = {'Name': name}
+        if datum.get('Unit') is not None:
+            metric['Unit'] = datum['Unit']
+        if datum.get('StorageResolution') is not None:
+            metric['StorageResolution'] = datum['StorageResolution']
+        event = {
+            '_aws': {
+                'Timestamp': int(datum['Timestamp'].timestamp() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': namespace,
+                    'Dimensions': [[dimension['Name'] for dimension in dimensions]],
+                    'Metrics': [metric]
+                }]
+            }
+        }
+        for dimension in dimensions:
+            event[dimension['Name']] = dimension['Value']
+
+        if 'Values' in datum:
+            values = datum['Values']
+            counts = datum['Counts']
+            event[name] = {
+                'Values': values,
+                'Counts': counts,
+                'Max': max(values),
+                'Min': min(values),
+                'Count': sum(counts),
+                'Sum': sum(value * count for value, count in zip(values, counts))
+            }
+        elif 'StatisticValues' in datum:
+            statistics = datum['StatisticValues']
+            event[name] = {
+                'Max': statistics['Maximum'],
+                'Min': statistics['Minimum'],
+                'Count': statistics['SampleCount'],
+                'Sum': statistics['Sum']
+            }
+        else:
+            event[name] = datum['Value']
+        return event
@@ -0,0 +1,207 @@
+import datetime
+import json
+import logging
+import os
+import threading
+
+log = logging.getLogger(__name__.split('.')[0])
+
+# CloudWatch doesn't accept data points older than two weeks
+MAX_AGE = datetime.timedelta(days=14)
+
+
+class MetricSpool:
+
+    """
+    Append-only on-disk spool of batches that failed to be sent, so they could be replayed later with their
+    original timestamps. Batches are written as JSON lines into segment files of about `segment_bytes`; when total
+    size exceeds `max_bytes`, oldest segments are dropped. Replay position is stored next to the segment being
+    replayed, so batches are replayed once even across restarts.
+    """
+
+    SEGMENT_PREFIX = 'segment-'
+    SEGMENT_SUFFIX = '.jsonl'
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, segment_bytes=1024 * 1024, fsync=False,
+                 max_age=MAX_AGE):
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.max_age = max_age
+
+        self.lock = threading.Lock()
+        self.writer = None
+        self.writer_path = None
+        self.writer_size = 0
+        # Segment being replayed: its path, batches read from it and replay position
+        self.reader_path = None
+        self.reader_entries = []
+        self.reader_index = 0
+
+        self.dropped_batches = 0
+
+        os.makedirs(directory, exist_ok=True)
+        segments = self._segments()
+        self.sequence = self._sequence(segments[-1]) if segments else 0
+
+    def append(self, namespace, metric_data) -> None:
+        line = json.dumps({
+            'Namespace': namespace,
+            'MetricData': [self._encode(datum) for datum in metric_data]
+        }, separators=(',', ':')) + '\n'
+        with self.lock:
+            if self.writer is None or self.writer_size >= self.segment_bytes:
+                self._rotate()
+            self.writer.write(line)
+            self.writer.flush()
+            if self.fsync:
+                os.fsync(self.writer.fileno())
+            self.writer_size += len(line)
+            self._enforce_max_bytes()
+
+    def peek(self) -> tuple:
+        """
+        Oldest batch not replayed yet as (namespace, metric data), or None if spool is empty
+        """
+        with self.lock:
+            while True:
+                if self.reader_path is None and not self._open_reader():
+                    return None
+                if self.reader_index < len(self.reader_entries):
+                    entry = self.reader_entries[self.reader_index]
+                    metric_data = [self._decode(datum) for datum in entry['MetricData']]
+                    if self._expired(metric_data):
+                        log.warning('Dropping {} spooled metrics older than {}'.format(len(metric_data), self.max_age))
+                        self.dropped_batches += 1
+                        self._advance()
+                        continue
+                    return entry['Namespace'], metric_data
+                self._close_reader()
+
+    def ack(self) -> None:
+        """
+        Mark batch returned by `peek` as replayed
+        """
+        with self.lock:
+            if self.reader_path is not None:
+                self._advance()
+
+    def detach(self) -> None:
+        """
+        Release copies of lock and segment handles in a forked child process; spool stays with the parent
+        """
+        self.lock = threading.Lock()
+        if self.writer is not None:
+            # Appends are flushed under the lock held over fork, so nothing of the parent's is buffered here
+            self.writer.close()
+        self.writer = None
+        self.writer_path = None
+        self.reader_path = None
+        self.reader_entries = []
+        self.reader_index = 0
+
+    def size(self) -> int:
+        with self.lock:
+            return sum(os.path.getsize(path) for path in self._segments())
+
+    def close(self) -> None:
+        with self.lock:
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+
+    def _segments(self) -> list:
+        return sorted(
+            os.path.join(self.directory, name) for name in os.listdir(self.directory)
+            if name.startswith(self.SEGMENT_PREFIX) and name.endswith(self.SEGMENT_SUFFIX)
+        )
+
+    def _sequence(self, path) -> int:
+        return int(os.path.basename(path)[len(self.SEGMENT_PREFIX):-len(self.SEGMENT_SUFFIX)])
+
+    def _rotate(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.sequence += 1
+        self.writer_path = os.path.join(
+            self.directory, '{}{:012d}{}'.format(self.SEGMENT_PREFIX, self.sequence, self.SEGMENT_SUFFIX))
+        self.writer = open(self.writer_path, 'a')
+        self.writer_size = 0
+
+    def _enforce_max_bytes(self) -> None:
+        segments = self._segments()
+        sizes = {path: os.path.getsize(path) for path in segments}
+        total = sum(sizes.values())
+        for path in segments:
+            if total <= self.max_bytes or path == self.writer_path:
+                break
+            dropped = sum(1 for _ in open(path))
+            log.warning('Spool exceeds {} bytes; dropping {} oldest batches'.format(self.max_bytes, dropped))
+            self.dropped_batches += dropped
+            if path == self.reader_path:
+                self._close_reader()
+            else:
+                self._remove(path)
+            total -= sizes[path]
+
+    def _open_reader(self) -> bool:
+        segments = self._segments()
+        if not segments:
+            return False
+        if segments[0] == self.writer_path:
+            # Never replay segment still written to; start a new one instead
+            if self.writer_size == 0:
+                return False
+            self._rotate()
+        path = segments[0]
+        with open(path) as segment:
+            self.reader_entries = [json.loads(line) for line in segment if line.strip()]
+        self.reader_path = path
+        self.reader_index = 0
+        if os.path.exists(path + '.ack'):
+            with open(path + '.ack') as ack:
+                self.reader_index = int(ack.read() or 0)
+        return True
+
+    def _advance(self) -> None:
+        self.reader_index += 1
+        with open(self.reader_path + '.ack', 'w') as ack:
+            ack.write(str(self.reader_index))
+
+    def _close_reader(self) -> None:
+        self._remove(self.reader_path)
+        self.reader_path = None
+        self.reader_entries = []
+        self.reader_index = 0
+
+    @staticmethod
+    def _remove(path) -> None:
+        for name in (path, path + '.ack'):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def _expired(self, metric_data) -> bool:
+        if self.max_age is None:
+            return False
+        for datum in metric_data:
+            timestamp = datum.get('Timestamp')
+            if timestamp is None:
+                continue
+            now = datetime.datetime.now(timestamp.tzinfo)
+            if now - timestamp > self.max_age:
+                return True
+        return False
+
+    @staticmethod
+    def _encode(datum) -> dict:
+        if isinstance(datum.get('Timestamp'), datetime.datetime):
+            return dict(datum, Timestamp=datum['Timestamp'].isoformat())
+        return datum
+
+    @staticmethod
+    def _decode(datum) -> dict:
+        if isinstance(datum.get('Timestamp'), str):
+            return dict(datum, Timestamp=datetime.datetime.fromisoformat(datum['Timestamp']))
+        return datum
@@ -0,0 +1,64 @@
+import datetime
+import threading
+
+# Counter -> name and unit of the metric it is reported as
+COUNTER_METRICS = {
+    'flushes': ('Flushes', 'Count'),
+    'batches_sent': ('BatchesSent', 'Count'),
+    'batches_failed': ('BatchesFailed', 'Count'),
+    'datums_sent': ('DatumsSent', 'Count'),
+    'retries': ('Retries', 'Count'),
+    'spooled_batches': ('SpooledBatches', 'Count'),
+    'early_flushes': ('EarlyFlushes', 'Count'),
+    'flush_seconds': ('FlushDuration', 'Seconds'),
+    'lock_wait_seconds': ('FlushLockWait', 'Seconds'),
+}
+
+
+class ReporterStats:
+
+    """
+    Counters of what a reporter has done since it was created. Updated a few times per flush and per batch only,
+    so recording metrics doesn't pay for them.
+    """
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(COUNTER_METRICS, 0)
+        self.last_flush_seconds = None
+        self.last_flush_series = 0
+        # Counters as of the last to_metric_data call, so metrics are reported as increments
+        self.reported = dict(self.counters)
+
+    def increment(self, counter, value=1) -> None:
+        with self.lock:
+            self.counters[counter] += value
+
+    def flushed(self, seconds, lock_wait_seconds, series) -> None:
+        with self.lock:
+            self.counters['flushes'] += 1
+            self.counters['flush_seconds'] += seconds
+            self.counters['lock_wait_seconds'] += lock_wait_seconds
+            self.last_flush_seconds = seconds
+            self.last_flush_series = series
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.counters, last_flush_seconds=self.last_flush_seconds,
+                        last_flush_series=self.last_flush_series)
+
+    def to_metric_data(self, dimensions) -> list:
+        with self.lock:
+            counters = dict(self.counters)
+            increments = {counter: value - self.reported[counter] for counter, value in counters.items()}
+            self.reported = counters
+            series = self.last_flush_series
+        now = datetime.datetime.now()
+        metric_data = [
+            {'MetricName': name, 'Dimensions': dimensions, 'Timestamp': now, 'Value': increments[counter], 'Unit': unit}
+            for counter, (name, unit) in COUNTER_METRICS.items()
+        ]
+        metric_data.append(
+            {'MetricName': 'Series', 'Dimensions': dimensions, 'Timestamp': now, 'Value': series, 'Unit': 'Count'})
+        return metric_data
@@ -0,0 +1,128 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+from mock import MagicMock
+
+from src.cloudwatch_metrics_client.aggregator import AggregatorSink, CloudWatchMetricAggregator, \
+    CloudWatchSyncMetrics, CloudWatchSyncMetricReporter
+from src.cloudwatch_metrics_client.limits import CardinalityLimits
+
+
+class TestAggregator(TestCase):
+
+    def setUp(self) -> None:
+
+        self.sent = []
+
+        def put_data(**kwargs):
+            self.sent.append(kwargs)
+            return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+        CloudWatchSyncMetrics.client = MagicMock()
+        CloudWatchSyncMetrics.client.put_metric_data = put_data
+        CloudWatchSyncMetrics.with_namespace('test_namespace')
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'metrics.sock')
+        self.aggregator = CloudWatchMetricAggregator(self.path, report_interval=None).start()
+
+    def tearDown(self) -> None:
+        self.aggregator.stop()
+        self.directory.cleanup()
+
+    def wait_for(self, condition):
+        deadline = time.time() + 2
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_merge_workers(self):
+
+        workers = [CloudWatchSyncMetricReporter(report_interval=None, sink=AggregatorSink(self.path))
+                   for _ in range(3)]
+        for n, worker in enumerate(workers):
+            worker.put_metric(MetricName='latency', Dimensions={'Host': 'a'}, Value=10)
+            worker.put_metric(MetricName='latency', Dimensions={'Host': 'a'}, Value=n)
+            worker.put_statistic('duration', None, n + 1, 'Seconds')
+            worker.flush()
+
+        reporter = self.aggregator.get_reporter('test_namespace')
+        self.wait_for(lambda: reporter.statistics and reporter.statistics['duration?'].sample_count == 3)
+        self.aggregator.flush()
+
+        self.assertEqual(1, len(self.sent))
+        self.assertEqual('test_namespace', self.sent[0]['Namespace'])
+        latency, duration = self.sent[0]['MetricData']
+        self.assertListEqual([{'Name': 'Host', 'Value': 'a'}], latency['Dimensions'])
+        self.assertDictEqual({10: 3, 0: 1, 1: 1, 2: 1}, dict(zip(latency['Values'], latency['Counts'])))
+        self.assertDictEqual({'SampleCount': 3, 'Sum': 6, 'Minimum': 1, 'Maximum': 3}, duration['StatisticValues'])
+        self.assertEqual('Seconds', duration['Unit'])
+
+    def test_counters_and_gauges(self):
+
+        workers = [CloudWatchSyncMetricReporter(report_interval=None, sink=AggregatorSink(self.path))
+                   for _ in range(2)]
+        for n, worker in enumerate(workers):
+            worker.increment('requests', {'Service': 'api'}, 10 + n)
+            worker.set_gauge('queue_depth', None, 5 - 2 * n)
+            worker.flush()
+
+        reporter = self.aggregator.get_reporter('test_namespace')
+        self.wait_for(lambda: len(reporter.statistics) == 2 and
+                      reporter.statistics[('counter', 'requests?Service=api')].total == 21)
+        self.aggregator.flush()
+
+        requests, queue_depth = self.sent[0]['MetricData']
+        self.assertEqual(21, requests['Value'])
+        self.assertNotIn('Kind', requests)
+        self.assertDictEqual({'SampleCount': 1, 'Sum': 3, 'Minimum': 3, 'Maximum': 5}, queue_depth['StatisticValues'])
+
+    def test_windows_and_limits(self):
+
+        limits = CardinalityLimits(max_series=1, fold=True)
+        aggregator = CloudWatchMetricAggregator(self.path + '.limited', report_interval=None, time_window=60,
+                                                limits=limits)
+        timestamp = time.time()
+        aggregator.merge({'Namespace': 'test_namespace', 'MetricData': [
+            {'MetricName': 'latency', 'Dimensions': [{'Name': 'Host', 'Value': str(n)}], 'Timestamp': timestamp,
+             'Values': [1, 2], 'Counts': [1, 1]} for n in range(3)
+        ] + [
+            {'MetricName': 'duration', 'Timestamp': timestamp,
+             'StatisticValues': {'SampleCount': 2, 'Sum': 3, 'Minimum': 1, 'Maximum': 2}},
+            {'MetricName': 'size', 'Timestamp': timestamp, 'Value': 5},
+        ]})
+        aggregator.flush()
+
+        # Samples of two latency series, duration and size
+        self.assertEqual(7, limits.overflows['series'])
+        datums = {datum['MetricName'] + str(datum.get('Dimensions')): datum for datum in self.sent[0]['MetricData']}
+        overflow = [{'Name': 'Overflow', 'Value': 'true'}]
+        self.assertEqual([2, 2], datums['latency' + str(overflow)]['Counts'])
+        self.assertEqual(2, datums['duration' + str(overflow)]['StatisticValues']['SampleCount'])
+        self.assertEqual([5], datums['size' + str(overflow)]['Values'])
+
+    def test_fork(self):
+
+        if not hasattr(os, 'fork'):
+            return
+
+        reporter = CloudWatchSyncMetricReporter(report_interval=None, sink=AggregatorSink(self.path))
+        handle = reporter.metric('forked')
+        handle.add(1)
+
+        pid = os.fork()
+        if pid == 0:
+            # Child starts with empty buffers and working locks
+            status = 1 if reporter.metrics else 0
+            handle.add(2)
+            reporter.flush()
+            os._exit(status)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(0, os.WEXITSTATUS(status))
+        reporter.flush()
+
+        aggregated = self.aggregator.get_reporter('test_namespace')
+        self.wait_for(lambda: aggregated.metrics and sum(aggregated.metrics['forked?'].metric.value.values()) == 2)
+        self.assertDictEqual({1: 1, 2: 1}, aggregated.metrics['forked?'].metric.value)
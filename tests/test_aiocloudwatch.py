@@ -1,10 +1,11 @@
 import asyncio
 import datetime
+import time
 from time import sleep
 
 import aioboto3
 from unittest import TestCase
-from mock import MagicMock
+from mock import MagicMock, patch
 
 from src.cloudwatch_metrics_client.aiocloudwatch import CloudWatchAsyncMetrics, CloudWatchAsyncMetricReporter, MetricDimension, Metric, \
     MetricSeries, StatisticSeries
@@ -54,6 +55,29 @@ class TestAsyncCloudWatchReporter(TestCase):
         self.assertListEqual([0, 1, 2, 3, 4, 10], repr['Values'])
         self.assertListEqual([1, 1, 3, 1, 1, 1], repr['Counts'])
 
+    def test_metric_series_split(self):
+
+        metric_series = MetricSeries(name='Series0', dimensions=self.dimensions)
+        for n in range(10000):
+            metric_series.add_value(n)
+        metric_series.add_value(0)
+        reprs = metric_series.to_reprs()
+        self.assertEqual(67, len(reprs))
+        for repr in reprs:
+            self.assertEqual('Series0', repr['MetricName'])
+            self.assertEqual(2, len(repr['Dimensions']))
+            self.assertEqual(reprs[0]['Timestamp'], repr['Timestamp'])
+            self.assertGreaterEqual(MetricSeries.MAX_VALUES_PER_DATUM, len(repr['Values']))
+            self.assertEqual(len(repr['Values']), len(repr['Counts']))
+        self.assertListEqual(list(range(10000)), [value for repr in reprs for value in repr['Values']])
+        self.assertEqual(10001, sum(count for repr in reprs for count in repr['Counts']))
+
+        metric_series = MetricSeries(name='Series1')
+        metric_series.add_value(1)
+        self.assertEqual(1, len(metric_series.to_reprs()))
+        self.assertIsNone(StatisticSeries(name='Series2').to_repr())
+        self.assertListEqual([], StatisticSeries(name='Series2').to_reprs())
+
     def test_statistic_series(self):
 
         statistic_series = StatisticSeries(name='Series0', dimensions=self.dimensions)
@@ -70,6 +94,27 @@ class TestAsyncCloudWatchReporter(TestCase):
         self.assertEqual(0, repr['StatisticValues']['Minimum'])
         self.assertEqual(10, repr['StatisticValues']['Maximum'])
 
+    def test_statistic_series_running_aggregates(self):
+
+        values = [3.5, -2, 7, 0.25, 7, -2.5, 100, 1]
+        statistic_series = StatisticSeries(name='Series0', dimensions=self.dimensions)
+        self.assertIsNone(statistic_series.to_repr())
+        for value in values:
+            statistic_series.add_value(value)
+        repr = statistic_series.to_repr()
+        self.assertDictEqual({
+            'SampleCount': len(values),
+            'Sum': sum(values),
+            'Minimum': min(values),
+            'Maximum': max(values)
+        }, repr['StatisticValues'])
+        self.assertIsNone(statistic_series.metric.value)
+
+        statistic_series = StatisticSeries(name='Series1')
+        statistic_series.add_value(5)
+        self.assertDictEqual({'SampleCount': 1, 'Sum': 5, 'Minimum': 5, 'Maximum': 5},
+                             statistic_series.to_repr()['StatisticValues'])
+
 
 class TestCloudwatch(TestCase):
 
@@ -194,3 +239,189 @@ class TestCloudwatch(TestCase):
             self.assertEqual(1, self.stored_kwargs['MetricData'][0]['Counts'][0])
 
         asyncio.get_event_loop().run_until_complete(test())
+
+    def test_put_metric_during_slow_flush(self):
+
+        self.stored_kwargs = None
+
+        async def put_data(**kwargs):
+            await asyncio.sleep(0.5)
+            self.stored_kwargs = kwargs
+            return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+        CloudWatchAsyncMetrics.client = MagicMock()
+        CloudWatchAsyncMetrics.client.put_metric_data = put_data
+
+        async def test():
+            await CloudWatchAsyncMetrics.put_metric(MetricName='test_metric_3', Value=1)
+            flush = asyncio.ensure_future(self.reporter.flush())
+            await asyncio.sleep(0.05)
+
+            latencies = []
+            for n in range(20):
+                start = time.perf_counter()
+                await CloudWatchAsyncMetrics.put_metric(MetricName='test_metric_4', Value=n)
+                latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+
+            self.assertFalse(flush.done())
+            self.assertGreater(0.05, max(latencies))
+            await flush
+
+            self.assertEqual(1, len(self.stored_kwargs['MetricData']))
+            self.assertEqual('test_metric_3', self.stored_kwargs['MetricData'][0]['MetricName'])
+            self.assertEqual(['test_metric_4?'], list(self.reporter.metrics.keys()))
+
+        asyncio.get_event_loop().run_until_complete(test())
+
+    def test_concurrent_batches(self):
+
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.sent = []
+
+        async def put_data(**kwargs):
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.2)
+            self.in_flight -= 1
+            if kwargs['MetricData'][0]['MetricName'] == 'metric_0':
+                raise Exception('Throttling')
+            self.sent.append(len(kwargs['MetricData']))
+            if kwargs['MetricData'][0]['MetricName'] == 'metric_20':
+                return {'ResponseMetadata': {'HTTPStatusCode': 400}}
+            return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+        CloudWatchAsyncMetrics.client = MagicMock()
+        CloudWatchAsyncMetrics.client.put_metric_data = put_data
+
+        async def test():
+            reporter = CloudWatchAsyncMetricReporter(report_interval=None, max_concurrent_requests=5,
+                                                     max_metrics_per_report=20)
+            CloudWatchAsyncMetrics.with_reporter(reporter)
+            for n in range(10 * 20):
+                await CloudWatchAsyncMetrics.put_metric(MetricName='metric_{}'.format(n), Value=n)
+            start = time.perf_counter()
+            await reporter.flush()
+            return time.perf_counter() - start
+
+        elapsed = asyncio.get_event_loop().run_until_complete(test())
+        self.assertEqual(5, self.max_in_flight)
+        self.assertGreater(0.7, elapsed)
+        self.assertListEqual([20] * 9, self.sent)
+
+    def test_reporting_high_cardinality_series(self):
+
+        self.sent = []
+
+        async def put_data(**kwargs):
+            self.sent.append(kwargs['MetricData'])
+            return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+        CloudWatchAsyncMetrics.client = MagicMock()
+        CloudWatchAsyncMetrics.client.put_metric_data = put_data
+
+        async def test():
+            reporter = CloudWatchAsyncMetricReporter(report_interval=None, max_metrics_per_report=20)
+            CloudWatchAsyncMetrics.with_reporter(reporter)
+            for n in range(10000):
+                await CloudWatchAsyncMetrics.put_metric(MetricName='latency', Value=n / 10, Dimensions={'Host': 'a'})
+            await CloudWatchAsyncMetrics.put_statistic(name='stat', dimensions=None, value=1)
+            await reporter.flush()
+
+        asyncio.get_event_loop().run_until_complete(test())
+        self.assertListEqual([20, 20, 20, 8], [len(batch) for batch in self.sent])
+        datums = [datum for batch in self.sent for datum in batch if datum['MetricName'] == 'latency']
+        self.assertEqual(67, len(datums))
+        self.assertEqual(10000, sum(len(datum['Values']) for datum in datums))
+        self.assertTrue(all(len(datum['Values']) <= 150 for datum in datums))
+
+    def test_metric_handles(self):
+
+        self.sent = []
+
+        async def put_data(**kwargs):
+            self.sent.extend(kwargs['MetricData'])
+            return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+        CloudWatchAsyncMetrics.client = MagicMock()
+        CloudWatchAsyncMetrics.client.put_metric_data = put_data
+
+        async def test():
+            handle = self.reporter.metric('handle_metric', {'Kind': 'a'}, unit='Count')
+            stat_handle = self.reporter.statistic('handle_stat')
+            handle.add(1)
+            handle.add(1)
+            stat_handle.add(5)
+            await CloudWatchAsyncMetrics.put_metric(MetricName='handle_metric', Dimensions={'Kind': 'a'}, Value=2)
+            self.assertEqual(1, len(self.reporter.metrics))
+            await self.reporter.flush()
+            handle.add(3)
+            stat_handle.add(7)
+            await self.reporter.flush()
+
+        asyncio.get_event_loop().run_until_complete(test())
+        self.assertEqual(4, len(self.sent))
+        self.assertListEqual([1, 2], self.sent[0]['Values'])
+        self.assertListEqual([2, 1], self.sent[0]['Counts'])
+        self.assertEqual('Count', self.sent[0]['Unit'])
+        self.assertEqual(5, self.sent[1]['StatisticValues']['Sum'])
+        self.assertListEqual([3], self.sent[2]['Values'])
+        self.assertEqual(7, self.sent[3]['StatisticValues']['Sum'])
+
+    def test_concurrent_monitored_tasks(self):
+
+        @CloudWatchAsyncMetrics.monitored_task
+        async def task(n):
+            CloudWatchAsyncMetrics.with_monitored_dimension('Request', str(n))
+            await asyncio.sleep(0.01 * (n % 5))
+            await inner(n)
+            # Tasks spawned from a monitored task don't change its dimensions
+            await asyncio.ensure_future(child())
+            CloudWatchAsyncMetrics.with_monitored_dimension('Parity', str(n % 2))
+            await asyncio.sleep(0.01 * (n % 3))
+
+        @CloudWatchAsyncMetrics.monitored_task
+        async def inner(n):
+            CloudWatchAsyncMetrics.with_monitored_dimension('Inner', str(n))
+            await asyncio.sleep(0.01 * (n % 4))
+
+        async def child():
+            CloudWatchAsyncMetrics.with_monitored_dimension('Child', 'yes')
+
+        async def test():
+            await asyncio.gather(*[task(n) for n in range(50)])
+
+        asyncio.get_event_loop().run_until_complete(test())
+        self.assertEqual(100, len(self.reporter.statistics))
+        for n in range(50):
+            outer = self.reporter.statistics['transaction?Request={}&Parity={}'.format(n, n % 2)]
+            self.assertEqual(1, outer.sample_count)
+            self.assertEqual(1, self.reporter.statistics['transaction?Inner={}'.format(n)].sample_count)
+        self.assertIsNone(CloudWatchAsyncMetrics.monitored_dimensions.get())
+
+    def test_monitored_task_timing(self):
+
+        async def task():
+            pass
+
+        async def test():
+            # 1.2 seconds must not be recorded as 200000 microseconds
+            with patch('src.cloudwatch_metrics_client.aiocloudwatch.perf_counter_ns',
+                       side_effect=[1000000000, 2200000000]):
+                await CloudWatchAsyncMetrics.monitored_task(task)()
+            with patch('src.cloudwatch_metrics_client.aiocloudwatch.perf_counter_ns',
+                       side_effect=[1000000000, 2200000000]):
+                await CloudWatchAsyncMetrics.monitored_task(task, name='ms_transaction', unit='Milliseconds')()
+
+        asyncio.get_event_loop().run_until_complete(test())
+        self.assertEqual(1200000, self.reporter.statistics['transaction?'].sum)
+        self.assertEqual('Microseconds', self.reporter.statistics['transaction?'].metric.unit)
+        self.assertEqual(1200, self.reporter.statistics['ms_transaction?'].sum)
+        self.assertEqual('Milliseconds', self.reporter.statistics['ms_transaction?'].metric.unit)
+
+        with self.assertRaises(ValueError):
+            CloudWatchAsyncMetrics.with_timing_unit('Fortnights')
+        # Checked when decorating, not after every call
+        with self.assertRaises(ValueError):
+            CloudWatchAsyncMetrics.monitored_task(task, unit='ms')
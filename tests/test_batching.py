@@ -0,0 +1,70 @@
+import datetime
+from unittest import TestCase
+from urllib.parse import urlencode
+
+from src.cloudwatch_metrics_client.batching import MetricBatcher
+
+
+class TestMetricBatcher(TestCase):
+
+    def setUp(self) -> None:
+        self.datum = {
+            'MetricName': 'latency',
+            'Dimensions': [{'Name': 'Host', 'Value': 'web-1'}, {'Name': 'Path', 'Value': '/api/v1?x=1'}],
+            'Values': [1, 2.5, 300],
+            'Counts': [10, 1, 2],
+            'Unit': 'Milliseconds'
+        }
+
+    def test_estimate_size(self):
+
+        params = {
+            'MetricData.member.7.MetricName': 'latency',
+            'MetricData.member.7.Dimensions.member.1.Name': 'Host',
+            'MetricData.member.7.Dimensions.member.1.Value': 'web-1',
+            'MetricData.member.7.Dimensions.member.2.Name': 'Path',
+            'MetricData.member.7.Dimensions.member.2.Value': '/api/v1?x=1',
+            'MetricData.member.7.Values.member.1': 1,
+            'MetricData.member.7.Values.member.2': 2.5,
+            'MetricData.member.7.Values.member.3': 300,
+            'MetricData.member.7.Counts.member.1': 10,
+            'MetricData.member.7.Counts.member.2': 1,
+            'MetricData.member.7.Counts.member.3': 2,
+            'MetricData.member.7.Unit': 'Milliseconds',
+        }
+        actual = len(urlencode(params)) + 1
+        estimate = MetricBatcher.estimate_size(self.datum, 7)
+        self.assertLessEqual(actual, estimate)
+        self.assertGreater(actual * 1.2, estimate)
+
+        with_timestamp = dict(self.datum, Timestamp=datetime.datetime.now())
+        self.assertLess(estimate, MetricBatcher.estimate_size(with_timestamp, 7))
+
+    def test_batches_by_count(self):
+
+        batcher = MetricBatcher(max_datums=20)
+        batches = batcher.batches([dict(self.datum) for _ in range(45)], 'test_namespace')
+        self.assertListEqual([20, 20, 5], [len(batch) for batch in batches])
+
+        batcher = MetricBatcher()
+        self.assertListEqual([1000, 200], [len(batch) for batch in batcher.batches([self.datum] * 1200)])
+
+    def test_batches_by_size(self):
+
+        datum_size = MetricBatcher.estimate_size(self.datum, 1)
+        max_bytes = MetricBatcher.estimate_header_size('test_namespace') + datum_size * 10
+        batcher = MetricBatcher(max_datums=1000, max_bytes=max_bytes)
+        batches = batcher.batches([self.datum] * 95, 'test_namespace')
+        self.assertEqual(95, sum(len(batch) for batch in batches))
+        for batch in batches:
+            size = MetricBatcher.estimate_header_size('test_namespace') + sum(
+                MetricBatcher.estimate_size(datum, n) for n, datum in enumerate(batch, 1))
+            self.assertLessEqual(size, max_bytes)
+        self.assertLess(9, len(batches))
+
+    def test_oversized_datum(self):
+
+        batcher = MetricBatcher(max_bytes=100)
+        batches = batcher.batches([self.datum, self.datum])
+        self.assertListEqual([1, 1], [len(batch) for batch in batches])
+        self.assertListEqual([], batcher.batches([]))
@@ -0,0 +1,88 @@
+import asyncio
+import unittest
+from unittest import TestCase
+
+from mock import MagicMock
+
+from src.cloudwatch_metrics_client.aiocloudwatch import CloudWatchAsyncMetrics, CloudWatchAsyncMetricReporter, \
+    MetricSeries, StatisticSeries
+from src.cloudwatch_metrics_client.cloudwatch import CloudWatchSyncMetrics, CloudWatchSyncMetricReporter
+from src.cloudwatch_metrics_client.quantization import SignificantDigitsQuantizer
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TestBulkRecording(TestCase):
+
+    def test_metric_values(self):
+
+        series = MetricSeries('test_metric')
+        series.add_values([1, 2, 2, 3, 3, 3])
+        series.add_values((3, 4))
+        self.assertEqual({1: 1, 2: 2, 3: 4, 4: 1}, series.metric.value)
+
+    def test_metric_values_quantized(self):
+
+        series = MetricSeries('test_metric', quantizer=SignificantDigitsQuantizer(1))
+        series.add_values([11, 12, 19, 21])
+        self.assertEqual({10: 2, 20: 2}, series.metric.value)
+
+    def test_statistic_values(self):
+
+        series = StatisticSeries('test_statistic')
+        series.add_value(10)
+        series.add_values([4, 8, 15])
+        series.add_values([])
+        self.assertEqual((4, 37, 4, 15), (series.sample_count, series.sum, series.minimum, series.maximum))
+
+    @unittest.skipIf(numpy is None, 'NumPy not installed')
+    def test_numpy_arrays(self):
+
+        metric = MetricSeries('test_metric')
+        metric.add_values(numpy.array([1.5, 2.5, 1.5]))
+        self.assertEqual({1.5: 2, 2.5: 1}, metric.metric.value)
+        self.assertIsInstance(next(iter(metric.metric.value)), float)
+
+        statistic = StatisticSeries('test_statistic')
+        statistic.add_values(numpy.arange(1, 101))
+        self.assertEqual((100, 5050, 1, 100),
+                         (statistic.sample_count, statistic.sum, statistic.minimum, statistic.maximum))
+        self.assertIsInstance(statistic.sum, int)
+
+    def test_sync_reporter(self):
+
+        for thread_local_buffers in (False, True):
+            reporter = CloudWatchSyncMetricReporter(report_interval=None, thread_local_buffers=thread_local_buffers)
+            CloudWatchSyncMetrics.with_reporter(reporter)
+            CloudWatchSyncMetrics.put_metric_values('test_metric', [1, 1, 2], {'Host': 'a'})
+            CloudWatchSyncMetrics.put_statistic_values('test_statistic', None, [1, 2, 3], 'Seconds')
+            CloudWatchSyncMetrics.put_many(
+                metrics=[('test_metric', {'Host': 'a'}, 2), ('test_metric', {'Host': 'b'}, 5)],
+                statistics=[('test_statistic', None, 10)], unit='Seconds')
+
+            CloudWatchSyncMetrics.client = MagicMock()
+            reporter.flush()
+            metric_data = CloudWatchSyncMetrics.client.put_metric_data.call_args[1]['MetricData']
+            data = {(datum['MetricName'], str(datum.get('Dimensions'))): datum for datum in metric_data}
+            self.assertEqual(3, len(data))
+            host_a = data['test_metric', str([{'Name': 'Host', 'Value': 'a'}])]
+            self.assertEqual({1: 2, 2: 2}, dict(zip(host_a['Values'], host_a['Counts'])))
+            statistics = data['test_statistic', 'None']['StatisticValues']
+            self.assertEqual({'SampleCount': 4, 'Sum': 16, 'Minimum': 1, 'Maximum': 10}, statistics)
+
+    def test_async_reporter(self):
+
+        reporter = CloudWatchAsyncMetricReporter(report_interval=None)
+        CloudWatchAsyncMetrics.with_reporter(reporter)
+
+        async def test():
+            await CloudWatchAsyncMetrics.put_metric_values('test_metric', [1, 1, 2])
+            await CloudWatchAsyncMetrics.put_statistic_values('test_statistic', None, [1, 2, 3])
+            await CloudWatchAsyncMetrics.put_many(metrics=[('test_metric', None, 2)])
+
+        asyncio.get_event_loop().run_until_complete(test())
+        self.assertEqual({1: 2, 2: 2}, reporter.metrics['test_metric?'].metric.value)
+        self.assertEqual(3, reporter.statistics['test_statistic?'].sample_count)
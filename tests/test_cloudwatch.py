@@ -1,11 +1,14 @@
 import datetime
+import os
+import threading
 import time
 
 import boto3
 from unittest import TestCase
-from mock import MagicMock
+from mock import MagicMock, patch
 
 from src.cloudwatch_metrics_client.cloudwatch import CloudWatchSyncMetrics, CloudWatchSyncMetricReporter
+from src.cloudwatch_metrics_client.sinks import EmbeddedMetricFormatSink
 
 
 class TestCloudwatch(TestCase):
@@ -106,3 +109,264 @@ class TestCloudwatch(TestCase):
             self.assertEqual(1, self.stored_kwargs['MetricData'][0]['Counts'][0])
 
         test()
+
+    def test_put_metric_during_slow_flush(self):
+
+        self.stored_kwargs = None
+
+        def put_data(**kwargs):
+            time.sleep(0.5)
+            self.stored_kwargs = kwargs
+            return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+        CloudWatchSyncMetrics.client = MagicMock()
+        CloudWatchSyncMetrics.client.put_metric_data = put_data
+
+        CloudWatchSyncMetrics.put_metric(MetricName='test_metric_3', Value=1)
+        flush = threading.Thread(target=self.reporter.flush)
+        flush.start()
+        time.sleep(0.05)
+
+        latencies = []
+        for n in range(20):
+            start = time.perf_counter()
+            CloudWatchSyncMetrics.put_metric(MetricName='test_metric_4', Value=n)
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+        self.assertTrue(flush.is_alive())
+        self.assertGreater(0.05, max(latencies))
+        flush.join()
+
+        self.assertEqual(1, len(self.stored_kwargs['MetricData']))
+        self.assertEqual('test_metric_3', self.stored_kwargs['MetricData'][0]['MetricName'])
+        self.assertEqual(['test_metric_4?'], list(self.reporter.metrics.keys()))
+
+    def test_parallel_send_workers(self):
+
+        self.sent = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        counter_lock = threading.Lock()
+
+        def put_data(**kwargs):
+            with counter_lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            time.sleep(0.2)
+            with counter_lock:
+                self.in_flight -= 1
+                self.sent.append(len(kwargs['MetricData']))
+            return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+        CloudWatchSyncMetrics.client = MagicMock()
+        CloudWatchSyncMetrics.client.put_metric_data = put_data
+
+        reporter = CloudWatchSyncMetricReporter(report_interval=None, send_workers=4, max_pending_batches=2,
+                                                max_metrics_per_report=20)
+        CloudWatchSyncMetrics.with_reporter(reporter)
+        reporter.run()
+        self.assertEqual(2, reporter.send_queue.maxsize)
+
+        for n in range(8 * 20):
+            CloudWatchSyncMetrics.put_metric(MetricName='metric_{}'.format(n), Value=n)
+        start = time.perf_counter()
+        reporter.flush()
+        elapsed = time.perf_counter() - start
+        reporter.stop()
+
+        self.assertListEqual([20] * 8, self.sent)
+        self.assertEqual(4, self.max_in_flight)
+        self.assertGreater(0.8, elapsed)
+
+        # After stop batches are sent inline
+        CloudWatchSyncMetrics.put_metric(MetricName='metric_x', Value=1)
+        reporter.flush()
+        self.assertEqual(9, len(self.sent))
+
+    def test_metric_handles(self):
+
+        handle = self.reporter.metric('handle_metric', unit='Count')
+        threads = [threading.Thread(target=lambda: [handle.add(n % 3) for n in range(3000)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, len(self.reporter.metrics))
+        self.assertEqual(12000, sum(self.reporter.metrics['handle_metric?'].to_repr()['Counts']))
+
+        self.reporter._swap_buffers()
+        handle.add(7)
+        self.assertListEqual([7], self.reporter.metrics['handle_metric?'].to_repr()['Values'])
+
+    def test_concurrent_sync_monitored_tasks(self):
+
+        @CloudWatchSyncMetrics.monitored_task
+        def task(n):
+            CloudWatchSyncMetrics.with_monitored_dimension('Request', str(n))
+            time.sleep(0.01 * (n % 5))
+            CloudWatchSyncMetrics.with_monitored_dimension('Parity', str(n % 2))
+
+        threads = [threading.Thread(target=task, args=(n,)) for n in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(20, len(self.reporter.statistics))
+        for n in range(20):
+            stat = self.reporter.statistics['transaction?Request={}&Parity={}'.format(n, n % 2)]
+            self.assertEqual(1, stat.sample_count)
+
+    def test_sync_decorator_timing_unit(self):
+
+        @CloudWatchSyncMetrics.monitored_task
+        def task():
+            time.sleep(0.1)
+
+        CloudWatchSyncMetrics.with_timing_unit('Seconds')
+        try:
+            task()
+        finally:
+            CloudWatchSyncMetrics.with_timing_unit('Microseconds')
+        stat = self.reporter.statistics['transaction?'].to_repr()
+        self.assertEqual('Seconds', stat['Unit'])
+        self.assertLess(0.1, stat['StatisticValues']['Sum'])
+        self.assertGreater(0.15, stat['StatisticValues']['Sum'])
+
+    def test_report_loop_flushes_thread_local_buffers(self):
+
+        self.sent = []
+
+        def put_data(**kwargs):
+            self.sent.extend(kwargs['MetricData'])
+            return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+        CloudWatchSyncMetrics.client = MagicMock()
+        CloudWatchSyncMetrics.client.put_metric_data = put_data
+
+        reporter = CloudWatchSyncMetricReporter(report_interval=0.1, thread_local_buffers=True)
+        CloudWatchSyncMetrics.with_reporter(reporter)
+        reporter.run()
+        try:
+            thread = threading.Thread(target=lambda: CloudWatchSyncMetrics.put_metric(MetricName='sharded', Value=1))
+            thread.start()
+            thread.join()
+            # Data is in the thread's shard only
+            self.assertEqual(0, len(reporter.metrics))
+            for _ in range(50):
+                if self.sent:
+                    break
+                time.sleep(0.02)
+        finally:
+            reporter.stop()
+        self.assertEqual(['sharded'], [datum['MetricName'] for datum in self.sent])
+
+    def test_monitored_task_invalid_unit(self):
+
+        def task():
+            return 1
+
+        with self.assertRaises(ValueError):
+            CloudWatchSyncMetrics.monitored_task(task, unit='ms')
+        self.assertEqual(1, CloudWatchSyncMetrics.monitored_task(task, unit='Milliseconds')())
+
+    def test_thread_local_buffers(self):
+
+        self.sent = []
+
+        def put_data(**kwargs):
+            self.sent.extend(kwargs['MetricData'])
+            return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+        CloudWatchSyncMetrics.client = MagicMock()
+        CloudWatchSyncMetrics.client.put_metric_data = put_data
+
+        reporter = CloudWatchSyncMetricReporter(report_interval=None, thread_local_buffers=True)
+        CloudWatchSyncMetrics.with_reporter(reporter)
+
+        def record():
+            for n in range(5000):
+                CloudWatchSyncMetrics.put_metric(MetricName='sharded', Value=n % 10)
+                CloudWatchSyncMetrics.put_statistic('sharded_stat', {'Kind': 'x'}, n)
+
+        threads = [threading.Thread(target=record) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        # Flush while threads are still recording
+        reporter.flush()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(0, len(reporter.metrics))
+        reporter.flush()
+
+        # Shards of finished threads are dropped
+        self.assertEqual(0, len(reporter.shards))
+        self.assertEqual(0, reporter._buffered_series())
+        self.assertEqual(40000, sum(sum(datum['Counts']) for datum in self.sent if datum['MetricName'] == 'sharded'))
+        stats = [datum['StatisticValues'] for datum in self.sent if datum['MetricName'] == 'sharded_stat']
+        self.assertEqual(40000, sum(stat['SampleCount'] for stat in stats))
+        self.assertEqual(8 * sum(range(5000)), sum(stat['Sum'] for stat in stats))
+        self.assertEqual(4999, max(stat['Maximum'] for stat in stats))
+
+    def test_fork_resets_client_and_locks(self):
+
+        if not hasattr(os, 'fork'):
+            return
+
+        CloudWatchSyncMetrics.client = None
+        CloudWatchSyncMetrics.setup_client()
+        client = CloudWatchSyncMetrics.client
+        reporter = CloudWatchSyncMetricReporter(report_interval=None, max_requests_per_second=10)
+        emf_reporter = CloudWatchSyncMetricReporter(report_interval=None, sink=EmbeddedMetricFormatSink())
+
+        # Held by this thread over fork, as if another thread was using them
+        reporter.rate_limiter.lock.acquire()
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            if CloudWatchSyncMetrics.client is not None:
+                status |= 1
+            for lock in (reporter.rate_limiter.lock, reporter.counters.lock, emf_reporter.sink.lock):
+                if not lock.acquire(timeout=1):
+                    status |= 2
+            os._exit(status)
+        reporter.rate_limiter.lock.release()
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(0, os.WEXITSTATUS(status))
+        self.assertIs(client, CloudWatchSyncMetrics.client)
+
+    def test_small_client_pool_warning(self):
+
+        CloudWatchSyncMetrics.client = MagicMock()
+        CloudWatchSyncMetrics.client.meta.config.max_pool_connections = 10
+        with patch('src.cloudwatch_metrics_client.cloudwatch.log') as log:
+            CloudWatchSyncMetrics.setup_client(max_pool_connections=16)
+            self.assertIn('10 pooled connections for 16 sender threads', log.warning.call_args[0][0])
+
+            log.reset_mock()
+            CloudWatchSyncMetrics.client.meta.config.max_pool_connections = 16
+            CloudWatchSyncMetrics.setup_client(max_pool_connections=16)
+            log.warning.assert_not_called()
+
+    def test_fork_with_shared_sink(self):
+
+        if not hasattr(os, 'fork'):
+            return
+
+        sink = EmbeddedMetricFormatSink()
+        reporters = [CloudWatchSyncMetricReporter(report_interval=None, sink=sink) for _ in range(2)]
+
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if sink.lock.acquire(timeout=1) else 1)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(0, os.WEXITSTATUS(status))
+        # Released in the parent
+        self.assertTrue(sink.lock.acquire(timeout=1))
+        sink.lock.release()
+        for reporter in reporters:
+            self.assertTrue(reporter.lock.acquire(timeout=1))
+            reporter.lock.release()
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+from unittest import TestCase
+
+from mock import MagicMock
+
+from src.cloudwatch_metrics_client.aiocloudwatch import CloudWatchAsyncMetrics
+from src.cloudwatch_metrics_client.cloudwatch import CloudWatchSyncMetrics
+
+OK = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+
+class TestSendCoalescing(TestCase):
+
+    def setUp(self) -> None:
+
+        self.requests = []
+
+        def put_data(**kwargs):
+            self.requests.append(kwargs)
+            return OK
+
+        self.client = MagicMock()
+        self.client.put_metric_data = put_data
+
+    def tearDown(self) -> None:
+
+        CloudWatchSyncMetrics.coalescer = None
+        CloudWatchAsyncMetrics.coalescer = None
+
+    def test_sync_concurrent_callers(self):
+
+        CloudWatchSyncMetrics.with_client(self.client).with_namespace('test_namespace').with_send_coalescing(linger=0.1)
+
+        futures = []
+
+        def send(n):
+            futures.append(CloudWatchSyncMetrics.send_metric(MetricName='test_metric', Value=n))
+
+        threads = [threading.Thread(target=send, args=(n,)) for n in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([OK] * 20, [future.result(timeout=2) for future in futures])
+        self.assertEqual(1, len(self.requests))
+        self.assertEqual('test_namespace', self.requests[0]['Namespace'])
+        self.assertEqual(set(range(20)), {datum['Value'] for datum in self.requests[0]['MetricData']})
+
+    def test_sync_full_batch_sent_without_linger(self):
+
+        CloudWatchSyncMetrics.with_client(self.client).with_namespace('test_namespace').with_send_coalescing(
+            linger=10, max_datums=5)
+
+        start = time.monotonic()
+        futures = [CloudWatchSyncMetrics.send_metric(MetricName='test_metric', Value=n) for n in range(5)]
+        for future in futures:
+            future.result(timeout=2)
+        self.assertGreater(5, time.monotonic() - start)
+        self.assertEqual(1, len(self.requests))
+
+    def test_sync_failure(self):
+
+        self.client.put_metric_data = MagicMock(side_effect=ConnectionError())
+        CloudWatchSyncMetrics.with_client(self.client).with_namespace('test_namespace').with_send_coalescing(linger=0)
+
+        future = CloudWatchSyncMetrics.send_metric(MetricName='test_metric', Value=1)
+        self.assertIsInstance(future.exception(timeout=2), ConnectionError)
+
+    def test_async(self):
+
+        async def put_data(**kwargs):
+            self.requests.append(kwargs)
+            return OK
+
+        self.client.put_metric_data = put_data
+        CloudWatchAsyncMetrics.with_client(self.client).with_namespace('test_namespace').with_send_coalescing(
+            linger=0.05, max_datums=4)
+
+        async def test():
+            futures = [await CloudWatchAsyncMetrics.send_metric(MetricName='test_metric', Value=n) for n in range(6)]
+            return await asyncio.gather(*futures)
+
+        responses = asyncio.get_event_loop().run_until_complete(test())
+        self.assertEqual([OK] * 6, responses)
+        self.assertEqual([4, 2], [len(request['MetricData']) for request in self.requests])
@@ -0,0 +1,96 @@
+import gzip
+import unittest
+from unittest import TestCase
+from urllib.parse import parse_qs
+
+from mock import MagicMock
+
+from src.cloudwatch_metrics_client.aiocloudwatch import CloudWatchAsyncMetrics
+from src.cloudwatch_metrics_client.cloudwatch import CloudWatchSyncMetrics
+from src.cloudwatch_metrics_client.compression import RequestCompressor, EVENT_NAME, HANDLER_ID, compress_body
+
+try:
+    from botocore.hooks import HierarchicalEmitter
+except ImportError:
+    HierarchicalEmitter = None
+
+
+def request_dict(num_datums):
+    body = {'Action': 'PutMetricData', 'Version': '2010-08-01', 'Namespace': 'test_namespace'}
+    for n in range(1, num_datums + 1):
+        body['MetricData.member.{}.MetricName'.format(n)] = 'test_metric'
+        body['MetricData.member.{}.Value'.format(n)] = str(n)
+    return {'body': body, 'headers': {}, 'url_path': '/', 'method': 'POST'}
+
+
+class TestCompression(TestCase):
+
+    def test_compress_body(self):
+
+        params = request_dict(500)
+        self.assertTrue(compress_body(params, min_size=1024))
+
+        self.assertEqual('gzip', params['headers']['Content-Encoding'])
+        self.assertTrue(params['headers']['Content-Type'].startswith('application/x-www-form-urlencoded'))
+        query = parse_qs(gzip.decompress(params['body']).decode('utf-8'))
+        self.assertEqual(['PutMetricData'], query['Action'])
+        self.assertEqual(['500'], query['MetricData.member.500.Value'])
+
+    def test_small_body_not_compressed(self):
+
+        params = request_dict(1)
+        self.assertFalse(compress_body(params, min_size=1024))
+        self.assertIsInstance(params['body'], dict)
+        self.assertNotIn('Content-Encoding', params['headers'])
+
+    def test_handler_returns_none(self):
+
+        params = request_dict(500)
+        self.assertIsNone(RequestCompressor(min_size=1024)(params=params, model=None))
+        self.assertEqual('gzip', params['headers']['Content-Encoding'])
+
+    def test_async_handler_is_synchronous(self):
+
+        # aiobotocore emits before-call events without awaiting handlers
+        try:
+            CloudWatchAsyncMetrics.with_compression(min_size=1024)
+            params = request_dict(500)
+            self.assertIsNone(CloudWatchAsyncMetrics.compressor(params=params, model=None))
+            self.assertEqual('gzip', params['headers']['Content-Encoding'])
+        finally:
+            CloudWatchAsyncMetrics.compressor = None
+
+    @unittest.skipIf(HierarchicalEmitter is None, 'botocore not installed')
+    def test_emitted_by_botocore(self):
+
+        for facade in (CloudWatchSyncMetrics, CloudWatchAsyncMetrics):
+            client = MagicMock()
+            client.meta.events = HierarchicalEmitter()
+            try:
+                facade.with_client(client).with_compression(min_size=1024)
+                params = request_dict(500)
+                handler, response = client.meta.events.emit_until_response(
+                    EVENT_NAME, model=None, params=params, request_signer=None, context={})
+                self.assertIsNone(response)
+                self.assertEqual('gzip', params['headers']['Content-Encoding'])
+            finally:
+                facade.compressor = None
+                facade.client = None
+
+    def test_registered_on_client(self):
+
+        try:
+            client = MagicMock()
+            CloudWatchSyncMetrics.with_client(client).with_compression(min_size=1024)
+            event, handler = client.meta.events.register.call_args[0]
+            self.assertEqual(EVENT_NAME, event)
+            self.assertIs(CloudWatchSyncMetrics.compressor, handler)
+            self.assertEqual(1024, handler.min_size)
+            self.assertEqual(HANDLER_ID, client.meta.events.register.call_args[1]['unique_id'])
+
+            CloudWatchAsyncMetrics.with_compression()
+            self.assertIsInstance(CloudWatchAsyncMetrics.compressor, CloudWatchAsyncMetrics.compressor_class)
+            self.assertIsNot(CloudWatchAsyncMetrics.compressor, CloudWatchSyncMetrics.compressor)
+        finally:
+            CloudWatchSyncMetrics.compressor = None
+            CloudWatchAsyncMetrics.compressor = None
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+from unittest import TestCase
+
+from mock import MagicMock
+
+from src.cloudwatch_metrics_client.aiocloudwatch import CloudWatchAsyncMetrics, CloudWatchAsyncMetricReporter, \
+    CounterSeries, GaugeSeries
+from src.cloudwatch_metrics_client.cloudwatch import CloudWatchSyncMetrics, CloudWatchSyncMetricReporter
+
+
+class TestCountersAndGauges(TestCase):
+
+    def test_counter_series(self):
+
+        counter = CounterSeries('requests', {'Service': 'api'})
+        counter.add_value()
+        counter.add_value(4)
+        counter.add_values([1, 2])
+        other = CounterSeries('requests', {'Service': 'api'})
+        other.add_value(10)
+        counter.merge(other)
+
+        datum = counter.to_repr()
+        self.assertEqual(18, datum['Value'])
+        self.assertEqual('Count', CounterSeries('requests', unit='Count').to_repr()['Unit'])
+        self.assertEqual({'MetricName', 'Timestamp', 'Value', 'Dimensions'}, set(datum))
+
+    def test_gauge_series(self):
+
+        gauge = GaugeSeries('queue_depth')
+        self.assertEqual([], gauge.to_reprs())
+        for value in [5, 9, 2, 7]:
+            gauge.add_value(value)
+        self.assertEqual({'SampleCount': 1, 'Sum': 7, 'Minimum': 2, 'Maximum': 9}, gauge.to_repr()['StatisticValues'])
+
+        newer = GaugeSeries('queue_depth')
+        newer.add_values([12, 3])
+        gauge.merge(newer)
+        self.assertEqual({'SampleCount': 1, 'Sum': 3, 'Minimum': 2, 'Maximum': 12}, gauge.to_repr()['StatisticValues'])
+
+        # Older gauge merged into a newer one doesn't override its last value
+        newer.merge(GaugeSeries('queue_depth'))
+        older = GaugeSeries('queue_depth')
+        older.add_value(100)
+        older.updated = 0
+        newer.merge(older)
+        self.assertEqual(3, newer.last)
+        self.assertEqual(100, newer.maximum)
+
+    def test_sync_reporter(self):
+
+        for thread_local_buffers in (False, True):
+            CloudWatchSyncMetrics.client = MagicMock()
+            reporter = CloudWatchSyncMetricReporter(report_interval=None, thread_local_buffers=thread_local_buffers)
+            CloudWatchSyncMetrics.with_namespace('test_namespace').with_reporter(reporter)
+
+            def record():
+                handle = reporter.counter('requests', {'Service': 'api'})
+                for _ in range(1000):
+                    CloudWatchSyncMetrics.increment('requests', {'Service': 'api'})
+                    handle.increment()
+
+            threads = [threading.Thread(target=record) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            CloudWatchSyncMetrics.set_gauge('requests', {'Service': 'api'}, 3)
+            CloudWatchSyncMetrics.put_statistic('requests', {'Service': 'api'}, 1)
+            reporter.flush()
+
+            metric_data = CloudWatchSyncMetrics.client.put_metric_data.call_args[1]['MetricData']
+            self.assertEqual(3, len(metric_data))
+            counter = [datum for datum in metric_data if 'Value' in datum][0]
+            self.assertEqual(8000, counter['Value'])
+            self.assertEqual('Count', counter['Unit'])
+
+    def test_async_reporter(self):
+
+        reporter = CloudWatchAsyncMetricReporter(report_interval=None)
+        CloudWatchAsyncMetrics.with_reporter(reporter)
+
+        async def test():
+            await CloudWatchAsyncMetrics.increment('requests')
+            await CloudWatchAsyncMetrics.increment('requests', value=2)
+            await CloudWatchAsyncMetrics.set_gauge('queue_depth', None, 5, 'Count')
+            reporter.gauge('queue_depth', unit='Count').add(4)
+
+        asyncio.get_event_loop().run_until_complete(test())
+        data = reporter._calculate_statistics(reporter.statistics)
+        self.assertEqual(3, data[0]['Value'])
+        self.assertEqual({'SampleCount': 1, 'Sum': 4, 'Minimum': 4, 'Maximum': 5}, data[1]['StatisticValues'])
@@ -0,0 +1,164 @@
+import threading
+from unittest import TestCase
+
+from mock import MagicMock
+
+from src.cloudwatch_metrics_client.cloudwatch import CloudWatchSyncMetrics, CloudWatchSyncMetricReporter
+from src.cloudwatch_metrics_client.limits import CardinalityLimits
+
+
+class TestCardinalityLimits(TestCase):
+
+    def setUp(self) -> None:
+
+        self.sent = []
+
+        def put_data(**kwargs):
+            self.sent.extend(kwargs['MetricData'])
+            return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+        CloudWatchSyncMetrics.client = MagicMock()
+        CloudWatchSyncMetrics.client.put_metric_data = put_data
+
+    def setup_reporter(self, limits, **kwargs):
+        reporter = CloudWatchSyncMetricReporter(report_interval=None, limits=limits, **kwargs)
+        CloudWatchSyncMetrics.with_namespace('test_namespace').with_reporter(reporter)
+        return reporter
+
+    def test_max_series_drop(self):
+
+        limits = CardinalityLimits(max_series=3)
+        reporter = self.setup_reporter(limits)
+        for n in range(10):
+            CloudWatchSyncMetrics.put_metric(MetricName='test_metric', Dimensions={'RequestId': str(n)}, Value=1)
+            CloudWatchSyncMetrics.put_statistic('test_statistic', {'RequestId': str(n)}, 1)
+        # Existing series still accept samples
+        CloudWatchSyncMetrics.put_metric(MetricName='test_metric', Dimensions={'RequestId': '0'}, Value=1)
+
+        # Cap is on series of all kinds together
+        self.assertEqual(2, len(reporter.metrics))
+        self.assertEqual(1, len(reporter.statistics))
+        self.assertEqual(17, limits.overflows['series'])
+        reporter.flush()
+        self.assertEqual(3, len(self.sent))
+
+    def test_max_series_fold(self):
+
+        limits = CardinalityLimits(max_series=3, fold=True)
+        reporter = self.setup_reporter(limits)
+        for n in range(10):
+            CloudWatchSyncMetrics.put_metric(MetricName='test_metric', Dimensions={'RequestId': str(n)}, Value=n)
+        reporter.flush()
+
+        self.assertEqual(4, len(self.sent))
+        overflow = self.sent[-1]
+        self.assertEqual([{'Name': 'Overflow', 'Value': 'true'}], overflow['Dimensions'])
+        self.assertEqual(7, sum(overflow['Counts']))
+        self.assertEqual(7, limits.overflows['series'])
+
+    def test_max_series_thread_local_buffers(self):
+
+        limits = CardinalityLimits(max_series=5)
+        reporter = self.setup_reporter(limits, thread_local_buffers=True)
+
+        def record(thread):
+            for n in range(10):
+                dimensions = {'Key': '{}-{}'.format(thread, n)}
+                CloudWatchSyncMetrics.put_metric(MetricName='test_metric', Dimensions=dimensions, Value=1)
+
+        threads = [threading.Thread(target=record, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        reporter.flush()
+
+        self.assertEqual(5, len(self.sent))
+        self.assertEqual(75, limits.overflows['series'])
+
+        # Counting starts over with every flush
+        record('after')
+        reporter.flush()
+        self.assertEqual(10, len(self.sent))
+
+    def test_fold_keeps_series_kinds_apart(self):
+
+        limits = CardinalityLimits(max_series=1, fold=True)
+        reporter = self.setup_reporter(limits)
+        CloudWatchSyncMetrics.put_statistic('first', None, 1)
+        CloudWatchSyncMetrics.put_statistic('x', {'Key': 'a'}, 7)
+        CloudWatchSyncMetrics.increment('x', {'Key': 'b'}, 100)
+        CloudWatchSyncMetrics.set_gauge('x', {'Key': 'c'}, 42)
+        reporter.flush()
+
+        overflow = {'Counter': None, 'Statistic': None, 'Gauge': None}
+        for datum in self.sent[1:]:
+            self.assertEqual([{'Name': 'Overflow', 'Value': 'true'}], datum['Dimensions'])
+            if 'Value' in datum:
+                overflow['Counter'] = datum['Value']
+            elif datum['StatisticValues']['Sum'] == 7:
+                overflow['Statistic'] = datum['StatisticValues']
+            else:
+                overflow['Gauge'] = datum['StatisticValues']
+        self.assertEqual(100, overflow['Counter'])
+        self.assertEqual({'SampleCount': 1, 'Sum': 7, 'Minimum': 7, 'Maximum': 7}, overflow['Statistic'])
+        self.assertEqual({'SampleCount': 1, 'Sum': 42, 'Minimum': 42, 'Maximum': 42}, overflow['Gauge'])
+        self.assertEqual(4, len(self.sent))
+
+    def test_max_values_thread_local_buffers(self):
+
+        limits = CardinalityLimits(max_values=10)
+        reporter = self.setup_reporter(limits, thread_local_buffers=True)
+
+        def record(thread):
+            for n in range(10):
+                CloudWatchSyncMetrics.put_metric(MetricName='test_metric', Value=thread * 10 + n)
+
+        threads = [threading.Thread(target=record, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        reporter.flush()
+
+        self.assertEqual(1, len(self.sent))
+        self.assertEqual(10, len(self.sent[0]['Values']))
+        self.assertEqual(70, limits.overflows['values'])
+
+    def test_max_dimensions(self):
+
+        limits = CardinalityLimits(max_dimensions=2, fold=True)
+        reporter = self.setup_reporter(limits)
+        dimensions = {'A': '1', 'B': '2', 'C': '3'}
+        CloudWatchSyncMetrics.put_statistic('test_statistic', dimensions, 5)
+        statistic = reporter.statistic('test_statistic', dimensions)
+        statistic.add(7)
+        reporter.flush()
+
+        self.assertEqual(1, len(self.sent))
+        self.assertEqual(2, self.sent[0]['StatisticValues']['SampleCount'])
+        self.assertEqual(2, limits.overflows['dimensions'])
+
+    def test_max_values(self):
+
+        limits = CardinalityLimits(max_values=3)
+        reporter = self.setup_reporter(limits)
+        for value in [1, 2, 3, 4, 5, 1]:
+            CloudWatchSyncMetrics.put_metric(MetricName='test_metric', Value=value)
+        reporter.flush()
+
+        self.assertEqual([1, 2, 3], self.sent[0]['Values'])
+        self.assertEqual([2, 1, 1], self.sent[0]['Counts'])
+        self.assertEqual(2, limits.overflows['values'])
+
+    def test_max_values_fold(self):
+
+        limits = CardinalityLimits(max_values=3, fold=True)
+        reporter = self.setup_reporter(limits, thread_local_buffers=True)
+        for value in [10, 20, 30, 12, 100]:
+            CloudWatchSyncMetrics.put_metric(MetricName='test_metric', Value=value)
+        reporter.flush()
+
+        self.assertEqual([10, 20, 30], self.sent[0]['Values'])
+        self.assertEqual([2, 1, 2], self.sent[0]['Counts'])
+        self.assertEqual(2, limits.overflows['values'])
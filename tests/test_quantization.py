@@ -0,0 +1,72 @@
+import asyncio
+import random
+from unittest import TestCase
+
+from src.cloudwatch_metrics_client.aiocloudwatch import CloudWatchAsyncMetricReporter, MetricSeries
+from src.cloudwatch_metrics_client.quantization import SignificantDigitsQuantizer, LogLinearQuantizer
+
+
+def percentile(values, counts, p):
+    total = sum(counts)
+    seen = 0
+    for value, count in sorted(zip(values, counts)):
+        seen += count
+        if seen >= total * p:
+            return value
+
+
+class TestQuantization(TestCase):
+
+    def setUp(self) -> None:
+        rnd = random.Random(42)
+        self.samples = [rnd.lognormvariate(3, 1.5) for _ in range(100000)]
+
+    def check_quantizer(self, quantizer, max_distinct):
+        quantized = [quantizer(value) for value in self.samples]
+        for value, bucket in zip(self.samples, quantized):
+            self.assertLessEqual(abs(bucket - value), value * quantizer.relative_error * (1 + 1e-9))
+        self.assertGreater(max_distinct, len(set(quantized)))
+
+        series = MetricSeries(name='latency', quantizer=quantizer)
+        for value in self.samples:
+            series.add_value(value)
+        repr = series.to_repr()
+        self.assertEqual(len(self.samples), sum(repr['Counts']))
+        for p in (0.5, 0.9, 0.99, 0.999):
+            exact = percentile(self.samples, [1] * len(self.samples), p)
+            approx = percentile(repr['Values'], repr['Counts'], p)
+            self.assertLessEqual(abs(approx - exact), exact * quantizer.relative_error * (1 + 1e-9))
+
+    def test_significant_digits(self):
+
+        quantizer = SignificantDigitsQuantizer(digits=2)
+        self.assertEqual(0.05, quantizer.relative_error)
+        self.assertEqual(120, quantizer(123.456))
+        self.assertEqual(-0.0013, quantizer(-0.0012987))
+        self.assertEqual(0, quantizer(0))
+        self.check_quantizer(quantizer, 9 * 10 * 6)
+
+    def test_log_linear(self):
+
+        quantizer = LogLinearQuantizer(relative_error=0.01)
+        self.assertEqual(50, quantizer.sub_buckets)
+        self.assertEqual(0.01, quantizer.relative_error)
+        self.assertEqual(0, quantizer(0))
+        self.assertEqual(-quantizer(3.7), quantizer(-3.7))
+        self.assertEqual(quantizer(1000.1), quantizer(1000.2))
+        self.check_quantizer(quantizer, 50 * 20)
+
+    def test_reporter_quantizers(self):
+
+        async def test():
+            reporter = CloudWatchAsyncMetricReporter(report_interval=None,
+                                                     quantizer=SignificantDigitsQuantizer(digits=1))
+            reporter.set_quantizer('raw', None)
+            for value in self.samples[:1000]:
+                await reporter.put_metric(MetricName='latency', Value=value)
+                await reporter.put_metric(MetricName='raw', Value=value)
+            return reporter
+
+        reporter = asyncio.get_event_loop().run_until_complete(test())
+        self.assertGreater(100, len(reporter.metrics['latency?'].to_repr()['Values']))
+        self.assertEqual(1000, len(reporter.metrics['raw?'].to_repr()['Values']))
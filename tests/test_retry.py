@@ -0,0 +1,121 @@
+import asyncio
+from unittest import TestCase
+
+from mock import MagicMock, patch
+
+from src.cloudwatch_metrics_client.aiocloudwatch import CloudWatchAsyncMetrics, CloudWatchAsyncMetricReporter
+from src.cloudwatch_metrics_client.cloudwatch import CloudWatchSyncMetrics, CloudWatchSyncMetricReporter
+from src.cloudwatch_metrics_client.retry import RetryPolicy, TokenBucket
+
+THROTTLED = {'Error': {'Code': 'Throttling'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+INVALID = {'Error': {'Code': 'InvalidParameterValue'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+OK = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+
+class TestRetryPolicy(TestCase):
+
+    def test_full_jitter_backoff(self):
+
+        policy = RetryPolicy(max_attempts=10, base_delay=0.1, max_delay=1)
+        for attempt in range(1, 10):
+            delays = [policy.backoff(attempt) for _ in range(200)]
+            self.assertLessEqual(0, min(delays))
+            self.assertGreaterEqual(min(1, 0.1 * 2 ** (attempt - 1)), max(delays))
+        # Jittered, not the same delay for every client
+        self.assertLess(1, len({policy.backoff(3) for _ in range(10)}))
+
+    def test_should_retry(self):
+
+        policy = RetryPolicy(max_attempts=3)
+        self.assertTrue(policy.should_retry(THROTTLED, 1))
+        self.assertTrue(policy.should_retry(ConnectionError(), 2))
+        self.assertFalse(policy.should_retry(THROTTLED, 3))
+        self.assertFalse(policy.should_retry(INVALID, 1))
+
+
+class TestTokenBucket(TestCase):
+
+    def test_rate(self):
+
+        bucket = TokenBucket(rate=10, burst=2)
+        self.assertEqual(0, bucket.reserve())
+        self.assertEqual(0, bucket.reserve())
+        self.assertAlmostEqual(0.1, bucket.reserve(), delta=0.01)
+        self.assertAlmostEqual(0.2, bucket.reserve(), delta=0.01)
+
+    def test_throttling_halves_rate(self):
+
+        bucket = TokenBucket(rate=16)
+        bucket.throttled()
+        self.assertEqual(8, bucket.current_rate)
+        for _ in range(100):
+            bucket.throttled()
+        self.assertEqual(1, bucket.current_rate)
+        for _ in range(100):
+            bucket.succeeded()
+        self.assertEqual(16, bucket.current_rate)
+
+
+class TestReporterRetry(TestCase):
+
+    def setUp(self) -> None:
+
+        CloudWatchSyncMetrics.with_namespace('test_namespace')
+
+    def test_sync_retry(self):
+
+        CloudWatchSyncMetrics.client = MagicMock()
+        CloudWatchSyncMetrics.client.put_metric_data = MagicMock(side_effect=[THROTTLED, ConnectionError(), OK])
+
+        reporter = CloudWatchSyncMetricReporter(
+            report_interval=None, retry_policy=RetryPolicy(max_attempts=3, base_delay=0.01),
+            max_requests_per_second=100)
+        CloudWatchSyncMetrics.with_reporter(reporter)
+        CloudWatchSyncMetrics.put_metric(MetricName='test_metric', Value=1)
+        with patch('time.sleep') as sleep:
+            reporter.flush()
+
+        self.assertEqual(3, CloudWatchSyncMetrics.client.put_metric_data.call_count)
+        self.assertEqual(2, len([call for call in sleep.call_args_list if call[0][0] > 0]))
+
+    def test_sync_no_retry_of_invalid_request(self):
+
+        CloudWatchSyncMetrics.client = MagicMock()
+        CloudWatchSyncMetrics.client.put_metric_data = MagicMock(return_value=INVALID)
+
+        reporter = CloudWatchSyncMetricReporter(report_interval=None, retry_policy=RetryPolicy(max_attempts=3))
+        CloudWatchSyncMetrics.with_reporter(reporter)
+        CloudWatchSyncMetrics.put_metric(MetricName='test_metric', Value=1)
+        reporter.flush()
+
+        self.assertEqual(1, CloudWatchSyncMetrics.client.put_metric_data.call_count)
+
+    def test_async_retry(self):
+
+        calls = []
+
+        async def put_data(**kwargs):
+            calls.append(kwargs)
+            return THROTTLED if len(calls) < 3 else OK
+
+        CloudWatchAsyncMetrics.client = MagicMock()
+        CloudWatchAsyncMetrics.client.put_metric_data = put_data
+        reporter = CloudWatchAsyncMetricReporter(
+            report_interval=None, retry_policy=RetryPolicy(max_attempts=5, base_delay=0.001))
+        CloudWatchAsyncMetrics.with_namespace('test_namespace').with_reporter(reporter)
+
+        async def test():
+            await CloudWatchAsyncMetrics.put_metric(MetricName='test_metric', Value=1)
+            await reporter.flush()
+
+        asyncio.get_event_loop().run_until_complete(test())
+        self.assertEqual(3, len(calls))
+
+    def test_randomized_phase(self):
+
+        reporter = CloudWatchSyncMetricReporter(report_interval=30, randomize_phase=True)
+        delays = {reporter._report_delay(True) for _ in range(20)}
+        self.assertLess(1, len(delays))
+        self.assertTrue(all(0 <= delay <= 30 for delay in delays))
+        self.assertEqual(30, reporter._report_delay(False))
+        self.assertEqual(30, CloudWatchSyncMetricReporter(report_interval=30)._report_delay(True))
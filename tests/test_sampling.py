@@ -0,0 +1,110 @@
+import asyncio
+import math
+from unittest import TestCase
+
+import boto3
+from mock import MagicMock
+
+from src.cloudwatch_metrics_client.aiocloudwatch import CloudWatchAsyncMetricReporter
+from src.cloudwatch_metrics_client.cloudwatch import CloudWatchSyncMetrics, CloudWatchSyncMetricReporter
+from src.cloudwatch_metrics_client.sampling import GeometricSampler
+
+
+class TestSampling(TestCase):
+
+    def setUp(self) -> None:
+
+        boto3.client = MagicMock()
+
+        self.reporter = CloudWatchSyncMetricReporter(report_interval=None)
+        CloudWatchSyncMetrics.with_namespace('test_namespace').with_reporter(self.reporter)
+        CloudWatchSyncMetrics.setup_client()
+
+    def seed(self, rate, seed):
+        self.reporter.sampler = GeometricSampler(rate, seed=seed)
+        self.reporter.sampling = True
+
+    def test_sampler(self):
+
+        sampler = GeometricSampler(0.1, seed=1)
+        kept = sum(sampler.sample() for _ in range(100000))
+        self.assertLess(abs(kept - 10000), 4 * math.sqrt(100000 * 0.1 * 0.9))
+        self.assertEqual(10, sampler.weight)
+
+        first = GeometricSampler(0.3, seed=7)
+        second = GeometricSampler(0.3, seed=7)
+        self.assertListEqual([first.sample() for _ in range(1000)], [second.sample() for _ in range(1000)])
+
+        everything = GeometricSampler(1)
+        self.assertTrue(all(everything.sample() for _ in range(100)))
+
+        for rate in (0, -0.5, 1.5):
+            with self.assertRaises(ValueError):
+                GeometricSampler(rate)
+
+    def test_scaled_counts_are_unbiased(self):
+
+        n, rate = 100000, 0.1
+        # Standard deviation of scaled count of n events kept with probability rate
+        sd = math.sqrt(n * (1 - rate) / rate)
+        for seed in range(5):
+            self.reporter.metrics.clear()
+            self.reporter.statistics.clear()
+            self.seed(rate, seed)
+            for i in range(n):
+                self.reporter.put_metric(MetricName='latency', Value=i % 4)
+                self.reporter.put_statistic('duration', None, 2)
+
+            counts = self.reporter.metrics['latency?'].to_repr()['Counts']
+            self.assertLess(abs(sum(counts) - n), 4 * sd)
+            stat = self.reporter.statistics['duration?'].to_repr()['StatisticValues']
+            self.assertLess(abs(stat['SampleCount'] - n), 4 * sd)
+            self.assertAlmostEqual(2 * stat['SampleCount'], stat['Sum'])
+            self.assertEqual(2, stat['Minimum'])
+            self.assertEqual(2, stat['Maximum'])
+
+    def test_sampling_rate_per_metric(self):
+
+        reporter = CloudWatchSyncMetricReporter(report_interval=None, sampling_rate=0.01)
+        reporter.set_sampling_rate('rare', None)
+        for i in range(1000):
+            reporter.put_metric(MetricName='rare', Value=1)
+        self.assertEqual([1000], reporter.metrics['rare?'].to_repr()['Counts'])
+
+        reporter.set_sampling_rate('frequent', 0.5)
+        self.assertIn(reporter.sample_weight('frequent'), (0, 2))
+        self.assertIn(reporter.sample_weight('other'), (0, 100))
+
+    def test_handles_and_monitored_tasks_are_sampled(self):
+
+        self.seed(0.25, 3)
+        handle = self.reporter.metric('handle_metric')
+        for _ in range(4000):
+            handle.add(1)
+        counts = self.reporter.metrics['handle_metric?'].to_repr()['Counts']
+        self.assertLess(abs(sum(counts) - 4000), 4 * math.sqrt(4000 * 0.75 / 0.25))
+        self.assertTrue(all(count % 4 == 0 for count in counts))
+
+        @CloudWatchSyncMetrics.monitored_task
+        def task():
+            pass
+
+        for _ in range(4000):
+            task()
+        stat = self.reporter.statistics['transaction?']
+        self.assertLess(abs(stat.sample_count - 4000), 4 * math.sqrt(4000 * 0.75 / 0.25))
+        self.assertEqual(0, stat.sample_count % 4)
+
+    def test_async_sampling(self):
+
+        reporter = CloudWatchAsyncMetricReporter(report_interval=None)
+        reporter.sampler = GeometricSampler(0.2, seed=11)
+        reporter.sampling = True
+
+        async def record():
+            for _ in range(5000):
+                await reporter.put_metric(MetricName='async_metric', Value=3)
+
+        asyncio.get_event_loop().run_until_complete(record())
+        counts = reporter.metrics['async_metric?'].to_repr()['Counts']
+        self.assertLess(abs(sum(counts) - 5000), 4 * math.sqrt(5000 * 0.8 / 0.2))
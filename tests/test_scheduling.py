@@ -0,0 +1,121 @@
+import asyncio
+import time
+from unittest import TestCase
+
+from mock import MagicMock
+
+from src.cloudwatch_metrics_client.aiocloudwatch import CloudWatchAsyncMetrics, CloudWatchAsyncMetricReporter
+from src.cloudwatch_metrics_client.batching import MetricBatcher
+from src.cloudwatch_metrics_client.cloudwatch import CloudWatchSyncMetrics, CloudWatchSyncMetricReporter
+from src.cloudwatch_metrics_client.scheduling import FlushPolicy
+
+OK = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+
+class TestFlushPolicy(TestCase):
+
+    def test_series_threshold(self):
+
+        batcher = MetricBatcher(max_datums=1000, max_bytes=30000)
+        self.assertIsNone(FlushPolicy(full_batches=False).series_threshold(batcher))
+        self.assertEqual(50, FlushPolicy(max_series=50).series_threshold(batcher))
+        # 30000 bytes of 300 bytes per series
+        self.assertEqual(100, FlushPolicy().series_threshold(batcher))
+        self.assertEqual(10, FlushPolicy(max_bytes=3000, full_batches=False).series_threshold(batcher))
+
+        policy = FlushPolicy()
+        metric_data = [{'MetricName': 'metric', 'Value': 1}] * 200
+        policy.flushed(100, metric_data)
+        # Two datums per series
+        self.assertEqual(2 * MetricBatcher.estimate_size(metric_data[0]), policy.bytes_per_series)
+        self.assertEqual(30000 // policy.bytes_per_series, policy.series_threshold(batcher))
+
+    def test_idle_delay(self):
+
+        policy = FlushPolicy(idle_backoff=2, max_idle_interval=30)
+        self.assertListEqual([2, 4, 8, 16, 30, 30], [policy.idle_delay(1) for _ in range(6)])
+        policy.flushed(1, [{'MetricName': 'metric', 'Value': 1}])
+        self.assertEqual(2, policy.idle_delay(1))
+        self.assertEqual(1, FlushPolicy(idle_backoff=1).idle_delay(1))
+
+
+class TestAdaptiveFlush(TestCase):
+
+    def setUp(self) -> None:
+
+        self.sent = []
+        CloudWatchSyncMetrics.with_namespace('test_namespace')
+        CloudWatchSyncMetrics.client = MagicMock()
+        CloudWatchSyncMetrics.client.put_metric_data = lambda **kwargs: self.sent.append(kwargs) or OK
+
+    def wait_for(self, condition, timeout=1):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_early_flush_on_burst(self):
+
+        reporter = CloudWatchSyncMetricReporter(report_interval=10, flush_policy=FlushPolicy(max_series=50))
+        reporter.run()
+        try:
+            for n in range(49):
+                reporter.put_metric(MetricName='metric_{}'.format(n), Value=n)
+            time.sleep(0.1)
+            self.assertListEqual([], self.sent)
+            reporter.put_metric(MetricName='metric_49', Value=49)
+            self.assertTrue(self.wait_for(lambda: self.sent))
+        finally:
+            reporter.stop()
+        self.assertEqual(50, len(self.sent[0]['MetricData']))
+        self.assertEqual(1, reporter.stats()['early_flushes'])
+        self.assertEqual(0, reporter.num_series)
+
+    def test_idle_backoff(self):
+
+        policy = FlushPolicy(idle_backoff=2, max_idle_interval=10)
+        reporter = CloudWatchSyncMetricReporter(report_interval=0.05, flush_policy=policy)
+        reporter.run()
+        try:
+            time.sleep(0.5)
+            # 0.05, 0.1, 0.2 then waiting 0.4 sec instead of 10 checks
+            self.assertGreaterEqual(4, policy.idle_intervals)
+            self.assertTrue(reporter.idle)
+
+            # Recording wakes the reporter up to flush after a regular interval
+            reporter.put_metric(MetricName='metric', Value=1)
+            self.assertTrue(self.wait_for(lambda: self.sent, timeout=0.3))
+            self.assertFalse(reporter.idle)
+            self.assertEqual(0, policy.idle_intervals)
+        finally:
+            reporter.stop()
+        reporter.report_task.join(1)
+        self.assertFalse(reporter.report_task.is_alive())
+
+    def test_async_early_flush(self):
+
+        sent = []
+
+        async def put_metric_data(**kwargs):
+            sent.append(kwargs)
+            return OK
+
+        CloudWatchAsyncMetrics.with_namespace('test_namespace')
+        CloudWatchAsyncMetrics.client = MagicMock()
+        CloudWatchAsyncMetrics.client.put_metric_data = put_metric_data
+        reporter = CloudWatchAsyncMetricReporter(report_interval=10, flush_policy=FlushPolicy(max_series=20))
+
+        async def test():
+            await reporter.run()
+            for n in range(20):
+                await reporter.put_statistic('stat_{}'.format(n), None, n)
+            for _ in range(100):
+                if sent:
+                    break
+                await asyncio.sleep(0.01)
+            reporter.stop()
+            await reporter.report_task
+
+        asyncio.get_event_loop().run_until_complete(test())
+        self.assertEqual(20, len(sent[0]['MetricData']))
+        self.assertTrue(reporter.report_task.done())
@@ -0,0 +1,99 @@
+import asyncio
+import datetime
+import io
+import json
+from unittest import TestCase
+
+from mock import MagicMock
+
+from src.cloudwatch_metrics_client.aiocloudwatch import CloudWatchAsyncMetrics, CloudWatchAsyncMetricReporter
+from src.cloudwatch_metrics_client.sinks import EmbeddedMetricFormatSink
+
+
+def validate_emf(test, event):
+    # Structure required by Embedded Metric Format specification
+    test.assertIsInstance(event, dict)
+    metadata = event['_aws']
+    test.assertIsInstance(metadata['Timestamp'], int)
+    test.assertLess(0, len(metadata['CloudWatchMetrics']))
+    for directive in metadata['CloudWatchMetrics']:
+        test.assertIsInstance(directive['Namespace'], str)
+        test.assertLess(0, len(directive['Namespace']))
+        test.assertIsInstance(directive['Dimensions'], list)
+        for dimension_set in directive['Dimensions']:
+            test.assertGreaterEqual(30, len(dimension_set))
+            for dimension in dimension_set:
+                test.assertIsInstance(event[dimension], str)
+        test.assertGreaterEqual(100, len(directive['Metrics']))
+        for metric in directive['Metrics']:
+            test.assertIsInstance(metric['Name'], str)
+            test.assertTrue(set(metric).issubset({'Name', 'Unit', 'StorageResolution'}))
+            value = event[metric['Name']]
+            if isinstance(value, dict):
+                test.assertTrue(set(value).issubset({'Values', 'Counts', 'Max', 'Min', 'Count', 'Sum'}))
+                test.assertGreaterEqual(100, len(value.get('Values', [])))
+                test.assertEqual(len(value.get('Values', [])), len(value.get('Counts', [])))
+            else:
+                test.assertIsInstance(value, (int, float))
+
+
+class TestEmbeddedMetricFormatSink(TestCase):
+
+    def setUp(self) -> None:
+        self.stream = io.StringIO()
+        self.sink = EmbeddedMetricFormatSink(self.stream)
+
+    def events(self):
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_to_emf(self):
+
+        timestamp = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        response = self.sink.put_metric_data(Namespace='test_namespace', MetricData=[
+            {'MetricName': 'latency', 'Timestamp': timestamp, 'Unit': 'Milliseconds',
+             'Dimensions': [{'Name': 'Host', 'Value': 'a'}], 'Values': [1, 5], 'Counts': [3, 1]},
+            {'MetricName': 'duration', 'Timestamp': timestamp,
+             'StatisticValues': {'SampleCount': 4, 'Sum': 10, 'Minimum': 1, 'Maximum': 4}},
+            {'MetricName': 'requests', 'Timestamp': timestamp, 'Value': 7, 'StorageResolution': 1},
+        ])
+        self.assertEqual(200, response['ResponseMetadata']['HTTPStatusCode'])
+
+        events = self.events()
+        self.assertEqual(3, len(events))
+        for event in events:
+            validate_emf(self, event)
+            self.assertEqual(1577836800000, event['_aws']['Timestamp'])
+            self.assertEqual('test_namespace', event['_aws']['CloudWatchMetrics'][0]['Namespace'])
+
+        self.assertEqual('a', events[0]['Host'])
+        self.assertListEqual([['Host']], events[0]['_aws']['CloudWatchMetrics'][0]['Dimensions'])
+        self.assertDictEqual({'Name': 'latency', 'Unit': 'Milliseconds'},
+                             events[0]['_aws']['CloudWatchMetrics'][0]['Metrics'][0])
+        self.assertDictEqual({'Values': [1, 5], 'Counts': [3, 1], 'Max': 5, 'Min': 1, 'Count': 4, 'Sum': 8},
+                             events[0]['latency'])
+        self.assertListEqual([[]], events[1]['_aws']['CloudWatchMetrics'][0]['Dimensions'])
+        self.assertDictEqual({'Max': 4, 'Min': 1, 'Count': 4, 'Sum': 10}, events[1]['duration'])
+        self.assertEqual(7, events[2]['requests'])
+        self.assertEqual(1, events[2]['_aws']['CloudWatchMetrics'][0]['Metrics'][0]['StorageResolution'])
+
+    def test_reporter_with_sink(self):
+
+        CloudWatchAsyncMetrics.client = MagicMock()
+
+        async def test():
+            reporter = CloudWatchAsyncMetricReporter(report_interval=None, sink=self.sink)
+            CloudWatchAsyncMetrics.with_namespace('test_namespace').with_reporter(reporter)
+            for n in range(250):
+                await CloudWatchAsyncMetrics.put_metric(MetricName='latency', Dimensions={'Host': 'a'}, Value=n)
+            await CloudWatchAsyncMetrics.put_statistic('duration', None, 3)
+            await reporter.flush()
+
+        asyncio.get_event_loop().run_until_complete(test())
+        CloudWatchAsyncMetrics.client.put_metric_data.assert_not_called()
+
+        events = self.events()
+        self.assertEqual(4, len(events))
+        for event in events:
+            validate_emf(self, event)
+        self.assertEqual(250, sum(event['latency']['Count'] for event in events[:3]))
+        self.assertEqual(3, events[3]['duration']['Sum'])
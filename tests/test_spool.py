@@ -0,0 +1,253 @@
+import asyncio
+import datetime
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from mock import MagicMock
+
+from src.cloudwatch_metrics_client.aiocloudwatch import CloudWatchAsyncMetrics, CloudWatchAsyncMetricReporter
+from src.cloudwatch_metrics_client.cloudwatch import CloudWatchSyncMetrics, CloudWatchSyncMetricReporter
+from src.cloudwatch_metrics_client.errors import is_transient_failure
+from src.cloudwatch_metrics_client.spool import MetricSpool
+
+
+def make_batch(name='test_metric', timestamp=None):
+    return [{
+        'MetricName': name,
+        'Timestamp': timestamp or datetime.datetime.now(),
+        'Values': [1.0, 2.0],
+        'Counts': [3, 1]
+    }]
+
+
+class TestMetricSpool(TestCase):
+
+    def setUp(self) -> None:
+
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+
+        self.directory.cleanup()
+
+    def test_append_peek_ack(self):
+
+        spool = MetricSpool(self.directory.name)
+        self.assertIsNone(spool.peek())
+
+        first, second = make_batch('first'), make_batch('second')
+        spool.append('test_namespace', first)
+        spool.append('test_namespace', second)
+
+        namespace, metric_data = spool.peek()
+        self.assertEqual('test_namespace', namespace)
+        self.assertEqual(first, metric_data)
+        # Not acknowledged yet, so same batch again
+        self.assertEqual(first, spool.peek()[1])
+        spool.ack()
+        self.assertEqual(second, spool.peek()[1])
+        spool.ack()
+        self.assertIsNone(spool.peek())
+        self.assertEqual(0, spool.size())
+
+    def test_replay_position_survives_restart(self):
+
+        spool = MetricSpool(self.directory.name)
+        for name in ('first', 'second', 'third'):
+            spool.append('test_namespace', make_batch(name))
+        spool.peek()
+        spool.ack()
+        spool.close()
+
+        spool = MetricSpool(self.directory.name)
+        self.assertEqual('second', spool.peek()[1][0]['MetricName'])
+        spool.ack()
+        spool.append('test_namespace', make_batch('fourth'))
+        self.assertEqual('third', spool.peek()[1][0]['MetricName'])
+        spool.ack()
+        self.assertEqual('fourth', spool.peek()[1][0]['MetricName'])
+
+    def test_max_bytes(self):
+
+        spool = MetricSpool(self.directory.name, max_bytes=2000, segment_bytes=500)
+        for n in range(50):
+            spool.append('test_namespace', make_batch('metric_{}'.format(n)))
+
+        self.assertGreaterEqual(2000 + 500, spool.size())
+        self.assertLess(0, spool.dropped_batches)
+        # Oldest batches are dropped, newest are kept
+        names = []
+        while spool.peek() is not None:
+            names.append(spool.peek()[1][0]['MetricName'])
+            spool.ack()
+        self.assertEqual('metric_49', names[-1])
+        self.assertEqual(50, len(names) + spool.dropped_batches)
+
+    def test_max_age(self):
+
+        spool = MetricSpool(self.directory.name, max_age=datetime.timedelta(hours=1))
+        spool.append('test_namespace', make_batch('old', datetime.datetime.now() - datetime.timedelta(hours=2)))
+        spool.append('test_namespace', make_batch('new'))
+
+        self.assertEqual('new', spool.peek()[1][0]['MetricName'])
+        self.assertEqual(1, spool.dropped_batches)
+
+    def test_transient_failures(self):
+
+        self.assertTrue(is_transient_failure(ConnectionError()))
+        self.assertTrue(is_transient_failure({'ResponseMetadata': {'HTTPStatusCode': 503}}))
+        self.assertTrue(is_transient_failure({
+            'Error': {'Code': 'Throttling'}, 'ResponseMetadata': {'HTTPStatusCode': 400}
+        }))
+        self.assertFalse(is_transient_failure({'ResponseMetadata': {'HTTPStatusCode': 400}}))
+
+
+class TestReporterSpool(TestCase):
+
+    def setUp(self) -> None:
+
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+
+        self.directory.cleanup()
+
+    def test_failed_batch_is_replayed(self):
+
+        self.sent = []
+        self.failed = []
+        self.throttled = True
+
+        def put_data(**kwargs):
+            if self.throttled:
+                self.failed.append(kwargs)
+                return {'Error': {'Code': 'Throttling'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+            self.sent.append(kwargs)
+            return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+        CloudWatchSyncMetrics.client = MagicMock()
+        CloudWatchSyncMetrics.client.put_metric_data = put_data
+
+        spool = MetricSpool(self.directory.name)
+        reporter = CloudWatchSyncMetricReporter(report_interval=None, spool=spool, spool_replay_rate=100)
+        CloudWatchSyncMetrics.with_namespace('test_namespace').with_reporter(reporter)
+
+        CloudWatchSyncMetrics.put_metric(MetricName='test_metric', Value=50)
+        reporter.flush()
+        self.assertEqual([], self.sent)
+        timestamp = self.failed[0]['MetricData'][0]['Timestamp']
+        self.assertLess(0, spool.size())
+
+        self.throttled = False
+        reporter.run()
+        for _ in range(50):
+            if self.sent:
+                break
+            time.sleep(0.02)
+        reporter.stop()
+
+        self.assertEqual(1, len(self.sent))
+        self.assertEqual('test_namespace', self.sent[0]['Namespace'])
+        datum = self.sent[0]['MetricData'][0]
+        self.assertEqual('test_metric', datum['MetricName'])
+        self.assertEqual(timestamp, datum['Timestamp'])
+        self.assertIsNone(spool.peek())
+
+    def test_invalid_batch_is_not_spooled(self):
+
+        CloudWatchSyncMetrics.client = MagicMock()
+        CloudWatchSyncMetrics.client.put_metric_data = MagicMock(
+            return_value={'ResponseMetadata': {'HTTPStatusCode': 400}})
+
+        spool = MetricSpool(self.directory.name)
+        reporter = CloudWatchSyncMetricReporter(report_interval=None, spool=spool)
+        CloudWatchSyncMetrics.with_namespace('test_namespace').with_reporter(reporter)
+
+        CloudWatchSyncMetrics.put_metric(MetricName='test_metric', Value=50)
+        reporter.flush()
+        self.assertIsNone(spool.peek())
+
+    def test_fork(self):
+
+        if not hasattr(os, 'fork'):
+            return
+
+        self.sent = []
+
+        def put_data(**kwargs):
+            self.sent.append(kwargs['MetricData'][0]['MetricName'])
+            return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+        CloudWatchSyncMetrics.client = MagicMock()
+        CloudWatchSyncMetrics.client.put_metric_data = put_data
+        CloudWatchSyncMetrics.with_namespace('test_namespace')
+
+        spool = MetricSpool(self.directory.name)
+        for n in range(5):
+            spool.append('test_namespace', make_batch('m{}'.format(n)))
+        reporter = CloudWatchSyncMetricReporter(report_interval=None, spool=spool, spool_replay_rate=100)
+
+        pid = os.fork()
+        if pid == 0:
+            # Spool stays with the parent, child neither replays nor appends to it
+            status = 1 if reporter.spool is not None else 0
+            reporter.run()
+            time.sleep(0.3)
+            reporter.stop()
+            os._exit(status or len(self.sent))
+
+        reporter.run()
+        for _ in range(50):
+            if len(self.sent) == 5:
+                break
+            time.sleep(0.02)
+        reporter.stop()
+        _, status = os.waitpid(pid, 0)
+
+        self.assertEqual(0, os.WEXITSTATUS(status))
+        self.assertListEqual(['m0', 'm1', 'm2', 'm3', 'm4'], self.sent)
+        self.assertIsNone(spool.peek())
+
+    def test_async_spool_off_event_loop(self):
+
+        self.throttled = True
+        sent = []
+
+        async def put_data(**kwargs):
+            if self.throttled:
+                return {'Error': {'Code': 'Throttling'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+            sent.append(kwargs)
+            return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+        CloudWatchAsyncMetrics.with_namespace('test_namespace')
+        CloudWatchAsyncMetrics.client = MagicMock()
+        CloudWatchAsyncMetrics.client.put_metric_data = put_data
+
+        spool = MetricSpool(self.directory.name)
+        threads = []
+        for method in ('append', 'peek', 'ack'):
+            def wrapper(*args, _method=getattr(spool, method)):
+                threads.append(threading.current_thread())
+                return _method(*args)
+            setattr(spool, method, wrapper)
+        reporter = CloudWatchAsyncMetricReporter(report_interval=None, spool=spool, spool_replay_rate=100)
+
+        async def test():
+            await reporter.put_metric(MetricName='test_metric', Value=1)
+            await reporter.flush()
+            self.throttled = False
+            await reporter.run()
+            for _ in range(50):
+                if sent:
+                    break
+                await asyncio.sleep(0.02)
+            reporter.stop()
+
+        asyncio.get_event_loop().run_until_complete(test())
+        self.assertEqual(1, len(sent))
+        self.assertEqual(1, reporter.stats()['spooled_batches'])
+        self.assertLess(2, len(threads))
+        self.assertNotIn(threading.main_thread(), threads)
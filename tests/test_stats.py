@@ -0,0 +1,106 @@
+import asyncio
+import time
+from unittest import TestCase
+
+from mock import MagicMock
+
+from src.cloudwatch_metrics_client.aiocloudwatch import CloudWatchAsyncMetrics, CloudWatchAsyncMetricReporter
+from src.cloudwatch_metrics_client.cloudwatch import CloudWatchSyncMetrics, CloudWatchSyncMetricReporter
+from src.cloudwatch_metrics_client.limits import CardinalityLimits
+
+OK = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+THROTTLED = {'Error': {'Code': 'Throttling'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+
+
+class TestReporterStats(TestCase):
+
+    def test_sync_stats_and_hooks(self):
+
+        CloudWatchSyncMetrics.client = MagicMock()
+        CloudWatchSyncMetrics.client.put_metric_data = MagicMock(side_effect=[OK, THROTTLED])
+        events = []
+
+        reporter = CloudWatchSyncMetricReporter(
+            report_interval=None, max_metrics_per_report=2, limits=CardinalityLimits(max_series=3),
+            on_flush_start=lambda reporter: events.append('flush'),
+            on_batch_sent=lambda namespace, batch: events.append(('sent', len(batch))),
+            on_error=lambda namespace, batch, failure: events.append(('error', failure['Error']['Code'])))
+        CloudWatchSyncMetrics.with_namespace('test_namespace').with_reporter(reporter)
+        for n in range(4):
+            CloudWatchSyncMetrics.put_metric(MetricName='test_metric', Dimensions={'N': str(n)}, Value=n)
+        self.assertEqual(3, reporter.stats()['series'])
+
+        reporter.flush()
+
+        stats = reporter.stats()
+        self.assertEqual(1, stats['flushes'])
+        self.assertEqual(1, stats['batches_sent'])
+        self.assertEqual(1, stats['batches_failed'])
+        self.assertEqual(2, stats['datums_sent'])
+        self.assertEqual(3, stats['last_flush_series'])
+        self.assertEqual(0, stats['series'])
+        self.assertEqual(1, stats['overflows']['series'])
+        self.assertLessEqual(stats['lock_wait_seconds'], stats['flush_seconds'])
+        self.assertEqual(['flush', ('sent', 2), ('error', 'Throttling')], events)
+
+    def test_lock_wait_excludes_client_setup(self):
+
+        client = MagicMock()
+        client.put_metric_data = MagicMock(return_value=OK)
+
+        def slow_client():
+            time.sleep(0.2)
+            return client
+
+        reporter = CloudWatchSyncMetricReporter(report_interval=None)
+        reporter._client = slow_client
+        reporter.put_metric(MetricName='test_metric', Value=1)
+        reporter.flush()
+
+        stats = reporter.stats()
+        self.assertLess(0.2, stats['flush_seconds'])
+        self.assertGreater(0.1, stats['lock_wait_seconds'])
+
+    def test_failing_hook_is_ignored(self):
+
+        CloudWatchSyncMetrics.client = MagicMock()
+        CloudWatchSyncMetrics.client.put_metric_data = MagicMock(return_value=OK)
+
+        def hook(*args):
+            raise RuntimeError('hook failed')
+
+        reporter = CloudWatchSyncMetricReporter(report_interval=None, on_flush_start=hook, on_batch_sent=hook)
+        CloudWatchSyncMetrics.with_namespace('test_namespace').with_reporter(reporter)
+        CloudWatchSyncMetrics.put_metric(MetricName='test_metric', Value=1)
+        reporter.flush()
+        self.assertEqual(1, reporter.stats()['batches_sent'])
+
+    def test_stats_reported_as_metrics(self):
+
+        requests = []
+
+        async def put_data(**kwargs):
+            requests.append(kwargs)
+            return OK
+
+        CloudWatchAsyncMetrics.client = MagicMock()
+        CloudWatchAsyncMetrics.client.put_metric_data = put_data
+        reporter = CloudWatchAsyncMetricReporter(report_interval=None, stats_namespace='test_stats')
+        CloudWatchAsyncMetrics.with_namespace('test_namespace').with_reporter(reporter)
+
+        async def test():
+            await CloudWatchAsyncMetrics.put_metric(MetricName='test_metric', Value=1)
+            await reporter.flush()
+            await reporter.flush()
+
+        asyncio.get_event_loop().run_until_complete(test())
+
+        self.assertEqual(['test_namespace', 'test_stats', 'test_stats'], [request['Namespace'] for request in requests])
+        first = {datum['MetricName']: datum['Value'] for datum in requests[1]['MetricData']}
+        second = {datum['MetricName']: datum['Value'] for datum in requests[2]['MetricData']}
+        self.assertEqual(1, first['BatchesSent'])
+        self.assertEqual(1, first['Series'])
+        # Increments since previous report
+        self.assertEqual(0, second['BatchesSent'])
+        self.assertEqual(1, second['Flushes'])
+        self.assertEqual([{'Name': 'Namespace', 'Value': 'test_namespace'}], requests[1]['MetricData'][0]['Dimensions'])
@@ -0,0 +1,64 @@
+import datetime
+from unittest import TestCase
+
+from mock import MagicMock, patch
+
+from src.cloudwatch_metrics_client.cloudwatch import CloudWatchSyncMetrics, CloudWatchSyncMetricReporter
+
+
+class TestTimeWindows(TestCase):
+
+    def setUp(self) -> None:
+
+        self.sent = []
+
+        def put_data(**kwargs):
+            self.sent.extend(kwargs['MetricData'])
+            return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+        CloudWatchSyncMetrics.client = MagicMock()
+        CloudWatchSyncMetrics.client.put_metric_data = put_data
+
+    def report(self, reporter, samples):
+        CloudWatchSyncMetrics.with_namespace('test_namespace').with_reporter(reporter)
+        for now, value in samples:
+            with patch('time.time', return_value=now):
+                CloudWatchSyncMetrics.put_metric(MetricName='test_metric', Value=value)
+                CloudWatchSyncMetrics.put_statistic('test_statistic', None, value)
+        reporter.flush()
+
+    def test_samples_bucketed_into_windows(self):
+
+        reporter = CloudWatchSyncMetricReporter(report_interval=None, time_window=10)
+        start = 1600000000
+        self.report(reporter, [(start + 1, 1), (start + 9, 2), (start + 10, 3), (start + 35, 4)])
+
+        metrics = [datum for datum in self.sent if datum['MetricName'] == 'test_metric']
+        self.assertEqual(3, len(metrics))
+        self.assertEqual([datetime.datetime.fromtimestamp(start + offset) for offset in (0, 10, 30)],
+                         [datum['Timestamp'] for datum in metrics])
+        self.assertEqual([[1, 2], [3], [4]], [datum['Values'] for datum in metrics])
+        self.assertTrue(all(datum['StorageResolution'] == 1 for datum in self.sent))
+
+        statistics = [datum['StatisticValues'] for datum in self.sent if datum['MetricName'] == 'test_statistic']
+        self.assertEqual([2, 1, 1], [statistic['SampleCount'] for statistic in statistics])
+        self.assertEqual(3, statistics[0]['Sum'])
+
+    def test_standard_resolution_windows(self):
+
+        reporter = CloudWatchSyncMetricReporter(report_interval=None, time_window=60, thread_local_buffers=True)
+        start = 1600000020
+        self.report(reporter, [(start, 1), (start + 60, 2)])
+
+        self.assertEqual(4, len(self.sent))
+        self.assertTrue(all('StorageResolution' not in datum for datum in self.sent))
+
+    def test_explicit_timestamp(self):
+
+        reporter = CloudWatchSyncMetricReporter(report_interval=None, time_window=1)
+        CloudWatchSyncMetrics.with_namespace('test_namespace').with_reporter(reporter)
+        timestamp = datetime.datetime(2020, 1, 1, 12, 0, 0, 500000)
+        CloudWatchSyncMetrics.put_metric(MetricName='test_metric', Value=1, Timestamp=timestamp)
+        reporter.flush()
+
+        self.assertEqual(datetime.datetime(2020, 1, 1, 12, 0, 0), self.sent[0]['Timestamp'])